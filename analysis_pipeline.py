@@ -0,0 +1,170 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+
+import analyze
+from lazyimport import lazy_import, ensure_loaded
+
+pd = lazy_import('pandas')
+
+# Colors for the terminal
+GREEN = '\033[92m'
+YELLOW = '\033[93m'
+RED = '\033[91m'
+NC = '\033[0m'
+
+# The minimum number of seconds between two writes of the partial results of a run folder
+PARTIAL_WRITE_INTERVAL = 30
+
+
+class AnalysisPipeline:
+    '''
+    Categorizes the output of each (tool, profile) job in a background worker process as soon as the job finishes,
+    while the other scans are still running.
+
+    The categorized issues of each run folder are merged as results come in: only the rows of the new job are
+    hashed and compared with the rows merged so far, so a job costs the same however many jobs finished before it.
+    The merged issues are written to {provider}_categorized_issues.partial.csv at most every PARTIAL_WRITE_INTERVAL
+    seconds, so the partial results can be followed live. When the last scan has finished, only the remaining jobs
+    have to be waited for before the final report is written.
+
+    Only jobs that succeeded are categorized. The output of a job that failed, timed out or was skipped may be
+    partial or left over from an earlier attempt, so it is left out of the report and listed by skipped_jobs().
+    '''
+    def __init__(self, max_workers=None):
+        # Spawned workers don't inherit the threads and open files of the scan jobs
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        self.lock = threading.Lock()
+        self.job_finished = threading.Condition(self.lock)
+        self.pending = {}
+        # Per run folder and category, the merged parts and the hashes of their rows
+        self.merged = {}
+        self.skipped = {}
+        self.last_write = {}
+        self.finished = set()
+        # Writes the partial results outside self.lock, one run folder at a time
+        self.write_lock = threading.Lock()
+        # The results are merged in the executor's callback thread
+        ensure_loaded(pd)
+
+    def submit(self, output_dir, provider, tool, profile, state='succeeded'):
+        '''
+        Schedules the categorization of a finished job.
+
+        Args:
+            output_dir (str): The run folder of the provider.
+            provider (str): The cloud provider name.
+            tool (str): The tool name, e.g. 'Prowler'.
+            profile (str): The profile the tool ran for.
+            state (str, optional): The final state of the job, see supervisor.JobStates. Jobs that didn't succeed are
+                not categorized. Defaults to 'succeeded'.
+        '''
+        if tool not in analyze.TOOL_ANALYZERS:
+            return
+        if state != 'succeeded':
+            with self.lock:
+                self.pending.setdefault((output_dir, provider), set())
+                self.skipped.setdefault((output_dir, provider), []).append((tool, profile, state))
+            print(f'{YELLOW}Not analyzing {tool} for profile {profile}, the job did not succeed ({state}){NC}')
+            return
+        future = self.executor.submit(analyze.categorize_tool_output, os.path.join(output_dir, profile), provider, tool)
+        with self.lock:
+            self.pending.setdefault((output_dir, provider), set()).add(future)
+        future.add_done_callback(lambda future: self._job_done(future, output_dir, provider, tool, profile))
+
+    def _job_done(self, future, output_dir, provider, tool, profile):
+        try:
+            mapped_checks = future.result()
+        except concurrent.futures.CancelledError:
+            mapped_checks = {}
+        except Exception as e:
+            print(f'{RED}Analysis of {tool} for profile {profile} failed: {e}{NC}')
+            mapped_checks = {}
+
+        key = (output_dir, provider)
+        # Hash the rows before taking the lock, only the comparison with the merged rows needs it
+        hashed = {category: pd.util.hash_pandas_object(df, index=False).to_numpy() for category, df in mapped_checks.items() if len(df)}
+        with self.lock:
+            merged = self.merged.setdefault(key, {})
+            for category, hashes in hashed.items():
+                parts, seen = merged.setdefault(category, ([], set()))
+                new_rows = []
+                for position, row_hash in enumerate(hashes):
+                    if row_hash not in seen:
+                        seen.add(row_hash)
+                        new_rows.append(position)
+                if new_rows:
+                    parts.append(mapped_checks[category].iloc[new_rows])
+            issues = sum(len(seen) for _, seen in merged.values())
+            categories = len(merged)
+            self.pending[key].discard(future)
+            self.job_finished.notify_all()
+            write = time.monotonic() - self.last_write.get(key, float('-inf')) >= PARTIAL_WRITE_INTERVAL
+            if write:
+                self.last_write[key] = time.monotonic()
+                snapshot = {category: list(parts) for category, (parts, _) in merged.items()}
+        if write:
+            self._write_partial(output_dir, provider, snapshot)
+        print(f'{GREEN}Analyzed {tool} for profile {profile}: {issues} issues in {categories} categories so far{NC}')
+
+    @staticmethod
+    def _combine(category_parts):
+        '''Combines the merged parts of every category into one DataFrame per category.'''
+        return {category: pd.concat(parts, ignore_index=True) for category, parts in category_parts.items() if parts}
+
+    def _write_partial(self, output_dir, provider, category_parts):
+        '''Writes the partial results of a run folder, unless another write is busy or the run folder is finished.'''
+        if not self.write_lock.acquire(blocking=False):
+            return
+        try:
+            if (output_dir, provider) in self.finished:
+                return
+            analyze.combine_categories(self._combine(category_parts)).to_csv(
+                os.path.join(output_dir, f'{provider}_categorized_issues.partial.csv'), index=False)
+        except OSError as e:
+            print(f'{RED}Could not write the partial results: {e}{NC}')
+        finally:
+            self.write_lock.release()
+
+    def has_results(self, output_dir, provider):
+        '''Returns whether any job of the run folder was submitted, including jobs that were not categorized.'''
+        with self.lock:
+            return (output_dir, provider) in self.pending
+
+    def skipped_jobs(self, output_dir, provider):
+        '''Returns the tool, profile and state of the submitted jobs of a run folder that were not categorized.'''
+        with self.lock:
+            return list(self.skipped.get((output_dir, provider), []))
+
+    def wait(self, output_dir, provider):
+        '''
+        Waits for the submitted jobs of a run folder and returns their merged categorized issues.
+
+        Args:
+            output_dir (str): The run folder of the provider.
+            provider (str): The cloud provider name.
+
+        Returns:
+            dict: A dictionary mapping categories to DataFrames of issues.
+        '''
+        # The results are stored by the done callbacks, which run after the futures themselves are done
+        with self.lock:
+            self.job_finished.wait_for(lambda: not self.pending.get((output_dir, provider)))
+            category_parts = {category: list(parts) for category, (parts, _) in self.merged.get((output_dir, provider), {}).items()}
+        # Wait for a partial write that is still busy, and don't write any after the final report
+        with self.write_lock:
+            self.finished.add((output_dir, provider))
+            partial_file = os.path.join(output_dir, f'{provider}_categorized_issues.partial.csv')
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+        return self._combine(category_parts)
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
@@ -3,14 +3,29 @@
 # This software is released under the MIT License.
 # https://opensource.org/licenses/MIT
 
-import pandas as pd
+import argparse
+import collections.abc
+import concurrent.futures
+import contextlib
+import io
 import json
-import glob
-from prettytable import PrettyTable
-from termcolor import colored
 import os
 import re
+import shutil
+import tempfile
+import threading
 import selectionmenu
+import output_index
+import summary_cube
+import html_report
+import run_catalog
+from lazyimport import lazy_import, ensure_loaded
+
+# Heavy dependencies are loaded on first use, so importing this module stays fast
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+prettytable = lazy_import('prettytable')
+termcolor = lazy_import('termcolor')
 
 # Colors for the terminal
 GREEN = '\033[92m'
@@ -20,6 +35,42 @@ RED = '\033[91m'
 BOLD = '\033[1m'
 NC = '\033[0m'
 
+# The Monkey365 export formats the analysis reads, so runs only export what is actually used
+MONKEY365_EXPORT_FORMATS = ['JSON']
+
+# The categories of Monkey365 findings whose check ID is not in checks_mappings.txt, by keywords in the check ID and
+# title, or else in the service name. The first matching category is used.
+MONKEY365_CATEGORY_KEYWORDS = [
+    ('DNS specific issues', r'dns'),
+    ('Insecure or insufficient authentication', r'mfa|multi.?factor|password|legacy auth\w*|conditional access|sign.?in risk|security defaults'),
+    ('Insufficient audit logging', r'log|logging|logs|audit\w*|diagnostic\w*'),
+    ('Insufficient monitoring of suspicious activities', r'alert\w*|defender|security center|sentinel|threat\w*|monitor\w*'),
+    ('Insufficient monitoring of vulnerabilities in the infrastructure', r'vulnerabilit\w*|assessment\w*'),
+    ('Insecure transmission or storage of data', r'tls|ssl|https|encrypt\w*|in transit|secure transfer|customer.?managed|cmk'),
+    ('Missing security updates', r'update\w*|patch\w*|outdated|latest version'),
+    ('Network access from untrusted networks', r'public\w*|firewall|network\w*|nsg|internet|rdp|ssh|anonymous|private endpoint\w*'),
+    ('Insufficient availability of data and infrastructure', r'backup\w*|soft.?delete|purge protection|redundan\w*|geo.?replicat\w*|lock\w*'),
+    ('Insecure storage of secrets', r'secret\w*|key vault|keyvault|certificate\w*|expir\w*|rotat\w*'),
+    ('Accounts with unnecessary roles or permissions', r'role\w*|owner\w*|admin\w*|guest\w*|permission\w*|privilege\w*|rbac|consent'),
+    ('Missing or insufficient authentication or authorization', r'access|authori[sz]\w*|shared key|sas|entra|active directory|azure ad|aad'),
+    ('Insecure transmission or storage of data', r'storage|sql|database|cosmos'),
+]
+_monkey365_category_patterns = None
+
+# The Prowler columns that can be loaded from both the CSV and the OCSF output
+PROWLER_COLUMNS = ['CHECK_ID', 'STATUS', 'SEVERITY', 'SERVICE_NAME', 'RESOURCE_UID', 'REGION', 'ACCOUNT_UID', 'COMPLIANCE']
+
+# The estimated cost of parsing a byte of Prowler OCSF JSON, relative to a byte of Prowler CSV. This is a rough
+# estimate, not a benchmark result: the OCSF records are decoded one by one with the json module, which is
+# somewhat slower per byte than the C parser of pandas for the CSV output.
+OCSF_PARSE_COST = 1.3
+
+# The number of rows shown of tables that are too large to print in full
+PREVIEW_ROWS = 25
+
+# The maximum number of rows of an Excel sheet, including the header
+EXCEL_MAX_ROWS = 1048576
+
 
 
 def print_dict_structure(d, indent=0, max_depth=2):
@@ -41,7 +92,7 @@ def print_dict_structure(d, indent=0, max_depth=2):
 
 def print_summary_table(summary, tool='Prowler', platform='AWS'):
     # Create a table with headers
-    table = PrettyTable(['Service', 'Resources', 'Rules', 'Flagged Items', 'Unknown status', 'Checked Items', 'Severity'])
+    table = prettytable.PrettyTable(['Service', 'Resources', 'Rules', 'Flagged Items', 'Unknown status', 'Checked Items', 'Severity'])
 
     # Add rows to the table
     for service, info in summary.items():
@@ -59,43 +110,330 @@ def print_summary_table(summary, tool='Prowler', platform='AWS'):
 
 def print_scoutsuite_table_old(summary):
     # Create a table with headers
-    table = PrettyTable(['Service', 'Resources', 'Rules', 'Flagged Items', 'Checked Items'])
+    table = prettytable.PrettyTable(['Service', 'Resources', 'Rules', 'Flagged Items', 'Checked Items'])
 
     # Add rows to the table
     for service, info in summary.items():
         if info['checked_items'] > 0:
             color = 'green' if info['max_level'] == 'info' or info['flagged_items'] == 0 else 'yellow' if info['max_level'] == 'warning' else 'red'
-            flagged_items = colored(info['flagged_items'], color)
-            service = colored(service, color)
+            flagged_items = termcolor.colored(info['flagged_items'], color)
+            service = termcolor.colored(service, color)
             table.add_row([service, info['resources_count'], info['rules_count'], flagged_items, info['checked_items']])
 
     print(f'\n\nScoutSuite Summary, color legend: {GREEN}No issues{NC} - {YELLOW}Warning{NC} - {RED}Danger{NC}')
     print(table)
 
 
-def load_csv_files_to_dataframe(directory):
-    # Dictionary to hold dataframes
-    dataframes = {}
-    
-    # Find all CSV files within the directory structure
-    csv_files = glob.glob(f'{directory}/**/*.csv', recursive=True)
-    
-    for file_path in csv_files:
-        # Extract a meaningful key from the file path (e.g., the file name without extension)
-        key = os.path.splitext(os.path.basename(file_path))[0]
-        
-        # Load the CSV file into a DataFrame
-        df = pd.read_csv(file_path)
-        
-        # Store the DataFrame in the dictionary
-        dataframes[key] = df
-    
-    return dataframes
+class LazyCSVTables(collections.abc.Mapping):
+    """
+    A read-only mapping of table names to CSV files that loads each table into a DataFrame on first access.
+
+    Looking up the names and sizes of the tables doesn't read any file. Tables that are needed anyway can be
+    loaded together in a thread pool with preload(), and preview() reads only the first rows of a table.
+    """
+    def __init__(self, files):
+        self.files = files
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        with self._lock:
+            if key in self._tables:
+                return self._tables[key]
+        df = pd.read_csv(self.files[key])
+        with self._lock:
+            return self._tables.setdefault(key, df)
+
+    def __iter__(self):
+        return iter(self.files)
+
+    def __len__(self):
+        return len(self.files)
+
+    def preload(self, keys=None, max_workers=8):
+        """Loads the given tables (default: all) in parallel, so later lookups don't have to wait."""
+        keys = [key for key in (self.files if keys is None else keys) if key not in self._tables]
+        if len(keys) > 1:
+            ensure_loaded(pd)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(keys))) as executor:
+                list(executor.map(self.__getitem__, keys))
+
+    def preview(self, key, rows=PREVIEW_ROWS, columns=None):
+        """Reads only the first rows (and optionally only some columns) of a table."""
+        with self._lock:
+            if key in self._tables:
+                df = self._tables[key]
+                return (df[columns] if columns else df).head(rows)
+        return pd.read_csv(self.files[key], nrows=rows, usecols=columns)
+
+    def row_count(self, key):
+        """Returns the number of rows of a table, counting lines instead of parsing the file if it isn't loaded."""
+        with self._lock:
+            if key in self._tables:
+                return len(self._tables[key])
+        lines = 0
+        last_byte = b'\n'
+        with open(self.files[key], 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                lines += chunk.count(b'\n')
+                last_byte = chunk[-1:]
+        # Don't count the header, but do count a last line without line break
+        return max(lines - 1 + (last_byte != b'\n'), 0)
+
+
+def load_csv_files_to_dataframe(files_by_profile):
+    """
+    Collects CSV files into a lazy mapping of DataFrames keyed by their file name.
+
+    Args:
+        files_by_profile (dict): A dictionary mapping profiles to lists of CSV file paths, as returned by
+            output_index.find_artifacts_by_profile().
+
+    Returns:
+        LazyCSVTables: A mapping of DataFrames that are loaded on first access. Keys are prefixed with the profile
+            if more than one profile is loaded, and with the parent folder if a file name occurs more than once.
+    """
+    files = {}
+
+    for profile, csv_files in files_by_profile.items():
+        for file_path in csv_files:
+            # Extract a meaningful key from the file path (e.g., the file name without extension)
+            key = os.path.splitext(os.path.basename(file_path))[0]
+            if len(files_by_profile) > 1:
+                key = f'{profile}:{key}'
+            if key in files:
+                key = f'{os.path.basename(os.path.dirname(file_path))}/{key}'
+            files[key] = file_path
+
+    return LazyCSVTables(files)
+
+
+def load_prowler_ocsf(ocsf_file, columns=None):
+    """
+    Loads the findings of a Prowler OCSF JSON file into the columns of the Prowler CSV output.
+
+    The file is decoded incrementally with the json module, one finding at a time, so only the selected columns
+    are kept in memory. No faster third-party parser is used, because those decode whole documents at once,
+    which would load the complete file into memory. Status, severity, service and region become categorical
+    columns, the compliance requirements are formatted like in the CSV output.
+
+    Args:
+        ocsf_file (str): The path to the .ocsf.json file.
+        columns (list[str], optional): The columns to return, e.g. ['CHECK_ID', 'STATUS']. Defaults to all of
+            CHECK_ID, STATUS, SEVERITY, SERVICE_NAME, RESOURCE_UID, REGION, ACCOUNT_UID and COMPLIANCE.
+
+    Returns:
+        pandas.DataFrame: The findings.
+    """
+    columns = columns or PROWLER_COLUMNS
+    data = {column: [] for column in columns}
+    extractors = {
+        'CHECK_ID': lambda record, resource: record.get('metadata', {}).get('event_code', ''),
+        'STATUS': lambda record, resource: record.get('status_code', ''),
+        'SEVERITY': lambda record, resource: str(record.get('severity', '')).lower(),
+        'SERVICE_NAME': lambda record, resource: resource.get('group', {}).get('name', ''),
+        'RESOURCE_UID': lambda record, resource: resource.get('uid', ''),
+        'REGION': lambda record, resource: resource.get('region', ''),
+        'ACCOUNT_UID': lambda record, resource: record.get('cloud', {}).get('account', {}).get('uid', ''),
+        'COMPLIANCE': lambda record, resource: ' | '.join(f"{framework}: {', '.join(map(str, requirements))}"
+                                                          for framework, requirements in (record.get('unmapped', {}).get('compliance') or {}).items()),
+    }
+    selected = [(column, extractors[column]) for column in columns]
+    for record in iter_json_records(ocsf_file):
+        resources = record.get('resources') or [{}]
+        resource = resources[0] if isinstance(resources[0], dict) else {}
+        for column, extractor in selected:
+            data[column].append(extractor(record, resource))
+
+    df = pd.DataFrame(data, columns=columns)
+    for column in ['STATUS', 'SEVERITY', 'SERVICE_NAME', 'REGION']:
+        if column in df:
+            df[column] = df[column].astype('category')
+    return df
+
+
+def find_prowler_outputs(output_path, profile=None, prefer='auto'):
+    """
+    Finds the Prowler output of every scan, picking the CSV or the OCSF JSON file of each scan.
+
+    Prowler writes both formats with the same base name. With prefer='auto', the file that is estimated to be
+    cheaper to parse is used, estimated from the file sizes and the relative parse cost per byte (OCSF_PARSE_COST).
+    Usually that is the CSV, as the OCSF file is several times larger, but scans that only wrote OCSF output
+    (e.g. with --output-formats json-ocsf) are analyzed as well.
+
+    Args:
+        output_path (str): The path to the output folder.
+        profile (str, optional): Only return the output of this profile. Defaults to None (all profiles).
+        prefer (str, optional): 'auto', 'csv' or 'ocsf'. Defaults to 'auto'.
+
+    Returns:
+        list[tuple]: (format, path) tuples, with format 'csv' or 'ocsf'.
+    """
+    scans = {}
+    for artifact, suffix in [('csv', '.csv'), ('ocsf', '.ocsf.json')]:
+        for file_path in output_index.find_artifacts(output_path, 'prowler', artifact, profile):
+            scans.setdefault(file_path[:-len(suffix)], {})[artifact] = file_path
+
+    outputs = []
+    for files in scans.values():
+        if len(files) == 1 or prefer in files:
+            artifact = prefer if prefer in files else next(iter(files))
+        else:
+            artifact = 'ocsf' if os.path.getsize(files['ocsf']) * OCSF_PARSE_COST < os.path.getsize(files['csv']) else 'csv'
+        outputs.append((artifact, files[artifact]))
+    return sorted(outputs, key=lambda output: output[1])
+
+
+def load_prowler_findings(output_path, columns=None, profile=None, prefer='auto'):
+    """
+    Loads the Prowler findings of an output folder from the CSV or OCSF output, whichever is cheaper per scan.
+
+    Args:
+        output_path (str): The path to the output folder.
+        columns (list[str], optional): The columns to load, in the names of the CSV output. Defaults to all.
+        profile (str, optional): Only load the findings of this profile. Defaults to None (all profiles).
+        prefer (str, optional): 'auto', 'csv' or 'ocsf', see find_prowler_outputs(). Defaults to 'auto'.
+
+    Returns:
+        pandas.DataFrame: The findings, or None if there is no Prowler output.
+    """
+    frames = []
+    for artifact, file_path in find_prowler_outputs(output_path, profile, prefer):
+        if artifact == 'ocsf':
+            frames.append(load_prowler_ocsf(file_path, columns))
+        else:
+            frames.append(pd.read_csv(file_path, sep=';', usecols=columns))
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_scoutsuite_results(js_file):
+    """
+    Loads a ScoutSuite results file, which is JSON prefixed with a JavaScript assignment.
+
+    Args:
+        js_file (str): The path to the scoutsuite_results_*.js file.
+
+    Returns:
+        dict: The parsed ScoutSuite results.
+    """
+    with open(js_file, 'r') as f:
+        data = f.read()
+
+    # Remove the assignment part ('scoutsuite_results =') from the data
+    json_data = data.replace('scoutsuite_results =', '').strip()
+
+    # Parse the JSON data
+    return json.loads(json_data)
+
+
+def iter_json_records(json_file, chunk_size=1 << 20):
+    """
+    Yields the records of a JSON file one by one, without loading the whole file into memory.
+
+    The file can contain a JSON array, a single object, or newline-delimited JSON objects. The file is read in
+    chunks and decoded incrementally, so memory use depends on the size of a single record.
+
+    Args:
+        json_file (str): The path to the JSON file.
+        chunk_size (int, optional): The number of characters read at a time. Defaults to 1 MiB.
+
+    Yields:
+        The decoded records.
+    """
+    decoder = json.JSONDecoder()
+    with open(json_file, 'r', encoding='utf-8-sig') as f:
+        buffer = ''
+        position = 0
+        eof = False
+        in_array = None
+        while True:
+            # Skip whitespace and the separators between records
+            while position < len(buffer) and (buffer[position].isspace() or (in_array and buffer[position] == ',')):
+                position += 1
+            if position == len(buffer):
+                if eof:
+                    return
+                buffer, position = f.read(chunk_size), 0
+                eof = len(buffer) < chunk_size
+                continue
+
+            if in_array is None:
+                in_array = buffer[position] == '['
+                position += in_array
+                continue
+            if in_array and buffer[position] == ']':
+                return
+
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+                # A number at the end of the chunk may continue in the next chunk
+                if end == len(buffer) and not eof:
+                    raise json.JSONDecodeError('Record may continue in the next chunk', buffer, end)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # The record continues in the next chunk
+                more = f.read(chunk_size)
+                eof = len(more) < chunk_size
+                buffer, position = buffer[position:] + more, 0
+                continue
+            yield record
+            position = end
+
+
+def _lookup(record, *paths):
+    """Returns the first non-empty value of the dotted paths in a record, matching keys case-insensitively."""
+    for path in paths:
+        value = record
+        for key in path.split('.'):
+            if not isinstance(value, dict):
+                value = None
+                break
+            value = next((item for name, item in value.items() if name.lower() == key.lower()), None)
+        if value not in (None, '', [], {}):
+            return value
+    return None
+
+
+def iter_monkey365_findings(output_path, profile=None):
+    """
+    Streams the findings of the Monkey365 JSON exports in an output folder.
+
+    Args:
+        output_path (str): The path to the output folder.
+        profile (str, optional): Only read the exports of this profile. Defaults to None (all profiles).
+
+    Yields:
+        dict: A finding with the profile, check_id, title, service, status, severity and resource_uid. Findings that
+            concern multiple resources are yielded once per resource.
+    """
+    for file_profile, json_files in output_index.find_artifacts_by_profile(output_path, 'monkey365', 'json').items():
+        if profile is not None and file_profile != profile:
+            continue
+        for json_file in json_files:
+            for record in iter_json_records(json_file):
+                if not isinstance(record, dict):
+                    continue
+                finding = {
+                    'profile': file_profile,
+                    'check_id': _lookup(record, 'findingInfo.uid', 'metadata.eventCode', 'idSuffix', 'checkId', 'id') or '',
+                    'title': _lookup(record, 'findingInfo.title', 'displayName', 'title') or '',
+                    'service': _lookup(record, 'serviceName', 'serviceType', 'service') or '',
+                    'status': str(_lookup(record, 'statusCode', 'status.status', 'status') or '').upper(),
+                    'severity': str(_lookup(record, 'severity', 'level') or '').capitalize(),
+                }
+                resources = _lookup(record, 'resources', 'resource') or [{}]
+                for resource in resources if isinstance(resources, list) else [resources]:
+                    if isinstance(resource, dict):
+                        resource = _lookup(resource, 'id', 'uid', 'name', 'resourceId') or ''
+                    yield {**finding, 'resource_uid': str(resource)}
 
 
 def print_summary_table(summary, tool='Prowler', platform='AWS'):
     # Create a table with headers
-    table = PrettyTable(['Service', 'Resources', 'Rules', 'Flagged Items', 'Unknown status', 'Checked Items', 'Severity'])
+    table = prettytable.PrettyTable(['Service', 'Resources', 'Rules', 'Flagged Items', 'Unknown status', 'Checked Items', 'Severity'])
 
     # Add rows to the table
     for service, info in summary.items():
@@ -111,7 +449,14 @@ def print_summary_table(summary, tool='Prowler', platform='AWS'):
     print(table)
 
 
-def print_dataframe_pretty(df, title, snip_limit=0, cloudfox_permissions=False):
+def get_snip_limit(title, snip_limit=0, cloudfox_permissions=False):
+    """Returns the number of rows print_dataframe_pretty() shows of a table: at most 25 for CloudFox permissions tables."""
+    if title.startswith('CloudFox - aws:') and title.endswith('permissions') and not cloudfox_permissions:
+        return PREVIEW_ROWS if (snip_limit == 0 or not snip_limit) else min(snip_limit, PREVIEW_ROWS)
+    return snip_limit
+
+
+def print_dataframe_pretty(df, title, snip_limit=0, cloudfox_permissions=False, total_rows=None):
     """
     Prints a pandas DataFrame in a pretty table format with optional row limiting.
 
@@ -125,18 +470,18 @@ def print_dataframe_pretty(df, title, snip_limit=0, cloudfox_permissions=False):
     - snip_limit (int, optional): The maximum number of rows to display. Defaults to 0, which shows all rows.
     - cloudfox_permissions (bool, optional): If True and the table is a CloudFox permissions table, display all rows.
       Otherwise, limit to 25 rows. Defaults to False.
+    - total_rows (int, optional): The number of rows of the full table, if df is only a preview of it. Defaults to None.
 
     Returns:
     - None
     """
 
     # Adjust snip_limit for CloudFox permissions tables if cloudfox_permissions is False
-    if title == 'CloudFox - aws:permissions' and not cloudfox_permissions:
-        snip_limit = 25 if (snip_limit == 0 or not snip_limit) else min(snip_limit, 25)
+    snip_limit = get_snip_limit(title, snip_limit, cloudfox_permissions)
 
     # Check if snip_limit is set and greater than 0
     if snip_limit is not None and snip_limit > 0:
-        num_entries = len(df)
+        num_entries = max(len(df), total_rows or 0)
         if num_entries > snip_limit:
             # Slice the DataFrame to the first snip_limit rows
             df = df.head(snip_limit)
@@ -148,9 +493,9 @@ def print_dataframe_pretty(df, title, snip_limit=0, cloudfox_permissions=False):
         num_entries = len(df)
     
     # Extract DataFrame columns and use them as table headers
-    table = PrettyTable(df.columns.tolist())
+    table = prettytable.PrettyTable(df.columns.tolist())
     table.min_width = 15  # Set a minimum width for the table
-    table.max_table_width = os.get_terminal_size().columns # Set the table width to the terminal width
+    table.max_table_width = shutil.get_terminal_size().columns # Set the table width to the terminal width
     table.align = 'l'  # Align the text to the left
     
     # Add rows to the table
@@ -217,34 +562,103 @@ def extract_cloudsploit_azure_check_details():
     return check_details
 
 
-def combine_and_save_csv_files(csv_files, combined_dir, delimiter):
+class RowDeduplicator:
+    """
+    Remembers the 64-bit hashes of the rows seen so far, to drop duplicate rows while streaming.
+
+    The hashes are kept in memory as a sorted array until they exceed the memory budget. Then they are spilled
+    to a sorted file on disk, which is searched through a memory map, so memory use stays bounded.
+    """
+    def __init__(self, spill_dir, memory_budget=64 << 20):
+        self.spill_dir = spill_dir
+        self.max_hashes = max(memory_budget // 8, 1)
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.spilled = []
+
+    def _seen(self, hashes):
+        seen = np.isin(hashes, self.hashes)
+        for spilled in self.spilled:
+            positions = np.searchsorted(spilled, hashes)
+            seen |= spilled[np.minimum(positions, len(spilled) - 1)] == hashes
+        return seen
+
+    def new_rows(self, chunk):
+        """Returns a boolean mask of the rows of a DataFrame chunk that were not seen before, and remembers them."""
+        hashes = pd.util.hash_pandas_object(chunk, index=False).to_numpy()
+        # Keep the first occurrence within the chunk, then drop the rows of earlier chunks
+        mask = np.zeros(len(hashes), dtype=bool)
+        mask[np.unique(hashes, return_index=True)[1]] = True
+        mask &= ~self._seen(hashes)
+
+        self.hashes = np.union1d(self.hashes, hashes[mask])
+        if len(self.hashes) > self.max_hashes:
+            spill_file = os.path.join(self.spill_dir, f'hashes_{len(self.spilled)}.npy')
+            np.save(spill_file, self.hashes)
+            self.spilled.append(np.load(spill_file, mmap_mode='r'))
+            self.hashes = np.empty(0, dtype=np.uint64)
+        return mask
+
+
+def combine_and_save_csv_files(csv_files, combined_dir, delimiter, chunk_size=100000, memory_budget=64 << 20):
     """
     Combines CSV files listed in the csv_files dictionary into single files in the combined_dir directory.
+
+    The files are streamed in chunks and duplicate rows are dropped by their hash, so memory use depends on the
+    chunk size and memory budget instead of the size of the files. The combined file has the union of the columns
+    of all files.
+
     csv_files: Dictionary with relative path as keys and list of file paths to combine as values.
     combined_dir: Directory where combined CSV files will be saved.
     delimiter: Delimiter used for reading and writing CSV files.
+    chunk_size: Number of rows read at a time.
+    memory_budget: Bytes of row hashes kept in memory before they are spilled to disk.
     """
     for csv_rel_path, file_paths in csv_files.items():
-        # print(f'Combining {csv_rel_path} with filepaths {file_paths}...')
         combined_file_path = os.path.join(combined_dir, csv_rel_path)
-        combined_file_dir = os.path.dirname(combined_file_path)
-        if not os.path.exists(combined_file_dir):
-            os.makedirs(combined_file_dir)
-        
-        combined_df = pd.concat([pd.read_csv(f, delimiter=delimiter) for f in file_paths]).drop_duplicates()
-        combined_df.to_csv(combined_file_path, sep=delimiter, index=False)
+        os.makedirs(os.path.dirname(combined_file_path), exist_ok=True)
+
+        # The combined file has the columns of all files, in the order they first appear
+        file_paths = [file_path for file_path in file_paths if os.path.getsize(file_path) > 0]
+        columns = list(dict.fromkeys(column for file_path in file_paths
+                                     for column in pd.read_csv(file_path, delimiter=delimiter, nrows=0).columns))
+        with tempfile.TemporaryDirectory() as spill_dir, open(combined_file_path, 'w', newline='') as combined_file:
+            deduplicator = RowDeduplicator(spill_dir, memory_budget)
+            for file_path in file_paths:
+                # Read everything as text, so values are written back exactly as they were
+                for chunk in pd.read_csv(file_path, delimiter=delimiter, chunksize=chunk_size, dtype=str, keep_default_na=False):
+                    # Columns missing from this file are left empty
+                    chunk = chunk.reindex(columns=columns, fill_value='')
+                    chunk[deduplicator.new_rows(chunk)].to_csv(combined_file, sep=delimiter, index=False, header=combined_file.tell() == 0)
+
+
+def combine_and_save_json_files(json_files, combined_dir, ndjson=False):
+    """
+    Combines the findings of JSON files (e.g. Prowler OCSF output) into a single file in combined_dir.
 
+    The findings are streamed from the input files to the output file one by one, without keeping them in memory.
 
-def combine_and_save_json_files(json_files, combined_dir):
-    combined_data = []
-    for json_file in json_files:
-        with open(json_file, 'r') as f:
-            data = json.load(f)
-            combined_data.extend(data)
-    
-    combined_file_path = os.path.join(combined_dir, 'combined_data.ocsf.json')
+    json_files: List of JSON files, each containing an array of findings.
+    combined_dir: Directory where the combined file will be saved.
+    ndjson: Write newline-delimited JSON (combined_data.ocsf.ndjson) instead of a JSON array (combined_data.ocsf.json).
+
+    Returns the path of the combined file.
+    """
+    os.makedirs(combined_dir, exist_ok=True)
+    combined_file_path = os.path.join(combined_dir, 'combined_data.ocsf.ndjson' if ndjson else 'combined_data.ocsf.json')
     with open(combined_file_path, 'w') as f:
-        json.dump(combined_data, f, indent=4)
+        if not ndjson:
+            f.write('[')
+        first = True
+        for json_file in json_files:
+            for record in iter_json_records(json_file):
+                if ndjson:
+                    f.write(json.dumps(record) + '\n')
+                else:
+                    f.write(('\n' if first else ',\n') + json.dumps(record))
+                first = False
+        if not ndjson:
+            f.write('\n]\n')
+    return combined_file_path
 
 
 # Function that combines the findings from multiple ScoutSuite JSON files. Not used anymore, as combining profiles is done in a different way.
@@ -253,18 +667,13 @@ def debug_combine_scoutsuite_findings(output_path='output', provider='aws', prof
     severity_mapping = {'unknown': 0, 'info': 1, 'warning': 2, 'danger': 3}
 
     # Find all .js files in the output_path directory
-    js_files = glob.glob(f'{output_path}/{profile}/scoutsuite/scoutsuite-results/scoutsuite_results_*.js')
+    js_files = output_index.find_artifacts(output_path, 'scoutsuite', 'results', profile)
     if not js_files:
         print("No JS files found in the output directory.")
         return combined_summary
 
     for js_file in js_files:
-        with open(js_file, 'r') as f:
-            data = f.read()
-        # Remove the assignment part ('scoutsuite_results =') from the data
-        json_data = data.replace('scoutsuite_results =', '').strip()
-        # Parse the JSON data
-        parsed_data = json.loads(json_data)
+        parsed_data = load_scoutsuite_results(js_file)
 
         for service, info in parsed_data['last_run']['summary'].items():
             if service in combined_summary:
@@ -286,60 +695,81 @@ def debug_combine_scoutsuite_findings(output_path='output', provider='aws', prof
 
     return combined_summary
 
-def combine_profiles(output_path='output', provider='aws'):
-    combined_dir = f'{output_path}/combined_profiles/'
-    if not os.path.exists(combined_dir):
-        os.makedirs(combined_dir)
-    profiles = [f.name for f in os.scandir(output_path) if f.is_dir()]
-    combined__category_dfs = {}
-    for profile in profiles:
-        if profile == 'combined_profiles':
-            continue
-        mapped_checks = categorize_all_tools_issues(os.path.join(output_path, profile), provider, print_categories=False)
-        for category, df in mapped_checks.items():
-            if category not in combined__category_dfs:
-                combined__category_dfs[category] = df
-            else:
-                combined__category_dfs[category] = pd.concat([combined__category_dfs[category], df], ignore_index=True).drop_duplicates()
+def categorize_profile_quietly(profile_path, provider, profile_index=None, export=True):
+    '''
+    Categorizes the issues of a single profile without printing anything. Used as worker by combine_profiles().
 
+    Args:
+        profile_path (str): The path to the profile folder.
+        provider (str): The cloud provider name.
+        profile_index (dict, optional): The output index of the profile folder, so the worker doesn't walk it again. Defaults to None.
+        export (bool, optional): Whether to export the categorized issues of the profile. Defaults to True.
 
-    # Define severity order for sorting
-    severity_order = {'Low': 1, 'Warning': 2, 'Medium': 3, 'Danger': 4, 'High': 5, 'Critical': 6}
+    Returns:
+        dict: A dictionary containing the categorized issues.
+    '''
+    if profile_index is not None:
+        output_index.set_output_index(profile_path, profile_index)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return categorize_all_tools_issues(profile_path, provider, print_categories=False, export=export)
 
-    for name, df in combined__category_dfs.items():
-        # Rank severity and sort dataframes based on severity
-        df['severity_rank'] = df['severity'].map(severity_order).fillna(0)
-        df.sort_values('severity_rank', inplace=True, ascending=False)
-        df.drop('severity_rank', axis=1, inplace=True)
-        
-        # Print dataframe in a pretty format
-        print_dataframe_pretty(df, name)
-        
 
-    big_df = pd.DataFrame()
-    for name, df in combined__category_dfs.items():
-        # Add 'category' column with the name of the category
-        df['category'] = name
-        # Append the modified DataFrame to the big DataFrame
-        big_df = pd.concat([big_df, df], ignore_index=True)
+def combine_profiles(output_path='output', provider='aws', max_workers=None, export_profiles=True):
+    '''
+    Categorizes the issues of all profiles in a run folder and combines them into a single report.
 
-    # Sort the big DataFrame if needed, first by category and then by severity
-    big_df.sort_values(by=['category', 'severity'], inplace=True)
+    The profiles are analyzed in parallel worker processes, the results are merged once afterwards.
 
-    # Define the base name for output files
-    output_base = f'{combined_dir}/{provider}_categorized_issues'
+    Args:
+        output_path (str, optional): The path to the run folder. Defaults to 'output'.
+        provider (str, optional): The cloud provider name. Defaults to 'aws'.
+        max_workers (int, optional): The number of worker processes. Defaults to None, which uses the number of CPUs.
+            With 1 the profiles are analyzed one after another in the current process.
+        export_profiles (bool, optional): Whether to also export the categorized issues of every profile. Defaults to True.
+    '''
+    combined_dir = f'{output_path}/combined_profiles/'
+    if not os.path.exists(combined_dir):
+        os.makedirs(combined_dir)
+    profiles = output_index.list_profiles(output_path)
+    profile_paths = {profile: os.path.join(output_path, profile) for profile in profiles}
+    profile_indexes = {profile: output_index.get_output_index(path) for profile, path in profile_paths.items()}
+
+    results = {}
+    if max_workers == 1 or len(profiles) <= 1:
+        for profile in profiles:
+            print(f'{GREEN}Analyzing profile {profile}...{NC}')
+            results[profile] = categorize_profile_quietly(profile_paths[profile], provider, export=export_profiles)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(categorize_profile_quietly, profile_paths[profile], provider, profile_indexes[profile], export_profiles): profile for profile in profiles}
+            for future in concurrent.futures.as_completed(futures):
+                profile = futures[future]
+                try:
+                    results[profile] = future.result()
+                    print(f'{GREEN}Analyzed profile {profile} ({len(results)}/{len(profiles)}){NC}')
+                except Exception as e:
+                    print(f'{RED}Error analyzing profile {profile}: {e}{NC}')
+
+    # Merge the categorized issues of all profiles, in profile order
+    category_parts = {}
+    for profile in profiles:
+        for category, df in results.get(profile, {}).items():
+            category_parts.setdefault(category, []).append(df)
+    combined__category_dfs = {category: pd.concat(dfs, ignore_index=True).drop_duplicates() for category, dfs in category_parts.items()}
 
-    # Export the big DataFrame to .xlsx, .csv, and .txt formats
-    big_df.to_excel(f'{output_base}.xlsx', index=False)
-    big_df.to_csv(f'{output_base}.csv', index=False)
+    sort_categorized_issues(combined__category_dfs)
+    export_categorized_issues(combined__category_dfs, combined_dir, provider)
 
-    # For .txt output, simulate the pretty print format
-    with open(f'{output_base}.txt', 'w') as txt_file:
-        txt_file.write(big_df.to_string(index=False))  # Simplified version of pretty print
+    # Combine the Prowler output of all profiles into one org-wide output, streamed in bounded memory
+    prowler_csv_files = output_index.find_artifacts(output_path, 'prowler', 'csv')
+    if len(profiles) > 1 and prowler_csv_files:
+        combine_and_save_csv_files({'prowler/prowler-output-combined.csv': prowler_csv_files}, combined_dir, ';')
+    prowler_ocsf_files = output_index.find_artifacts(output_path, 'prowler', 'ocsf')
+    if len(profiles) > 1 and prowler_ocsf_files:
+        combine_and_save_json_files(prowler_ocsf_files, os.path.join(combined_dir, 'prowler'))
 
-        
 
-def summarize_prowler(output_path='output', provider='aws', print_summary=True):
+def summarize_prowler(output_path='output', provider='aws', print_summary=True, use_cube=True):
     '''
     Analyzes the Prowler output files and prints a summary table.
 
@@ -347,20 +777,25 @@ def summarize_prowler(output_path='output', provider='aws', print_summary=True):
         output_path (str, optional): The path to the directory containing the Prowler output files. Defaults to 'output'.
         provider (str, optional): The cloud provider name. Defaults to 'aws'.
         print_summary (bool, optional): Whether to print the summary table. Defaults to True.
+        use_cube (bool, optional): Whether to take the summary from the aggregate cube if it is up to date. Defaults to True.
 
     Returns:
         summary (dict): A dictionary containing the summary information.
     '''
-    # Find the .csv file in the output_path directory
-    csv_files = glob.glob(f'{output_path}/prowler/prowler-output-*.csv')
-
-    if not csv_files:
-        print(f'{RED}{BOLD}No CSV file found in the output directory, skipping summary for Prowler!!{NC}')
+    # Answer from the aggregate cube if it is up to date, instead of reading the raw output
+    summary = summary_cube.get_summary(output_path, provider, 'Prowler') if use_cube else None
+    if summary is not None:
+        if print_summary:
+            print_summary_table(summary, 'Prowler', provider)
+        return summary
+
+    # Read the CSV or OCSF output of all scans
+    df = load_prowler_findings(output_path, ['SERVICE_NAME', 'STATUS', 'SEVERITY', 'RESOURCE_UID', 'CHECK_ID'])
+
+    if df is None:
+        print(f'{RED}{BOLD}No CSV or OCSF file found in the output directory, skipping summary for Prowler!!{NC}')
         return
 
-    # Read the first .csv file found
-    df = pd.read_csv(csv_files[0], sep=';')
-
     # Create a summary object
     severity_mapping = {'low': 1, 'medium': 2, 'high': 3}
     summary = {}
@@ -368,7 +803,7 @@ def summarize_prowler(output_path='output', provider='aws', print_summary=True):
     for service in services:
         service_df = df[df['SERVICE_NAME'] == service]
         failed_items_df = service_df[service_df['STATUS'] == 'FAIL']
-        max_severity = failed_items_df['SEVERITY'].map(severity_mapping).max() if not failed_items_df.empty else 0
+        max_severity = failed_items_df['SEVERITY'].astype(str).map(severity_mapping).max() if not failed_items_df.empty else 0
         summary[service] = {
             'checked_items': len(service_df),
             'flagged_items': len(failed_items_df),
@@ -385,7 +820,7 @@ def summarize_prowler(output_path='output', provider='aws', print_summary=True):
 
 
 
-def summarize_scoutsuite(output_path='output', provider='aws', print_summary=True):
+def summarize_scoutsuite(output_path='output', provider='aws', print_summary=True, use_cube=True):
     '''
     Analyzes the ScoutSuite results and prints a summary table.
 
@@ -393,46 +828,51 @@ def summarize_scoutsuite(output_path='output', provider='aws', print_summary=Tru
         output_path (str): The path to the output directory where ScoutSuite results are stored.
         provider (str): The cloud provider for which the analysis is performed.
         print_summary (bool, optional): Whether to print the summary table. Defaults to True.
+        use_cube (bool, optional): Whether to take the summary from the aggregate cube if it is up to date. Defaults to True.
 
     Returns:
         summary (dict): A dictionary containing the summary information.
     '''
-    # Find the .js file in the output_path directory
-    js_files = glob.glob(f'{output_path}/scoutsuite/scoutsuite-results/scoutsuite_results_*.js')
+    # Answer from the aggregate cube if it is up to date, instead of reading the raw output
+    summary = summary_cube.get_summary(output_path, provider, 'ScoutSuite') if use_cube else None
+    if summary is not None:
+        if print_summary:
+            print_summary_table(summary, 'ScoutSuite', provider)
+        return summary
+
+    # Find the .js files in the output_path directory
+    js_files = output_index.find_artifacts(output_path, 'scoutsuite', 'results')
 
     if not js_files:
         print(f'{RED}{BOLD}No JS file found in the output directory, skipping summary for ScoutSuite!!{NC}')
         return
 
-    # Read the first .js file found
-    with open(js_files[0], 'r') as f:
-        data = f.read()
-
-    # Remove the assignment part ('scoutsuite_results =') from the data
-    json_data = data.replace('scoutsuite_results =', '').strip()
-
-    # Parse the JSON data
-    parsed_data = json.loads(json_data)
-
-    # Create a summary object
+    # Create a summary object, adding up the results of all .js files found
     severity_mapping = {'unknown': 0, 'info': 1, 'warning': 2, 'danger': 3}
     summary = {}
-    for service, info in parsed_data['last_run']['summary'].items():
-        summary[service] = {
-            'checked_items': info.get('checked_items', 0),
-            'flagged_items': info.get('flagged_items', 0),
-            'max_level': severity_mapping.get(info.get('max_level', 'unknown'), 0),
-            'unknown_status': 0, # TODO: check if scoutsuite indeed doesn't report failed checks
-            'resources_count': info.get('resources_count', 0),
-            'rules_count': info.get('rules_count', 0),
-        }
+    for js_file in js_files:
+        parsed_data = load_scoutsuite_results(js_file)
+        for service, info in parsed_data['last_run']['summary'].items():
+            service_summary = summary.setdefault(service, {
+                'checked_items': 0,
+                'flagged_items': 0,
+                'max_level': 0,
+                'unknown_status': 0, # TODO: check if scoutsuite indeed doesn't report failed checks
+                'resources_count': 0,
+                'rules_count': 0,
+            })
+            service_summary['checked_items'] += info.get('checked_items', 0)
+            service_summary['flagged_items'] += info.get('flagged_items', 0)
+            service_summary['max_level'] = max(service_summary['max_level'], severity_mapping.get(info.get('max_level', 'unknown'), 0))
+            service_summary['resources_count'] += info.get('resources_count', 0)
+            service_summary['rules_count'] += info.get('rules_count', 0)
     # Print the summary as a table
     if print_summary:
         print_summary_table(summary, 'ScoutSuite', provider)
     return summary
 
 
-def summarize_cloudsploit(output_path='output', provider='aws', print_summary=True):
+def summarize_cloudsploit(output_path='output', provider='aws', print_summary=True, use_cube=True):
     '''
     Analyzes the CloudSploit output file and prints a summary table.
 
@@ -440,19 +880,27 @@ def summarize_cloudsploit(output_path='output', provider='aws', print_summary=Tr
         output_path (str, optional): The path to the output directory. Defaults to 'output'.
         provider (str, optional): The cloud provider. Defaults to 'aws'.
         print_summary (bool, optional): Whether to print the summary table. Defaults to True.
+        use_cube (bool, optional): Whether to take the summary from the aggregate cube if it is up to date. Defaults to True.
 
     Returns:
         summary (dict): A dictionary containing the summary information.
     '''
-    # Find the .csv file in the output_path directory
-    csv_files = glob.glob(f'{output_path}/cloudsploit/cloudsploit-output.csv')
+    # Answer from the aggregate cube if it is up to date, instead of reading the raw output
+    summary = summary_cube.get_summary(output_path, provider, 'CloudSploit') if use_cube else None
+    if summary is not None:
+        if print_summary:
+            print_summary_table(summary, 'CloudSploit', provider)
+        return summary
+
+    # Find the .csv files in the output_path directory
+    csv_files = output_index.find_artifacts(output_path, 'cloudsploit', 'csv')
 
     if not csv_files:
         print(f'{RED}{BOLD}No CSV file found in the output directory, skipping summary for CloudSploit!!{NC}')
         return
     
-    # Read the first .csv file found
-    df = pd.read_csv(csv_files[0], sep=',')
+    # Read all .csv files found
+    df = pd.concat([pd.read_csv(f, sep=',') for f in csv_files], ignore_index=True)
 
     # Create a summary object
     summary = {}
@@ -487,24 +935,44 @@ def summarize_cloudfox(output_path='output', provider='aws', print_summary=True)
     Returns:
     - dict: A dictionary of pandas DataFrames keyed by the CSV file names, representing the analyzed CloudFox output.
     '''
-    dataframes = load_csv_files_to_dataframe(f'{output_path}/cloudfox/cloudfox-output')
+    dataframes = load_csv_files_to_dataframe(output_index.find_artifacts_by_profile(output_path, 'cloudfox', 'csv'))
     if not dataframes:
         print(f'{RED}{BOLD}No CSV files found in the output directory, skipping summary for CloudFox!!{NC}')
         return
-    # Print all the dataframes using the new pretty print function
+    # Print all the dataframes using the new pretty print function. Tables that are shown in full are loaded in
+    # parallel, of the snipped tables (like the huge permissions table) only the shown rows are read.
     if print_summary:
-        for key, df in dataframes.items():
-            print_dataframe_pretty(df, f'CloudFox - {provider}:' + key)
+        snip_limits = {key: get_snip_limit(f'CloudFox - {provider}:' + key) for key in dataframes}
+        dataframes.preload([key for key, snip_limit in snip_limits.items() if not snip_limit])
+        for key in dataframes:
+            title = f'CloudFox - {provider}:' + key
+            if snip_limits[key]:
+                print_dataframe_pretty(dataframes.preview(key, snip_limits[key]), title, total_rows=dataframes.row_count(key))
+            else:
+                print_dataframe_pretty(dataframes[key], title)
     return dataframes
 
 
 def summarize_monkey365(output_path='monkey-reports', provider='azure', print_summary=True):
     '''
     Analyze Monkey365 output and print the results in a pretty table format.
+
+    The findings are streamed from the JSON exports. Outputs of older runs that only contain CSV exports are
+    loaded from the CSV files instead.
     '''
-    dataframes = load_csv_files_to_dataframe(f'{output_path}/monkey365/')
+    dataframes = {}
+    for profile in output_index.list_profiles(output_path, 'monkey365'):
+        findings = pd.DataFrame(iter_monkey365_findings(output_path, profile))
+        if findings.empty:
+            continue
+        summary = findings.groupby(['check_id', 'title', 'severity', 'status']).size().reset_index(name='resources')
+        dataframes[profile] = summary.sort_values(['status', 'resources'], ascending=[True, False], ignore_index=True)
+
+    if not dataframes:
+        dataframes = load_csv_files_to_dataframe(output_index.find_artifacts_by_profile(output_path, 'monkey365', 'csv'))
+        dataframes.preload()
     if not dataframes:
-        print(f'{RED}{BOLD}No CSV files found in the output directory, skipping summary for Monkey365!!{NC}')
+        print(f'{RED}{BOLD}No JSON or CSV files found in the output directory, skipping summary for Monkey365!!{NC}')
         return
     # Print all the dataframes using the new pretty print function
     if print_summary:
@@ -584,14 +1052,11 @@ def analyze_prowler(output_path, provider, checks_to_categories, category_dfs={}
         dict: A dictionary containing the categorized failed checks.
 
     """
-    # Find the .csv file in the output_path directory
-    csv_files = glob.glob(f'{output_path}/prowler/prowler-output-*.csv')
-    if not csv_files:
-        print(f'{YELLOW}{BOLD}No CSV file found in the output directory, skipping analysis for Prowler!!{NC}')
+    # Read the CSV or OCSF output of all scans
+    df = load_prowler_findings(output_path, ['SERVICE_NAME', 'STATUS', 'SEVERITY', 'RESOURCE_UID', 'CHECK_ID'])
+    if df is None:
+        print(f'{YELLOW}{BOLD}No CSV or OCSF file found in the output directory, skipping analysis for Prowler!!{NC}')
         return category_dfs
-
-    # Read the first .csv file found
-    df = pd.read_csv(csv_files[0], sep=';')
     print(f'{GREEN}Analyzing Prowler output...{NC}')
     print(f'{GREEN}Total checks: {len(df)}{NC}')
     print(f'{GREEN}Total categories: {len(df["SERVICE_NAME"].unique())}{NC}')
@@ -649,45 +1114,38 @@ def analyze_scoutsuite(output_path, provider, checks_to_categories, category_dfs
         dict: A dictionary containing the categorized failed checks.
 
     """
-    # Find the .js file in the output_path directory
-    js_files = glob.glob(f'{output_path}/scoutsuite/scoutsuite-results/scoutsuite_results_*.js')
+    # Find the .js files in the output_path directory
+    js_files = output_index.find_artifacts(output_path, 'scoutsuite', 'results')
     if not js_files:
         print(f'{YELLOW}{BOLD}No JS file found in the output directory, skipping analysis for ScoutSuite!!{NC}')
         return category_dfs
 
-    # Read the first .js file found
-    with open(js_files[0], 'r') as f:
-        data = f.read()
-
-    # Remove the assignment part ('scoutsuite_results =') from the data
-    json_data = data.replace('scoutsuite_results =', '').strip()
-
-    # Parse the JSON data
-    parsed_data = json.loads(json_data)
-
-    print(f'{GREEN}Analyzing ScoutSuite output...{NC}')
-    print(f'{GREEN}Total categories: {len(parsed_data["last_run"]["summary"])}{NC}')
-    print(f'{GREEN}Total resources: {sum([info.get("resources_count", 0) for info in parsed_data["last_run"]["summary"].values()])}{NC}')
-    print(f'{GREEN}Total rules: {sum([info.get("rules_count", 0) for info in parsed_data["last_run"]["summary"].values()])}{NC}')
-    print(f'{GREEN}Total flagged items: {sum([info.get("flagged_items", 0) for info in parsed_data["last_run"]["summary"].values()])}{NC}')
-    print(f'{GREEN}Total unknown status: {sum([info.get("unknown_status", 0) for info in parsed_data["last_run"]["summary"].values()])}{NC}')
-    print(f'{GREEN}Total checked items: {sum([info.get("checked_items", 0) for info in parsed_data["last_run"]["summary"].values()])}{NC}')
-
     category_data = {}
 
-    # for all failed checks, create a df for each category with the check_id, resource_uid, severity, and tool (=ScoutSuite)
-    for service, info in parsed_data['services'].items():
-        for finding, finding_info in info['findings'].items():
-            if 'flagged_items' in finding_info and finding_info['flagged_items'] > 0:
-                category = checks_to_categories.get(finding, 'Uncategorized issues')
-                category_data.setdefault(category, [])
-                for item in finding_info.get('items', []):
-                    category_data[category].append({
-                        'check_id': finding,
-                        'resource_uid': item,
-                        'severity': finding_info.get('level', ''),
-                        'tool': 'ScoutSuite'
-                    })
+    for js_file in js_files:
+        parsed_data = load_scoutsuite_results(js_file)
+
+        print(f'{GREEN}Analyzing ScoutSuite output...{NC}')
+        print(f'{GREEN}Total categories: {len(parsed_data["last_run"]["summary"])}{NC}')
+        print(f'{GREEN}Total resources: {sum([info.get("resources_count", 0) for info in parsed_data["last_run"]["summary"].values()])}{NC}')
+        print(f'{GREEN}Total rules: {sum([info.get("rules_count", 0) for info in parsed_data["last_run"]["summary"].values()])}{NC}')
+        print(f'{GREEN}Total flagged items: {sum([info.get("flagged_items", 0) for info in parsed_data["last_run"]["summary"].values()])}{NC}')
+        print(f'{GREEN}Total unknown status: {sum([info.get("unknown_status", 0) for info in parsed_data["last_run"]["summary"].values()])}{NC}')
+        print(f'{GREEN}Total checked items: {sum([info.get("checked_items", 0) for info in parsed_data["last_run"]["summary"].values()])}{NC}')
+
+        # for all failed checks, create a df for each category with the check_id, resource_uid, severity, and tool (=ScoutSuite)
+        for service, info in parsed_data['services'].items():
+            for finding, finding_info in info['findings'].items():
+                if 'flagged_items' in finding_info and finding_info['flagged_items'] > 0:
+                    category = checks_to_categories.get(finding, 'Uncategorized issues')
+                    category_data.setdefault(category, [])
+                    for item in finding_info.get('items', []):
+                        category_data[category].append({
+                            'check_id': finding,
+                            'resource_uid': item,
+                            'severity': finding_info.get('level', ''),
+                            'tool': 'ScoutSuite'
+                        })
 
     # Create new category DataFrames
     new_category_dfs = {category: pd.DataFrame(data) for category, data in category_data.items()}
@@ -723,14 +1181,14 @@ def analyze_cloudsploit(output_path, provider, checks_to_categories, category_df
         dict: A dictionary containing the categorized failed checks.
 
     """
-    # Find the .csv file in the output_path directory
-    csv_files = glob.glob(f'{output_path}/cloudsploit/cloudsploit-output.csv')
+    # Find the .csv files in the output_path directory
+    csv_files = output_index.find_artifacts(output_path, 'cloudsploit', 'csv')
     if not csv_files:
         print(f'{YELLOW}{BOLD}No CSV file found in the output directory, skipping analysis for CloudSploit!!{NC}')
         return category_dfs
 
-    # Read the first .csv file found
-    df = pd.read_csv(csv_files[0], sep=',')
+    # Read all .csv files found
+    df = pd.concat([pd.read_csv(f, sep=',') for f in csv_files], ignore_index=True)
 
     print(f'{GREEN}Analyzing CloudSploit output...{NC}')
     print(f'{GREEN}Total categories: {len(df["category"].unique())}{NC}')
@@ -776,27 +1234,134 @@ def analyze_cloudsploit(output_path, provider, checks_to_categories, category_df
 
 
 
-def categorize_all_tools_issues(output_path, provider, print_categories=True):
+def monkey365_category(finding, checks_to_categories):
     """
-    Categorizes issues from different tools and exports the categorized data to various formats.
+    Returns the category of a Monkey365 finding.
+
+    Check IDs that are mapped in checks_mappings.txt use that category. Other findings are categorized by the
+    keywords of MONKEY365_CATEGORY_KEYWORDS in their check ID and title, or else in their service name.
 
     Args:
-        output_path (str): The path where the output files will be saved.
-        provider (str): The name of the cloud provider.
-        print_categories (bool, optional): Whether to print the categorized dataframes. Defaults to True.
+        finding (dict): A finding from iter_monkey365_findings().
+        checks_to_categories (dict): A dictionary mapping check IDs to categories.
 
     Returns:
-        dict: A dictionary containing the categorized issues.
+        str: The category, 'Uncategorized issues' if no keyword matches.
+    """
+    global _monkey365_category_patterns
+    category = checks_to_categories.get(finding['check_id'])
+    if category and category != 'Uncategorized issues':
+        return category
+    if _monkey365_category_patterns is None:
+        _monkey365_category_patterns = [(category, re.compile(rf'\b(?:{keywords})\b')) for category, keywords in MONKEY365_CATEGORY_KEYWORDS]
+    for text in (f"{finding['check_id']} {finding['title']}", finding['service']):
+        # Check IDs are snake_case, the keywords match whole words
+        text = text.replace('_', ' ').replace('-', ' ').lower()
+        for category, pattern in _monkey365_category_patterns:
+            if pattern.search(text):
+                return category
+    return 'Uncategorized issues'
+
+
+def analyze_monkey365(output_path, provider, checks_to_categories, category_dfs={}):
+    """
+    Analyzes the Monkey365 output from the specified output path and categorizes the failed checks.
+
+    The findings are streamed from the JSON exports, only the failed ones are kept in memory.
+
+    Args:
+        output_path (str): The path to the directory containing the Monkey365 output files.
+        provider (str): The cloud provider name.
+        checks_to_categories (dict): A dictionary mapping check IDs to categories, see monkey365_category().
+        category_dfs (dict, optional): A dictionary of existing category DataFrames. Defaults to an empty dictionary.
+
+    Returns:
+        dict: A dictionary containing the categorized failed checks.
+
+    """
+    if not output_index.find_artifacts(output_path, 'monkey365', 'json'):
+        print(f'{YELLOW}{BOLD}No JSON file found in the output directory, skipping analysis for Monkey365!!{NC}')
+        return category_dfs
+
+    category_data = {}
+    status_counts = {}
+    rules = set()
+
+    # for all failed checks, create a df for each category with the check_id, resource_uid, severity, and tool (=Monkey365)
+    for finding in iter_monkey365_findings(output_path):
+        status_counts[finding['status']] = status_counts.get(finding['status'], 0) + 1
+        rules.add(finding['check_id'])
+        if finding['status'] != 'FAIL':
+            continue
+        category = monkey365_category(finding, checks_to_categories)
+        category_data.setdefault(category, [])
+        category_data[category].append({
+            'check_id': finding['check_id'],
+            'resource_uid': finding['resource_uid'],
+            'severity': finding['severity'],
+            'tool': 'Monkey365'
+        })
+
+    print(f'{GREEN}Analyzing Monkey365 output...{NC}')
+    print(f'{GREEN}Total rules: {len(rules)}{NC}')
+    print(f'{GREEN}Total flagged items: {status_counts.get("FAIL", 0)}{NC}')
+    print(f'{GREEN}Total unknown status: {status_counts.get("MANUAL", 0)}{NC}')
+    print(f'{GREEN}Total checked items: {sum(status_counts.values())}{NC}')
+
+    # Create new category DataFrames
+    new_category_dfs = {category: pd.DataFrame(data).drop_duplicates() for category, data in category_data.items()}
+
+    # Concatenate with existing category DataFrames
+    if category_dfs is not None:
+        for category, df in new_category_dfs.items():
+            if category in category_dfs:
+                category_dfs[category] = pd.concat([category_dfs[category], df]).drop_duplicates()
+            else:
+                category_dfs[category] = df
+
+    return category_dfs
+
+
+# The analyze functions that categorize the issues found by each tool
+TOOL_ANALYZERS = {
+    'Prowler': analyze_prowler,
+    'ScoutSuite': analyze_scoutsuite,
+    'CloudSploit': analyze_cloudsploit,
+    'Monkey365': analyze_monkey365,
+}
+
+
+def categorize_tool_output(profile_path, provider, tool):
+    '''
+    Categorizes the issues found by a single tool in a single profile folder without printing anything.
+    Used by the analysis pipeline as soon as the tool has finished for the profile.
+
+    Args:
+        profile_path (str): The path to the profile folder.
+        provider (str): The cloud provider name.
+        tool (str): The tool name, e.g. 'Prowler'.
+
+    Returns:
+        dict: A dictionary mapping categories to DataFrames of issues. Empty for tools without categorization.
+    '''
+    analyzer = TOOL_ANALYZERS.get(tool)
+    if analyzer is None:
+        return {}
+    # Other tools of the profile may have written output since the folder was last indexed
+    output_index.get_output_index(profile_path, refresh=True)
+    _, checks_to_categories = parse_checks()
+    with contextlib.redirect_stdout(io.StringIO()):
+        return analyzer(profile_path, provider, checks_to_categories, {})
+
+
+def sort_categorized_issues(mapped_checks, print_categories=True):
+    """
+    Sorts the categorized issues by severity, highest first, and optionally prints them.
+
+    Args:
+        mapped_checks (dict): A dictionary mapping categories to DataFrames of issues. Sorted in place.
+        print_categories (bool, optional): Whether to print the categorized dataframes. Defaults to True.
     """
-    # Parse checks and map them to categories
-    checks_dict, checks_to_categories = parse_checks()
-    mapped_checks = {}
-    
-    # Analyze output from different tools and categorize issues
-    mapped_checks = analyze_prowler(output_path, provider, checks_to_categories, mapped_checks)
-    mapped_checks = analyze_scoutsuite(output_path, provider, checks_to_categories, mapped_checks)
-    mapped_checks = analyze_cloudsploit(output_path, provider, checks_to_categories, mapped_checks)
-    
     # Define severity order for sorting
     severity_order = {'Low': 1, 'Warning': 2, 'Medium': 3, 'Danger': 4, 'High': 5, 'Critical': 6}
 
@@ -809,78 +1374,246 @@ def categorize_all_tools_issues(output_path, provider, print_categories=True):
         # Print dataframe in a pretty format
         if print_categories:
             print_dataframe_pretty(df, name)
-        
-    # Initialize an empty DataFrame to hold all categories
-    big_df = pd.DataFrame()
 
-    for name, df in mapped_checks.items():
-        # Add 'category' column with the name of the category
-        df['category'] = name
-        # Append the modified DataFrame to the big DataFrame
-        big_df = pd.concat([big_df, df], ignore_index=True)
 
-    # Sort the big DataFrame if needed, first by category and then by severity
-    big_df.sort_values(by=['category', 'severity'], inplace=True)
+def combine_categories(mapped_checks):
+    """
+    Combines the categorized issues into a single DataFrame with a 'category' column, sorted by category and severity.
+
+    Args:
+        mapped_checks (dict): A dictionary mapping categories to DataFrames of issues.
+
+    Returns:
+        pandas.DataFrame: The combined issues.
+    """
+    frames = [df.assign(category=name) for name, df in mapped_checks.items()]
+    if not frames:
+        return pd.DataFrame(columns=['check_id', 'resource_uid', 'severity', 'tool', 'category'])
+    big_df = pd.concat(frames, ignore_index=True)
+
+    # Sort the big DataFrame, first by category and then by severity
+    return big_df.sort_values(by=['category', 'severity'])
+
+
+def export_categorized_issues(mapped_checks, output_path, provider):
+    """
+    Exports the categorized issues to {provider}_categorized_issues.xlsx, .csv, .txt and .html in the output path.
+
+    The .html file is a self-contained report that stays responsive for very large results. The .xlsx file is
+    skipped if the issues don't fit in a single Excel sheet.
+
+    Args:
+        mapped_checks (dict): A dictionary mapping categories to DataFrames of issues.
+        output_path (str): The folder to write the files to.
+        provider (str): The name of the cloud provider.
+    """
+    big_df = combine_categories(mapped_checks)
 
     # Define the base name for output files
     output_base = f'{output_path}/{provider}_categorized_issues'
 
-    # Export the big DataFrame to .xlsx, .csv, and .txt formats
-    big_df.to_excel(f'{output_base}.xlsx', index=False)
+    # Export the big DataFrame to .xlsx, .csv, .txt and .html formats
+    if len(big_df) < EXCEL_MAX_ROWS:
+        big_df.to_excel(f'{output_base}.xlsx', index=False)
+    else:
+        print(f'{YELLOW}Too many issues for Excel, skipping {output_base}.xlsx. Open {output_base}.html instead.{NC}')
     big_df.to_csv(f'{output_base}.csv', index=False)
 
     # For .txt output, simulate the pretty print format
     with open(f'{output_base}.txt', 'w') as txt_file:
         txt_file.write(big_df.to_string(index=False))  # Simplified version of pretty print
 
+    html_report.write_html_report(big_df, f'{output_base}.html', f'{provider.upper()} categorized issues - {os.path.basename(os.path.normpath(output_path))}')
+
+
+def categorize_all_tools_issues(output_path, provider, print_categories=True, export=True):
+    """
+    Categorizes issues from different tools and exports the categorized data to various formats.
+
+    Args:
+        output_path (str): The path where the output files will be saved.
+        provider (str): The name of the cloud provider.
+        print_categories (bool, optional): Whether to print the categorized dataframes. Defaults to True.
+        export (bool, optional): Whether to export the categorized dataframes to .xlsx, .csv and .txt. Defaults to True.
+
+    Returns:
+        dict: A dictionary containing the categorized issues.
+    """
+    # Parse checks and map them to categories
+    checks_dict, checks_to_categories = parse_checks()
+    mapped_checks = {}
+    
+    # Analyze output from different tools and categorize issues
+    mapped_checks = analyze_prowler(output_path, provider, checks_to_categories, mapped_checks)
+    mapped_checks = analyze_scoutsuite(output_path, provider, checks_to_categories, mapped_checks)
+    mapped_checks = analyze_cloudsploit(output_path, provider, checks_to_categories, mapped_checks)
+    mapped_checks = analyze_monkey365(output_path, provider, checks_to_categories, mapped_checks)
+
+    sort_categorized_issues(mapped_checks, print_categories)
+    if export:
+        export_categorized_issues(mapped_checks, output_path, provider)
+
     return mapped_checks
 
 
-def main():
+def analyze_folder(folder_path, provider, buffer_output=False):
+    """
+    Runs all summarization and categorization functions on an output folder.
+
+    Args:
+        folder_path (str): The path to the output folder.
+        provider (str): The cloud provider name.
+        buffer_output (bool, optional): Whether to capture the console output instead of printing it. Defaults to False.
+
+    Returns:
+        tuple: The captured console output (empty if not buffered) and a dictionary with headline counts for the overview table.
+    """
+    buffer = io.StringIO()
+    with contextlib.redirect_stdout(buffer) if buffer_output else contextlib.nullcontext():
+        print(f'{GREEN}Selected folder: {os.path.basename(os.path.normpath(folder_path))}{NC}')
+        # Compute the aggregate cube once, the summaries are answered from it
+        summary_cube.get_cube(folder_path, provider)
+        prowler_summary = summarize_prowler(folder_path, provider)
+        scoutsuite_summary = summarize_scoutsuite(folder_path, provider)
+        cloudsploit_summary = summarize_cloudsploit(folder_path, provider)
+        summarize_cloudfox(folder_path, provider)
+        summarize_monkey365(folder_path, provider)
+        mapped_checks = categorize_all_tools_issues(folder_path, provider)
+
+    severities = pd.concat([df['severity'] for df in mapped_checks.values()]) if mapped_checks else pd.Series(dtype=object)
+    overview = {
+        'profiles': len(output_index.list_profiles(folder_path)),
+        'prowler_flagged': sum(info['flagged_items'] for info in prowler_summary.values()) if prowler_summary else None,
+        'scoutsuite_flagged': sum(info['flagged_items'] for info in scoutsuite_summary.values()) if scoutsuite_summary else None,
+        'cloudsploit_flagged': sum(info['flagged_items'] for info in cloudsploit_summary.values()) if cloudsploit_summary else None,
+        'categories': len(mapped_checks),
+        'issues': len(severities),
+        'high_issues': int(severities.isin(['High', 'Critical', 'Danger']).sum()),
+    }
+    return buffer.getvalue(), overview
+
+
+def print_overview_table(overviews):
+    """
+    Prints a table comparing the headline counts of multiple analyzed output folders.
+
+    Args:
+        overviews (dict): A dictionary mapping folder names to the overview dictionaries returned by analyze_folder().
+    """
+    table = prettytable.PrettyTable(['Folder', 'Profiles', 'Prowler flagged', 'ScoutSuite flagged', 'CloudSploit flagged', 'Categories', 'Issues', 'High/Critical'])
+    for folder, overview in overviews.items():
+        if overview is None:
+            table.add_row([f'{RED}{folder}{NC}', '-', '-', '-', '-', '-', '-', f'{RED}Failed{NC}'])
+            continue
+        counts = ['-' if overview[key] is None else overview[key] for key in ['prowler_flagged', 'scoutsuite_flagged', 'cloudsploit_flagged']]
+        high_issues = f"{RED}{overview['high_issues']}{NC}" if overview['high_issues'] > 0 else overview['high_issues']
+        table.add_row([folder, overview['profiles'], *counts, overview['categories'], overview['issues'], high_issues])
+
+    print(f'\n\n{BOLD}Overview of the analyzed folders{NC}')
+    print(table)
+
+
+def print_runs_table(runs):
+    """
+    Prints the runs of the run catalog as a table.
+
+    Args:
+        runs (list[dict]): The runs, as returned by run_catalog.RunCatalog.list_runs().
+    """
+    table = prettytable.PrettyTable(['Folder', 'Profiles', 'Tools', 'Finished', 'Size', 'Jobs not succeeded', 'Issues', 'High/Critical'])
+    table.align = 'l'
+    for run in runs:
+        profiles = ', '.join(run['profiles'][:3]) + (f" (+{len(run['profiles']) - 3})" if len(run['profiles']) > 3 else '')
+        table.add_row([run['folder'], profiles, ', '.join(run['tools']), run['finished'] or '-', run_catalog.format_size(run['size_bytes'] or 0),
+                       '-' if run['jobs_unsuccessful'] is None else run['jobs_unsuccessful'],
+                       '-' if run['issues'] is None else run['issues'], '-' if run['high_issues'] is None else run['high_issues']])
+    print(table)
+
+
+def main(max_workers=None, provider=None, profile=None, tool=None, since=None, list_only=False):
     """
     Analyzes the output folders for different cloud providers.
 
-    This function retrieves the list of output folders, sorts them by last modified time,
-    and prompts the user to select the output folder(s) to analyze. It then extracts the
-    provider from the folder name, and runs various summarization and categorization functions
-    on the selected folder.
+    This function lists the runs from the run catalog, newest first, optionally filtered, and prompts
+    the user to select the output folder(s) to analyze. It then runs various summarization and
+    categorization functions on the selected folders. Multiple folders are analyzed concurrently in
+    worker processes, their output is printed in selection order as soon as it is available, followed
+    by an overview table of all folders.
+
+    Args:
+        max_workers (int, optional): The number of worker processes. Defaults to None, which uses the number of CPUs.
+        provider (str, optional): Only list runs of this provider. Defaults to None.
+        profile (str, optional): Only list runs that audited this profile, * and ? are wildcards. Defaults to None.
+        tool (str, optional): Only list runs with output of this tool. Defaults to None.
+        since (str, optional): Only list runs started at or after this ISO date. Defaults to None.
+        list_only (bool, optional): Print the runs as a table instead of analyzing them. Defaults to False.
     
     Returns:
         None
     """
     try:
         output_base_path = 'output/'
-        # Get folders and sort them by last modified time
-        output_folders = sorted(
-            [f.name for f in os.scandir(output_base_path) if f.is_dir()],
-            key=lambda x: os.path.getmtime(os.path.join(output_base_path, x)),
-            reverse=True  # Newest first
-        )
-
-        selected_folders = selectionmenu.make_menu_selection(output_folders, menu_text='Select the output folder(s) to analyze:', print_results=False, bool_input=True, return_as_str=True)
+        # The catalog only reads the run folders it doesn't know yet, e.g. from runs before the catalog existed
+        catalog = run_catalog.RunCatalog()
+        added, _ = catalog.sync(output_base_path)
+        if added:
+            print(f'{GREEN}Added {added} run folder(s) to the run catalog{NC}')
+        runs = catalog.list_runs(provider, profile, tool, since)
+        if list_only:
+            print_runs_table(runs)
+            return
+
+        descriptions = {run_catalog.describe_run(run): run for run in runs}
+        selected = selectionmenu.make_menu_selection(list(descriptions), menu_text='Select the output folder(s) to analyze:', print_results=False, bool_input=True, return_as_str=True)
+        selected_folders = [descriptions[description]['folder'] for description in selected]
         if not selected_folders:
             print("No folder selected. Exiting.")
             return
 
+        folder_providers = {}
         for selected_folder in selected_folders:
-            print(f'{GREEN}Selected folder: {selected_folder}{NC}')
-
-            selected_folder_path = os.path.join(output_base_path, selected_folder)
-            
             # Extract the provider from the folder name
             provider = selected_folder.split('-')[0]  # Splits the folder name and takes the first part as the provider
 
             if provider not in ['azure', 'aws']:
-                print(f"Unknown provider '{provider}'. Exiting.")
+                print(f"Unknown provider '{provider}' for folder {selected_folder}. Skipping.")
                 continue
+            folder_providers[selected_folder] = provider
+
+        # A single folder is analyzed in this process, so its output is shown while it is produced
+        if len(folder_providers) == 1 or max_workers == 1:
+            overviews = {}
+            for selected_folder, provider in folder_providers.items():
+                _, overviews[selected_folder] = analyze_folder(os.path.join(output_base_path, selected_folder), provider)
+                catalog.update_counts(selected_folder, overviews[selected_folder])
+            if len(overviews) > 1:
+                print_overview_table(overviews)
+            return
 
-            # Run summarization and categorization functions on the selected folder
-            summarize_prowler(selected_folder_path, provider)
-            summarize_scoutsuite(selected_folder_path, provider)
-            summarize_cloudsploit(selected_folder_path, provider)
-            summarize_cloudfox(selected_folder_path, provider)
-            summarize_monkey365(selected_folder_path, provider)
-            categorize_all_tools_issues(selected_folder_path, provider)
+        # Run summarization and categorization functions on the selected folders concurrently
+        outputs = {}
+        overviews = {}
+        folders = list(folder_providers)
+        next_to_print = 0
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(analyze_folder, os.path.join(output_base_path, folder), provider, True): folder for folder, provider in folder_providers.items()}
+            print(f'{GREEN}Analyzing {len(futures)} folders...{NC}')
+            for future in concurrent.futures.as_completed(futures):
+                folder = futures[future]
+                try:
+                    outputs[folder], overviews[folder] = future.result()
+                except Exception as e:
+                    outputs[folder], overviews[folder] = f'{RED}Error analyzing folder {folder}: {e}{NC}\n', None
+
+                # Print the output of all finished folders that are next in selection order
+                while next_to_print < len(folders) and folders[next_to_print] in outputs:
+                    print(outputs.pop(folders[next_to_print]), end='')
+                    next_to_print += 1
+
+        print_overview_table({folder: overviews[folder] for folder in folders})
+        for folder in folders:
+            if overviews[folder] is not None:
+                catalog.update_counts(folder, overviews[folder])
 
     except FileNotFoundError:
         print("The specified folder does not exist.")
@@ -889,6 +1622,14 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Analyze the output folders of AutoCloudAudit runs.')
+    parser.add_argument('--provider', choices=['aws', 'azure'], help='Only list runs of this provider')
+    parser.add_argument('--profile', help='Only list runs that audited this profile, * and ? are wildcards')
+    parser.add_argument('--tool', help='Only list runs with output of this tool, e.g. Prowler')
+    parser.add_argument('--since', help='Only list runs started on or after this date, e.g. 2024-06-01')
+    parser.add_argument('--list', action='store_true', help='Print the runs instead of selecting runs to analyze')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes to analyze multiple folders (default: number of CPUs)')
+    args = parser.parse_args()
+    main(args.workers, args.provider, args.profile, args.tool, args.since, args.list)
 
  
@@ -3,11 +3,15 @@
 # This software is released under the MIT License.
 # https://opensource.org/licenses/MIT
 
-import webbrowser
-import requests
 import json
 import configparser
+import concurrent.futures
+import contextlib
+import datetime
 import os
+import shutil
+import subprocess
+import tempfile
 
 # Colors for the terminal
 GREEN = '\033[92m'
@@ -19,6 +23,8 @@ NC = '\033[0m'
 
 # Not used by the script, but useful for reference/future extensions
 def get_oauth_tokens_device_code(client_id="12345678-123a-12ac-1234-1234abcd1234", print=False):
+    import webbrowser
+    import requests
 
     # Open authorization URL in browser
     authorization_url = f"https://login.microsoftonline.com/common/oauth2/v2.0/authorize?client_id={client_id}&scope=openid%20profile%20https://ads.microsoft.com/msads.manage%20offline_access&response_type=code&redirect_uri=https://login.microsoftonline.com/common/oauth2/nativeclient&state=ClientStateGoesHere&prompt=login"
@@ -59,17 +65,67 @@ def get_oauth_tokens_device_code(client_id="12345678-123a-12ac-1234-1234abcd1234
     return tokens
 
 
+# Locations of the CLI credential stores
+AWS_CREDENTIALS_FILE = '~/.aws/credentials'
+AZURE_TOKEN_CACHE_FILE = '~/.azure/msal_token_cache.json'
+AZURE_PROFILE_FILE = '~/.azure/azureProfile.json'
+
+# Keys used by credential helpers (saml2aws, gimme-aws-creds, aws-vault, ...) to store the session expiry
+AWS_EXPIRY_KEYS = ['x_security_token_expires', 'aws_expiration', 'aws_session_expiration', 'expiration']
+
+# Parsed credential files and derived credentials, invalidated when the modification time of a file changes
+_file_cache = {}
+_credentials_cache = {}
+
+
+# Returns the modification time and size of a file, or None if it doesn't exist
+def _file_signature(path):
+    try:
+        stat = os.stat(os.path.expanduser(path))
+        return (stat.st_mtime_ns, stat.st_size)
+    except FileNotFoundError:
+        return None
+
+
+# Returns the parsed contents of a JSON or INI file, parsing it again only if it changed on disk
+def _read_cached(path, file_format='json'):
+    signature = _file_signature(path)
+    cached = _file_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    if file_format == 'ini':
+        data = configparser.ConfigParser()
+        data.read(os.path.expanduser(path))
+    else:
+        with open(os.path.expanduser(path), 'r', encoding='utf-8-sig') as f:
+            data = json.load(f)
+    _file_cache[path] = (signature, data)
+    return data
+
+
+# Forgets all cached credentials, e.g. after logging in again
+def clear_credentials_cache():
+    _file_cache.clear()
+    _credentials_cache.clear()
+
+
 # Returns the access ID and key for the given AWS profile
 def get_aws_credentials(profile='default'):
     # AWS creds are stored in ~/.aws/credentials
     try:
-        config = configparser.ConfigParser()
-        config.read(os.path.expanduser('~/.aws/credentials'))
+        signature = _file_signature(AWS_CREDENTIALS_FILE)
+        cached = _credentials_cache.get(('aws', profile))
+        if cached is not None and cached[0] == signature:
+            return dict(cached[1])
+
+        config = _read_cached(AWS_CREDENTIALS_FILE, 'ini')
         credentials = {
             'aws_access_key_id': config.get(profile, 'aws_access_key_id'),
             'aws_secret_access_key': config.get(profile, 'aws_secret_access_key')
         }
-        return credentials
+        _credentials_cache[('aws', profile)] = (signature, credentials)
+        return dict(credentials)
     except Exception as e:
         print(f"Error getting AWS credentials: {e}")
         return None
@@ -78,8 +134,12 @@ def get_aws_credentials(profile='default'):
 def get_azure_credentials(profile='default'):
     # Creds are stored in ~/.azure/msal_token_cache.json and ~/.azure/azureProfile.json
     try:
-        with open(os.path.expanduser('~/.azure/msal_token_cache.json'), 'r', encoding='utf-8-sig') as f:
-            data = json.load(f)
+        signature = (_file_signature(AZURE_TOKEN_CACHE_FILE), _file_signature(AZURE_PROFILE_FILE))
+        cached = _credentials_cache.get(('azure', profile))
+        if cached is not None and cached[0] == signature:
+            return dict(cached[1])
+
+        data = _read_cached(AZURE_TOKEN_CACHE_FILE)
         
         # Extract the first available IdToken and RefreshToken
         idtoken_key = next(iter(data.get('IdToken', {})), None)
@@ -96,6 +156,7 @@ def get_azure_credentials(profile='default'):
             return None
 
         # Extract the AccessToken for graph.microsoft.com
+        accesstoken = {}
         accesstoken_key = next((key for key in data.get('AccessToken', {}) if 'graph.windows.net' in key), None)
         if accesstoken_key:
             accesstoken = data['AccessToken'][accesstoken_key]
@@ -103,12 +164,11 @@ def get_azure_credentials(profile='default'):
             print(f"{RED}{BOLD}No AccessToken for graph.windows.net found, tryng to continue anyway{NC}")
 
         # Extract the selected profile/subscription, if not given use the first one
-        with open(os.path.expanduser('~/.azure/azureProfile.json'), 'r', encoding='utf-8-sig') as f:
-            profile = json.load(f)
+        azure_profile = _read_cached(AZURE_PROFILE_FILE)
 
-        subscription = profile.get('subscriptions', [{}])[0]
+        subscription = azure_profile.get('subscriptions', [{}])[0]
         if profile != '' and profile != 'default':
-            for sub in profile.get('subscriptions', []):
+            for sub in azure_profile.get('subscriptions', []):
                 if f"{sub.get('name', '')} ({sub.get('id', '')})" == profile:
                     subscription = sub
                     break
@@ -123,9 +183,10 @@ def get_azure_credentials(profile='default'):
             'subscription_id': subscription.get('id', ''),
             'subscription_name': subscription.get('name', ''),
             'directory_id': subscription.get('tenantId', ''),
-            'subscriptions': profile.get('subscriptions', [])
+            'subscriptions': azure_profile.get('subscriptions', [])
         }
-        return credentials
+        _credentials_cache[('azure', profile)] = (signature, credentials)
+        return dict(credentials)
     except Exception as e:
         print(f"Error getting Azure credentials: {e}")
         return None
@@ -133,8 +194,7 @@ def get_azure_credentials(profile='default'):
 # Returns the list of AWS profiles
 def list_aws_profiles():
     try:
-        config = configparser.ConfigParser()
-        config.read(os.path.expanduser('~/.aws/credentials'))
+        config = _read_cached(AWS_CREDENTIALS_FILE, 'ini')
         profiles = config.sections()
         return profiles
     except Exception as e:
@@ -144,8 +204,7 @@ def list_aws_profiles():
 # Returns the list of Azure profiles
 def list_azure_profiles():
     try:
-        with open(os.path.expanduser('~/.azure/azureProfile.json'), 'r', encoding='utf-8-sig') as f:
-            profile = json.load(f)
+        profile = _read_cached(AZURE_PROFILE_FILE)
         subscriptions = profile.get('subscriptions', [])
         return [f"{sub.get('name', '')} ({sub.get('id', '')})" for sub in subscriptions]
     except Exception as e:
@@ -154,7 +213,7 @@ def list_azure_profiles():
 
 # Returns True if the user is logged in to the given provider
 def check_logged_in_cli(provider, profile='default'):
-    credentials = get_aws_credentials(profile) if provider == 'aws' else get_azure_credentials() if provider == 'azure' else None
+    credentials = get_aws_credentials(profile) if provider == 'aws' else get_azure_credentials(profile) if provider == 'azure' else None
     if credentials is None:
         return False
 
@@ -166,10 +225,140 @@ def check_logged_in_cli(provider, profile='default'):
     return False
 
 
+# Returns (token, expires_on) of an unexpired access token from the Azure CLI token cache for one of the given hosts,
+# or None if there is none. Used to call Microsoft Graph and ARM directly without starting the Azure CLI.
+def get_cached_access_token(hosts, tenant_id=None, min_valid_seconds=300):
+    try:
+        data = _read_cached(AZURE_TOKEN_CACHE_FILE)
+    except Exception:
+        return None
+    now = datetime.datetime.now(datetime.timezone.utc).timestamp()
+    for token in data.get('AccessToken', {}).values():
+        if not any(host in token.get('target', '') for host in hosts):
+            continue
+        if tenant_id and token.get('realm') != tenant_id:
+            continue
+        expires_on = int(token.get('expires_on', 0))
+        if expires_on > now + min_valid_seconds:
+            return token.get('secret', ''), expires_on
+    return None
+
+
+# Parses an expiry timestamp as stored by the CLIs and credential helpers into an aware UTC datetime
+def _parse_expiry(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)) or str(value).isdigit():
+        return datetime.datetime.fromtimestamp(int(value), tz=datetime.timezone.utc)
+    expiry = datetime.datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    return expiry if expiry.tzinfo else expiry.replace(tzinfo=datetime.timezone.utc)
+
+
+# Returns when the cached credentials of a profile expire (UTC datetime), or None if they don't expire.
+# For Azure this is the expiry of the newest ARM access token; the CLI can still refresh it with the refresh token.
+def get_credentials_expiry(provider, profile='default'):
+    try:
+        if provider == 'aws':
+            config = _read_cached(AWS_CREDENTIALS_FILE, 'ini')
+            if not config.has_section(profile):
+                return None
+            value = next((config.get(profile, key) for key in AWS_EXPIRY_KEYS if config.has_option(profile, key)), None)
+            return _parse_expiry(value)
+
+        elif provider == 'azure':
+            credentials = get_azure_credentials(profile)
+            if credentials is None:
+                return None
+            data = _read_cached(AZURE_TOKEN_CACHE_FILE)
+            expiries = [_parse_expiry(token.get('expires_on'))
+                        for token in data.get('AccessToken', {}).values()
+                        if token.get('home_account_id') == credentials['home_account_id']
+                        and 'management' in token.get('target', '')]
+            expiries = [expiry for expiry in expiries if expiry is not None]
+            return max(expiries) if expiries else None
+    except Exception as e:
+        print(f"Error reading the {provider} credentials expiry: {e}")
+    return None
+
+
+# Validates that a profile can actually be used by asking the CLI for a token or identity. Returns (ok, message).
+def validate_cli_session(provider, profile='default', timeout=60):
+    if provider == 'aws':
+        cmd = ['aws', 'sts', 'get-caller-identity', '--output', 'json']
+        if profile != 'default':
+            cmd += ['--profile', profile]
+    elif provider == 'azure':
+        credentials = get_azure_credentials(profile) or {}
+        cmd = ['az', 'account', 'get-access-token', '--output', 'json']
+        if credentials.get('subscription_id'):
+            cmd += ['--subscription', credentials['subscription_id']]
+    else:
+        return False, f'Unknown provider {provider}'
+
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    except FileNotFoundError:
+        return False, f'{cmd[0]} CLI not found'
+    except subprocess.TimeoutExpired:
+        return False, f'{cmd[0]} CLI did not respond within {timeout} seconds'
+    if result.returncode != 0:
+        error_lines = result.stderr.strip().splitlines()
+        return False, error_lines[-1] if error_lines else f'{cmd[0]} CLI exited with status {result.returncode}'
+    return True, 'Session is valid'
+
+
+# Checks a single profile before any job is scheduled for it. Returns (ok, message).
+def preflight_check(provider, profile='default', min_valid_minutes=60, live=True):
+    if not check_logged_in_cli(provider, profile):
+        return False, f'Not logged into {provider}'
+
+    expiry = get_credentials_expiry(provider, profile)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    message = 'Credentials found'
+    if expiry is not None:
+        remaining_minutes = (expiry - now).total_seconds() / 60
+        if remaining_minutes <= 0 and provider == 'aws':
+            return False, f'Session expired at {expiry:%Y-%m-%d %H:%M} UTC'
+        elif remaining_minutes <= 0:
+            message = 'Access token expired, the CLI has to refresh it'
+        elif remaining_minutes < min_valid_minutes:
+            message = f'{YELLOW}Expires in {remaining_minutes:.0f} minutes, long scans may fail{NC}'
+        else:
+            message = f'Valid until {expiry:%Y-%m-%d %H:%M} UTC'
+
+    if live:
+        valid, live_message = validate_cli_session(provider, profile)
+        if not valid:
+            return False, live_message
+    return True, message
+
+
+# Runs the pre-flight checks of multiple (provider, profile) targets concurrently.
+# Returns a dictionary mapping each target to (ok, message).
+def preflight_check_all(targets, min_valid_minutes=60, live=True, max_workers=8):
+    targets = list(dict.fromkeys(targets))
+    if not targets:
+        return {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {target: executor.submit(preflight_check, target[0], target[1], min_valid_minutes, live) for target in targets}
+        return {target: future.result() for target, future in futures.items()}
+
+
+# Where private per-job credential files are created: tmpfs if available, so they never reach a disk
+PRIVATE_TEMP_DIR = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else None
+
+# The CloudSploit configuration of a single job. It extends the installed config.js, but reads the credentials
+# from the job's own file instead of the shared creds.json.
+CLOUDSPLOIT_JOB_CONFIG = '''var config = require({base_config});
+config.credentials.{provider}.credential_file = {credential_file};
+module.exports = config;
+'''
+
+
 # Create a CloudSploit config file with the given credentials
-def create_cloudsploit_config(provider, credentials):
+def create_cloudsploit_config(provider, credentials, config_path=None):
     try:
-        config_path = os.path.abspath(os.path.join(os.getcwd(),'tools', 'cloudsploit', 'creds.json'))
+        config_path = config_path or os.path.abspath(os.path.join(os.getcwd(),'tools', 'cloudsploit', 'creds.json'))
         config = {}
 
         if provider.lower() == 'aws':
@@ -187,7 +376,8 @@ def create_cloudsploit_config(provider, credentials):
                 "SubscriptionID": credentials.get('subscription_id'),
             }
 
-        with open(config_path, 'w') as f:
+        # Only the current user can read the credentials
+        with os.fdopen(os.open(config_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
             json.dump(config, f, indent=4)
         return True
     except Exception as e:
@@ -195,9 +385,39 @@ def create_cloudsploit_config(provider, credentials):
         return False
 
 
+@contextlib.contextmanager
+def private_cloudsploit_config(provider, credentials, cloudsploit_dir=None):
+    """
+    Creates a private CloudSploit configuration for a single job, and removes it when the job is done.
 
-print(f"Logged into AWS: {check_logged_in_cli('aws', )}")
-print(f"Logged into Azure: {check_logged_in_cli('azure')}")
-
+    The credentials and the config.js that points to them are written to a new directory that only the
+    current user can access, on tmpfs if available. Every job gets its own files, so CloudSploit jobs for
+    different profiles can run at the same time.
 
+    Args:
+        provider (str): The cloud provider, 'aws' or 'azure'.
+        credentials (dict): The credentials, see create_cloudsploit_config().
+        cloudsploit_dir (str, optional): The CloudSploit installation. Defaults to tools/cloudsploit.
 
+    Yields:
+        str: The path of the config.js to pass to CloudSploit with --config.
+    """
+    cloudsploit_dir = cloudsploit_dir or os.path.abspath(os.path.join(os.getcwd(), 'tools', 'cloudsploit'))
+    job_dir = tempfile.mkdtemp(prefix='autocloudaudit-cloudsploit-', dir=PRIVATE_TEMP_DIR)
+    try:
+        credential_file = os.path.join(job_dir, 'creds.json')
+        if not create_cloudsploit_config(provider, credentials, credential_file):
+            raise OSError(f'Could not write the CloudSploit credentials to {credential_file}')
+        config_file = os.path.join(job_dir, 'config.js')
+        with os.fdopen(os.open(config_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as f:
+            f.write(CLOUDSPLOIT_JOB_CONFIG.format(base_config=json.dumps(os.path.join(cloudsploit_dir, 'config.js')),
+                                                  provider=provider.lower(), credential_file=json.dumps(credential_file)))
+        yield config_file
+    finally:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+
+# Prints whether the user is logged in to the AWS and Azure CLIs
+def print_login_status():
+    print(f"Logged into AWS: {check_logged_in_cli('aws', )}")
+    print(f"Logged into Azure: {check_logged_in_cli('azure')}")
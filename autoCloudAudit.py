@@ -3,14 +3,21 @@
 # This software is released under the MIT License.
 # https://opensource.org/licenses/MIT
 
-import authenticate, selectionmenu, analyze
+import authenticate, selectionmenu, analyze, output_index, sp_pool, scheduler, supervisor, job_queue, pwsh_host, analysis_pipeline, report_server, summary_cube, tool_adapters, job_history, run_catalog
 
+import argparse
+import codecs
+import fnmatch
 import signal
+import sqlite3
 import subprocess
+import sys
 import os
 import json
 import datetime
+import threading
 import time
+import uuid
 
 # Colors for the terminal
 GREEN = '\033[92m'
@@ -20,6 +27,35 @@ RED = '\033[91m'
 BOLD = '\033[1m'
 NC = '\033[0m'
 
+# Concurrency limits per tool in fan-out mode, e.g. {'Prowler': 2}. No tool is limited by default.
+DEFAULT_TOOL_LIMITS = {}
+
+# Maximum run time per tool in minutes, a run that takes longer is stopped
+DEFAULT_TOOL_TIMEOUTS = {tool: tool_adapters.get_adapter(tool).timeout for tool in tool_adapters.tool_names()}
+
+# A run that writes no output for this many minutes is considered stalled and stopped. Tools that only write
+# output at the end, like CloudSploit with --console none, are only limited by their timeout.
+DEFAULT_STALL_TIMEOUT = 30
+STALL_TIMEOUT_EXEMPT_TOOLS = [tool for tool in tool_adapters.tool_names() if tool_adapters.get_adapter(tool).stall_timeout_exempt]
+
+# Number of times a job is retried after a transient failure (throttling, an expired session or a stalled run)
+DEFAULT_RETRIES = 2
+
+# Seconds a tool gets to shut down after the user interrupted it, before it is stopped
+INTERRUPT_GRACE_PERIOD = 30
+
+# The settings the coordinator of a distributed run passes to its workers with every job
+WORKER_SETTINGS = ['tool_timeouts', 'stall_timeout', 'retries', 'monkey365_formats']
+
+# Seconds between the polls of the coordinator and of idle workers of a distributed run
+QUEUE_POLL_SECONDS = 5
+
+# Per-thread output settings of the job that is currently running, see run_commands()
+job_output = threading.local()
+
+# Guards the checkout of audit app registrations by concurrent jobs
+temp_app_lock = threading.Lock()
+
 
 def signal_handler(sig, frame):
     '''Signal handler function for handling SIGINT signals.'''
@@ -66,329 +102,248 @@ def run_commands_orig(commands, directory, print_output=True):
     return
 
 
-def run_commands(commands, directory, print_output=True):
+def run_commands(commands, directory, print_output=True, env=None):
     '''
     Run a list of shell-commands in a directory and print the output to the console.
 
-    Returns:
-        bool: True if the command was interrupted by the user, False otherwise.
-    '''
-    command_str = '; '.join(commands)
-    interrupted = False
-    try:
-        subprocess.run(command_str, shell=True, check=True, cwd=directory, executable='/bin/bash')
-    except subprocess.CalledProcessError as e:
-        print(f"Command '{e.cmd}' returned non-zero exit status {e.returncode}.")
-    except KeyboardInterrupt:
-        print('Command interrupted by user.')
-        interrupted = True
-    return interrupted
-
-
-
-def create_temp_azure_app(subscription_id):
-    '''
-    Creates a temporary Azure app registration and saves the IDs to variables.
-
-    Returns:
-        dict: A dictionary containing clientid, clientsecret, spid, and clientsecretname.
-    '''
-    appregname = 'AutoCloudAudit_temp_App'
-    clientsecretname = 'AutoCloudAudit_ScriptGenerated'
-    enddate = subprocess.check_output(['date', '-d', '+1 month', '+%Y-%m-%d']).decode().strip()
-
-    # Create app registration
-    clientid = subprocess.check_output(['az', 'ad', 'app', 'create', '--display-name', appregname, '--query', 'appId', '--output', 'tsv']).decode().strip()
-    clientsecret = subprocess.check_output(['az', 'ad', 'app', 'credential', 'reset', '--id', clientid, '--append', '--display-name', clientsecretname, '--end-date', enddate, '--query', 'password', '--output', 'tsv']).decode().strip()
-
-    # Check if SPID already exists (if the app registration was created before but not cleaned up)
-    sp_list_output = subprocess.check_output(['az', 'ad', 'sp', 'list', '--filter', f"appId eq '{clientid}'", '--query', '[].servicePrincipalNames', '--output', 'json']).decode().strip()
-    print(sp_list_output)
-    sp_list = json.loads(sp_list_output)
-    print(sp_list)
-
-    if sp_list:
-        # SPID exists, use the existing SPID
-        spid = sp_list[0][0]
-        print(f'Service Principal already exists with ID: {spid}. Skipping creation.')
-    else:
-        # If SPID does not exist, create a new service principal
-        spid = subprocess.check_output(['az', 'ad', 'sp', 'create', '--id', clientid, '--query', 'id', '--output', 'tsv']).decode().strip()
-        # Wait for 10 seconds to allow the service principal to be created
-        time.sleep(10)
-
-    # Check if roles are already assigned
-    roles_output = subprocess.check_output(['az', 'role', 'assignment', 'list', '--assignee', spid, '--query', '[].roleDefinitionName', '--output', 'json']).decode().strip()
-    roles = json.loads(roles_output)
-    required_roles = ['Security Reader', 'Log Analytics Reader']
-    for role in required_roles:
-        if role not in roles:
-            # Assign role if not already assigned
-            subprocess.run(['az', 'role', 'assignment', 'create', '--role', role, '--assignee', spid, '--scope', f'/subscriptions/{subscription_id}'])
-        else:
-            print(f"Role '{role}' is already assigned to SPID: {spid}. Skipping role assignment.")
-
-    # Function continues...
-    # Wait for 5 seconds after adding roles
-    time.sleep(5)
-
-    azure_app_credentials = {
-        'clientid': clientid,
-        'clientsecret': clientsecret,
-        'spid': spid,
-        'clientsecretname': clientsecretname
-    }
-    print(azure_app_credentials)
-    return azure_app_credentials
+    When called from a job that runs in parallel with others, the output is written to the job's log file
+    (job_output.log_file) instead, so the output of concurrent jobs doesn't interleave.
+    The commands are stopped when they run longer than job_output.timeout seconds or don't write any output for
+    job_output.stall_timeout seconds. The outcome (status, exit code and transient errors found in the output)
+    is stored in job_output.outcome, which run_job_supervised() uses to decide on retries.
 
-
-def cleanup_temp_azure_app(clientid):
-    '''
-    Deletes a temporary Azure app registration and removes its role assignments.
+    When the user interrupts the commands, the output is still read while they shut down, so a tool that writes
+    a lot on exit doesn't block on a full pipe. They are stopped if they take longer than INTERRUPT_GRACE_PERIOD
+    seconds, and killed right away on a second interrupt.
 
     Args:
-        clientid (str): The client ID of the app to delete.
-    '''
-    # Convert the client ID to the service principal ID
-    spid = subprocess.check_output(['az', 'ad', 'sp', 'list', '--filter', f"appId eq '{clientid}'", '--query', '[].id', '--output', 'tsv']).decode().strip()
-
-    # List role assignments for the service principal
-    role_assignments = json.loads(subprocess.check_output(['az', 'role', 'assignment', 'list', '--assignee', spid, '--output', 'json']).decode().strip())
-
-    # Remove role assignments
-    for assignment in role_assignments:
-        subprocess.run(['az', 'role', 'assignment', 'delete', '--ids', assignment['id']])
-
-    # Delete the app registration
-    subprocess.run(['az', 'ad', 'app', 'delete', '--id', clientid])
-
-
-def run_prowler(provider='aws', authmethod='cli', profile='default', output_dir='output'):
-    '''
-    Run Prowler audit tool for cloud providers.
-
-    Args:
-        provider (str, optional): The cloud provider to run Prowler on. Defaults to 'aws'.
-        authmethod (str, optional): The authentication method to use. Defaults to 'cli'.
-        profile (str, optional): The AWS profile/Azure subscription to use for authentication and auditing. Defaults to 'default'.
+        commands (list[str]): The commands to run.
+        directory (str): The directory to run them in.
+        print_output (bool, optional): Whether to print the output to the console when it is not written to a log
+            file. Defaults to True.
+        env (dict, optional): The environment to run the commands in. Defaults to None (the current environment).
 
     Returns:
-        None
+        bool: True if the command was interrupted by the user, False otherwise.
     '''
-    prowler_dir = os.path.abspath(os.path.join(os.getcwd(), 'tools', 'prowler'))
-    if not authenticate.check_logged_in_cli(provider):
-        print(f'Not logged into {provider}')
-        return
-
-    if provider == 'aws':
-        if authmethod == 'cli':
-            cmd = f'prowler aws -p {profile} -o {output_dir}/{profile}/prowler'
-        else:
-            cmd = f'prowler aws -o {output_dir}/{profile}/prowler'
-
-    elif provider == 'azure':
-        if authmethod == 'cli':
-            cmd = f'prowler azure --az-cli-auth -o {output_dir}/{profile}/prowler'
-        else:
-            cmd = f'prowler azure -o {output_dir}/{profile}/prowler'
-
-    print(f'Running Prowler with command: "{cmd}"')
-    interrupted = run_commands(['source venv_prowler/bin/activate', cmd, f'ln -s {output_dir}/{profile}/prowler/ {output_dir}/{profile}/prowler/output', 'deactivate', f"echo '{GREEN}{BOLD}Prowler run completed!{NC}'"], prowler_dir, print_output=True)
+    # Exit with the status of the last command that failed, instead of the status of the last command
+    command_str = '__status=0; ' + '; '.join(f'{{ {command}; }} || __status=$?' for command in commands) + '; exit $__status'
+    interrupted = False
+    log_file = getattr(job_output, 'log_file', None)
+    log = open(log_file, 'a') if log_file else None
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    try:
+        if log:
+            log.write(f"$ {'; '.join(commands)}\n")
+            log.flush()
+        process = supervisor.start_process(command_str, directory, env)
+        with supervisor.Watchdog(lambda: supervisor.stop_process(process), getattr(job_output, 'timeout', None),
+                                 getattr(job_output, 'stall_timeout', None), on_error=getattr(job_output, 'on_error', None)) as watchdog:
+            def forward_output():
+                # Forward the output as it arrives, so progress bars keep updating
+                for chunk in iter(lambda: process.stdout.read1(65536), b''):
+                    text = decoder.decode(chunk)
+                    watchdog.output(text)
+                    if log:
+                        log.write(text)
+                        log.flush()
+                    elif print_output:
+                        sys.stdout.buffer.write(chunk)
+                        sys.stdout.flush()
+
+            try:
+                forward_output()
+            except KeyboardInterrupt:
+                supervisor.signal_process(process, signal.SIGINT)
+                interrupted = True
+                stopper = threading.Timer(INTERRUPT_GRACE_PERIOD, supervisor.stop_process, (process,))
+                stopper.daemon = True
+                stopper.start()
+                while True:
+                    try:
+                        forward_output()
+                        break
+                    except KeyboardInterrupt:
+                        supervisor.signal_process(process, signal.SIGKILL)
+                stopper.cancel()
+            returncode = supervisor.finish_process(process)
+    finally:
+        if log:
+            log.close()
+
+    interrupted = interrupted or supervisor.interrupt_event.is_set()
+    status = 'interrupted' if interrupted else watchdog.reason or ('failed' if returncode else 'ok')
+    job_output.outcome = {'status': status, 'returncode': returncode, 'errors': watchdog.errors}
+    if interrupted:
+        print('Command interrupted by user.')
+    elif watchdog.reason:
+        print(f"{RED}Command '{'; '.join(commands)}' was stopped: {'timeout' if watchdog.reason == 'timeout' else 'no output'} after {time.monotonic() - watchdog.started:.0f}s{NC}")
+    elif returncode:
+        print(f"Command '{'; '.join(commands)}' returned non-zero exit status {returncode}.")
     return interrupted
 
 
-def run_scoutsuite(provider='aws', authmethod='cli', profile='default', output_dir='output'):
-    '''
-    Run ScoutSuite audit tool for cloud providers.
+def get_temp_app_details(global_settings, credentials):
+    """
+    Checks out an audit service principal from the pool that has the reader roles on the subscription of the credentials.
+    The principal is checked out once per subscription and audit, and returned to the pool in post_run_actions().
 
     Args:
-        provider (str, optional): The cloud provider to run ScoutSuite on. Defaults to 'aws'.
-        authmethod (str, optional): The authentication method to use. Defaults to 'cli'.
-        profile (str, optional): The AWS profile/Azure subscription to use for authentication and auditing. Defaults to 'default'.
+        global_settings (dict): A dictionary containing the global settings.
+        credentials (dict): The Azure credentials of the audited subscription.
 
     Returns:
-        None
-    '''
-    scoutsuite_dir = os.path.abspath(os.path.join(os.getcwd(), 'tools', 'scoutsuite'))
-    if not authenticate.check_logged_in_cli(provider):
-        print(f'Not logged into {provider}')
-        return
-
-    if provider == 'aws':
-        if authmethod == 'cli':
-            cmd = f"scout aws -p {profile} --report-dir {output_dir}/{profile}/scoutsuite"
-        else:
-            cmd = f"scout aws --report-dir {output_dir}/{profile}/scoutsuite"
-
-    elif provider == "azure":
-        if authmethod == "cli":
-            cmd = f"scout azure --cli --report-dir {output_dir}/{profile}/scoutsuite"
-        else:
-            cmd = f"scout azure --report-dir {output_dir}/{profile}/scoutsuite"
-
-    print(f'Running ScoutSuite with command: "{cmd}"')
-    interrupted = run_commands(['source venv_scoutsuite/bin/activate', cmd, 'deactivate', f"echo '{GREEN}{BOLD}ScoutSuite run completed!{NC}'"], scoutsuite_dir, print_output=True)
-    return interrupted
+        dict: A dictionary containing clientid, clientsecret, spid and clientsecretname.
+    """
+    with temp_app_lock:
+        leases = global_settings.setdefault('sp_leases', {})
+        subscription_id = credentials.get('subscription_id')
+        if subscription_id not in leases:
+            leases[subscription_id] = sp_pool.checkout_principal(subscription_id, credentials.get('directory_id'))
+        return leases[subscription_id][0]
 
 
-def run_cloudfox(provider="aws", authmethod="cli", profile='default', output_dir='output'):
+def prepare_temp_apps(global_settings, profiles):
     """
-    Run CloudFox audit tool for cloud providers.
+    Checks out one shared audit service principal per tenant for all given Azure subscriptions at once, before
+    the jobs start. The reader roles on all subscriptions are assigned concurrently.
 
     Args:
-        provider (str, optional): The cloud provider to run CloudFox on. Defaults to "aws".
-        authmethod (str, optional): The authentication method to use. Defaults to "cli".
-        profile (str, optional): The AWS profile/Azure subscription to use for authentication and auditing. Defaults to "default".
-
-    Returns:
-        None
+        global_settings (dict): A dictionary containing the global settings.
+        profiles (list[str]): The Azure profiles (subscriptions) that will be audited.
     """
-    cloudfox_dir = os.path.abspath(os.path.join(os.getcwd(), "tools", "cloudfox"))    
-    if not authenticate.check_logged_in_cli(provider):
-        print(f"Not logged into {provider}-CLI")
-        return
-
-    if provider == "aws":
-        if authmethod == "cli":
-            cmd = f"./cloudfox aws -p {profile} --outdir {output_dir}/{profile}/cloudfox all-checks"
-        else:
-            cmd = f"./cloudfox aws --outdir {output_dir}/{profile}/cloudfox all-checks"
-
-    elif provider == "azure":
-        if authmethod == "cli":
-            tenant_id = authenticate.get_azure_credentials(profile).get('directory_id')
-            cmds = [
-                f"./cloudfox azure --outdir {output_dir}/{profile}/cloudfox inventory -t {tenant_id}",
-                f"./cloudfox azure --outdir {output_dir}/{profile}/cloudfox rbac -t {tenant_id}",
-                f"./cloudfox azure --outdir {output_dir}/{profile}/cloudfox storage -t {tenant_id}",
-                f"./cloudfox azure --outdir {output_dir}/{profile}/cloudfox vms -t {tenant_id}",
-                f"./cloudfox azure --outdir {output_dir}/{profile}/cloudfox whoami -t {tenant_id}"
-            ]
-        else:
-            cmds = [f"./cloudfox azure --outdir {output_dir}/{profile}/cloudfox inventory rbac storage vms whoami"]
-        cmd = '; '.join(cmds)
-
-
-    print(f'Running CloudFox with command: "{cmd}"')
-    interrupted = run_commands([cmd, f'echo "{GREEN}{BOLD}CloudFox run completed!"{NC}'], cloudfox_dir, print_output=True)
-    return interrupted
-        
-
-def run_cloudsploit(provider="aws", authmethod="cli", profile='default', output_dir='output', global_settings={}):
+    subscriptions_by_tenant = {}
+    for profile in profiles:
+        credentials = authenticate.get_azure_credentials(profile) or {}
+        if credentials.get('subscription_id'):
+            subscriptions_by_tenant.setdefault(credentials.get('directory_id'), []).append(credentials['subscription_id'])
+
+    leases = global_settings.setdefault('sp_leases', {})
+    for tenant_id, subscription_ids in subscriptions_by_tenant.items():
+        subscription_ids = [subscription_id for subscription_id in subscription_ids if subscription_id not in leases]
+        if not subscription_ids:
+            continue
+        print(f'Preparing the audit app registration for {len(subscription_ids)} subscription(s) of tenant {tenant_id}...')
+        lease = sp_pool.checkout_principal(subscription_ids, tenant_id)
+        for subscription_id in subscription_ids:
+            leases[subscription_id] = lease
+
+
+def run_tool(global_settings, job, adapter):
     """
-    Run CloudSploit audit tool for cloud providers.
+    Run an audit tool for a single profile, as described by its adapter (see tool_adapters.ToolAdapter).
 
     Args:
-        provider (str, optional): The cloud provider to run CloudSploit on. Defaults to "aws".
-        authmethod (str, optional): The authentication method to use. Defaults to "cli".
-        profile (str, optional): The AWS profile/Azure subscription to use for authentication and auditing. Defaults to "default".
+        global_settings (dict): A dictionary containing the global settings.
+        job (dict): The job, with the keys provider, authmethod, tool, profile and output_dir.
+        adapter (tool_adapters.ToolAdapter): The adapter of the tool.
 
     Returns:
-        None
+        bool: True if the execution was interrupted, False otherwise. None if the tool did not run.
     """
-    cloudsploit_dir = os.path.abspath(os.path.join(os.getcwd(), "tools", "cloudsploit"))
-    if not authenticate.check_logged_in_cli(provider):
+    provider, profile = job['provider'], job['profile']
+    if not authenticate.check_logged_in_cli(provider, profile):
         print(f"Not logged into {provider}")
         return
 
-    if provider == "aws":
-        if authmethod == "cli":
-            credentials = authenticate.get_aws_credentials(profile)
-            authenticate.create_cloudsploit_config(provider, credentials)
-            
-            cmds = [
-                f"mkdir -p {output_dir}/cloudsploit/",
-                f"/usr/bin/env node index.js --config {cloudsploit_dir}/config.js --csv {output_dir}/{profile}/cloudsploit/cloudsploit-output.csv --json {output_dir}/{profile}/cloudsploit/cloudsploit-output.json --console none --cloud aws"
-                f'rm -f {cloudsploit_dir}/creds.json'
-            ]
-        else:
-            cmds = [f"echo '{RED}Other authentication methods not supported yet{NC}'"]
+    credentials = temp_app_details = None
+    if job['authmethod'] == 'cli' and adapter.uses_credentials:
+        credentials = authenticate.get_aws_credentials(profile) if provider == 'aws' else authenticate.get_azure_credentials(profile)
+        if provider == 'azure' and adapter.uses_temp_app and credentials:
+            # Check out an audit app registration from the pool
+            temp_app_details = get_temp_app_details(global_settings, credentials)
+            credentials.setdefault("application_id", temp_app_details["clientid"])
+            credentials.setdefault("key_value", temp_app_details["clientsecret"])
+
+    if adapter.runner == 'powershell':
+        return run_powershell_tool(global_settings, job, adapter, credentials, temp_app_details)
+
+    with adapter.prepare(job, credentials) as context:
+        cmds = adapter.commands(job, context)
+        if cmds is None:
+            print(f"{RED}Other authentication methods not supported yet{NC}")
+            return
         cmd = '; '.join(cmds)
-
-    elif provider == "azure":
-        if authmethod == "cli":
-            credentials = authenticate.get_azure_credentials(profile)
-            authenticate.create_cloudsploit_config(provider, credentials)
-            
-            # Check if temp_app_details already exist in global_settings
-            if "temp_app_details" in global_settings and all(key in global_settings["temp_app_details"] for key in ["clientid", "clientsecret"]):
-                temp_app_details = global_settings["temp_app_details"]
-            else:
-                # Create a temporary Azure app registration
-                temp_app_details = create_temp_azure_app(credentials.get("subscription_id"))
-                global_settings["temp_app_details"] = temp_app_details
-
-            clientid = temp_app_details["clientid"]
-            clientsecret = temp_app_details["clientsecret"]
-            credentials.setdefault("application_id", clientid)
-            credentials.setdefault("key_value", clientsecret)
-            authenticate.create_cloudsploit_config(provider, credentials)
-            
-            cmds = [
-                'trap "cleanup_temp_azure_app {}" EXIT'.format(clientid),  # Cleanup on exit
-                f"mkdir -p {output_dir}/cloudsploit/",
-                f"/usr/bin/env node index.js --config {cloudsploit_dir}/config.js --csv {output_dir}/{profile}/cloudsploit/cloudsploit-output.csv --json {output_dir}/{profile}/cloudsploit/cloudsploit-output.json --console none --cloud azure",
-                f'rm -f {cloudsploit_dir}/creds.json'
-            ]
-            cmd = '; '.join(cmds)
-        else:
-            cmd = f"echo '{RED}Other authentication methods not supported yet{NC}'"
-
-
-    print(f'Running CloudSploit with command: "{cmd}"')
-    interrupted = run_commands([cmd, f'echo "{GREEN}{BOLD}CloudSploit run completed!"{NC}'], cloudsploit_dir, print_output=True)
+        print(f'Running {adapter.name} with command: "{cmd}"')
+        interrupted = run_commands(cmds + [f"echo '{GREEN}{BOLD}{adapter.name} run completed!{NC}'"], adapter.tool_dir(),
+                                   print_output=True, env=adapter.environment())
     return interrupted
 
 
-def run_monkey365(provider="azure", authmethod="cli", profile='default', output_dir='output', global_settings={}):
+def run_powershell_tool(global_settings, job, adapter, credentials, temp_app_details):
     """
-    Run Monkey365 audit tool for cloud providers.
+    Run a PowerShell audit tool, such as Monkey365, for a single profile.
 
-    Args:
-        provider (str, optional): The cloud provider to run Monkey365 on. Defaults to "azure".
-        authmethod (str, optional): The authentication method to use. Defaults to "cli".
-        profile (str, optional): The Azure subscription to use for authentication and auditing. Defaults to "default".
+    The job runs in a warm PowerShell host that has already imported the tool's module, so successive
+    subscriptions don't pay the PowerShell startup and module import again.
 
     Returns:
-        None
+        bool: True if the execution was interrupted, False otherwise. None if the tool did not run.
     """
-    monkey365_dir = os.path.abspath(os.path.join(os.getcwd(), "tools", "monkey365"))
-    if not authenticate.check_logged_in_cli(provider):
-        print(f"Not logged into {provider}")
+    parameters = adapter.parameters(job, credentials, temp_app_details, global_settings)
+    if parameters is None:
+        print(f"{RED}Other authentication methods not supported yet{NC}")
         return
 
-    if provider == "azure":
-        if authmethod == "cli":
-            if "temp_app_details" in global_settings and all(key in global_settings["temp_app_details"] for key in ["clientid", "clientsecret"]):
-                temp_app_details = global_settings["temp_app_details"]
-            else:   
-                credentials = authenticate.get_azure_credentials(profile)
-                temp_app_details = create_temp_azure_app(credentials.get("subscription_id"))
-                global_settings["temp_app_details"] = temp_app_details
-
-            clientid = temp_app_details["clientid"]
-            clientsecret = temp_app_details["clientsecret"]
-
-
-            cmds = [
-                f'pwsh -c "$ClientSecret = \'{clientsecret}\' | ConvertTo-SecureString -AsPlainText -Force; Import-Module ./monkey365.psm1; Invoke-Monkey365 -ClientId {clientid} -ClientSecret $ClientSecret -Instance Azure -Analysis All -subscriptions {credentials.get("subscription_id")} -TenantID {credentials.get("directory_id")} -ExportTo CLIXML,EXCEL,CSV,JSON,HTML -OutDir {output_dir}/{profile}/monkey365/"'
-            ]
-            cmd = '; '.join(cmds)
+    print(f'Running {adapter.name} for profile {job["profile"]} in a PowerShell host')
+    try:
+        result = pwsh_host.run_job(adapter.tool_dir(), adapter.module, adapter.command, parameters,
+                                   secure=adapter.secure, log_file=getattr(job_output, 'log_file', None),
+                                   timeout=getattr(job_output, 'timeout', None), stall_timeout=getattr(job_output, 'stall_timeout', None),
+                                   on_error=getattr(job_output, 'on_error', None))
+    except KeyboardInterrupt:
+        print('Command interrupted by user.')
+        job_output.outcome = {'status': 'interrupted', 'returncode': None, 'errors': {}}
+        return True
+    except pwsh_host.PowerShellJobStopped as e:
+        print(f'{RED}{adapter.name} failed: {e}{NC}')
+        job_output.outcome = {'status': e.reason, 'returncode': None, 'errors': e.errors}
+        return False
+    except (OSError, pwsh_host.PowerShellHostError) as e:
+        print(f'{RED}{adapter.name} failed: {e}{NC}')
+        job_output.outcome = {'status': 'failed', 'returncode': None, 'errors': {}}
+        return False
+
+    job_output.outcome = {'status': 'ok' if result['status'] == 'ok' else 'failed', 'returncode': None, 'errors': result['errors']}
+    if result['status'] == 'ok':
+        print(f"{GREEN}{BOLD}{adapter.name} run completed in {result['duration']:.0f}s!{NC}")
+    else:
+        print(f"{RED}{adapter.name} failed: {result['message']}{NC}")
+    return False
 
-    print(f'Running Monkey365 with command: "{cmd}"')
-    interrupted = run_commands([cmd, f'echo "{GREEN}{BOLD}Monkey365 run completed!"{NC}'], monkey365_dir, print_output=True)
-    return interrupted
 
+def match_azure_profiles(patterns, profiles=None):
+    """
+    Selects the Azure profiles (subscriptions) that match one of the given patterns.
 
+    The patterns are shell-style wildcards matched case-insensitively against the profile name, which has the
+    form 'name (subscription id)', e.g. 'prod-*' or '*1234abcd*'. The pattern 'all' selects every subscription.
 
+    Args:
+        patterns (list[str]): The patterns.
+        profiles (list[str], optional): The profiles to select from. Defaults to all Azure CLI subscriptions.
 
+    Returns:
+        list[str]: The matching profiles, in the order of the Azure CLI.
+    """
+    if profiles is None:
+        profiles = authenticate.list_azure_profiles()
+    patterns = [pattern.lower() for pattern in patterns]
+    if 'all' in patterns:
+        return profiles
+    return [profile for profile in profiles
+            if any(fnmatch.fnmatch(profile.lower(), pattern) or fnmatch.fnmatch(profile.lower(), f'*({pattern})') for pattern in patterns)]
 
 
-def user_questions():
+def user_questions(azure_subscription_patterns=None):
     """
     Prompts the user with a series of questions to gather information about the cloud providers, authentication methods,
     profiles, and tools to be used for auditing.
 
+    Args:
+        azure_subscription_patterns (list[str], optional): Patterns selecting the Azure subscriptions to audit, see
+            match_azure_profiles(). If given, the Azure subscription menu is skipped. Defaults to None.
+
     Returns:
         dict: A dictionary containing the user's answers.
     """
@@ -405,14 +360,14 @@ def user_questions():
         'print_results': False
     }
     aws_tools_question = { 
-        'options': ['Prowler', 'ScoutSuite', 'CloudFox', 'CloudSploit'],
-        'default_counters': [1, 1, 1, 1],
+        'options': tool_adapters.tool_names('aws'),
+        'default_counters': [1] * len(tool_adapters.tool_names('aws')),
         'menu_text': 'Select the tools to run for AWS',
         'print_results': False
     }    
     azure_tools_question = { 
-        'options': ['Prowler', 'ScoutSuite', 'CloudFox', 'CloudSploit', 'Monkey365'],
-        'default_counters': [1, 1, 1, 1, 1],
+        'options': tool_adapters.tool_names('azure'),
+        'default_counters': [1] * len(tool_adapters.tool_names('azure')),
         'menu_text': 'Select the tools to run for Azure',
         'print_results': False
     }
@@ -449,6 +404,11 @@ def user_questions():
                                                                 menu_text=aws_profile_question['menu_text'], 
                                                                 bool_input=True, return_as_str=True)
                                                                 
+        # Select the Azure subscriptions from the patterns given on the command line
+        elif provider == 'azure' and 'cli' in authmethod_answers and azure_subscription_patterns:
+            profile_answers = match_azure_profiles(azure_subscription_patterns, azure_profile_question['options'])
+            print(f"{GREEN}Selected {len(profile_answers)} Azure subscription(s) matching {', '.join(azure_subscription_patterns)}{NC}")
+
         # If Azure has more than one available subscription, ask the user to select one    
         elif provider == 'azure' and 'cli' in authmethod_answers:# and len(azure_profile_question['options']) > 1:
             profile_answers = selectionmenu.make_menu_selection(azure_profile_question['options'],
@@ -456,7 +416,7 @@ def user_questions():
                                                                 menu_text=azure_profile_question['menu_text'], 
                                                                 bool_input=True, return_as_str=True)
         else:
-            profile_answers = 'default'
+            profile_answers = ['default']
 
         if provider == 'aws':
             tools_questions = aws_tools_question
@@ -473,88 +433,545 @@ def user_questions():
 
 
 
-def run_tools(global_settings):
+def run_preflight_checks(global_settings, min_valid_minutes=60):
     """
-    Run the selected tools for each provider based on the global settings.
+    Validates the credentials of all selected profiles concurrently before any tool is started.
+    Profiles that fail the check are removed from the answers, so no jobs are scheduled for them.
 
     Args:
         global_settings (dict): A dictionary containing the global settings.
+        min_valid_minutes (int, optional): Warn if credentials expire sooner than this. Defaults to 60.
+
+    Returns:
+        bool: True if at least one profile passed the checks, False otherwise.
+    """
+    targets = [(provider, profile) for provider, details in global_settings['answers'].items()
+               if 'cli' in details['authmethod'] for profile in details['profile']]
+    print(f'Running pre-flight checks for {len(targets)} profile(s)...')
+    results = authenticate.preflight_check_all(targets, min_valid_minutes)
+
+    for (provider, profile), (ok, message) in results.items():
+        status = f'{GREEN}OK{NC}' if ok else f'{RED}FAILED{NC}'
+        print(f'[{status}] {provider} - {profile}: {message}')
+
+    for provider in list(global_settings['answers']):
+        details = global_settings['answers'][provider]
+        details['profile'] = [profile for profile in details['profile'] if results.get((provider, profile), (True, ''))[0]]
+        if not details['profile']:
+            print(f'{RED}{BOLD}No usable profiles left for {provider}, skipping it{NC}')
+            del global_settings['answers'][provider]
+    return bool(global_settings['answers'])
+
+
+def run_job(global_settings, job):
+    """
+    Run a single tool for a single profile.
+
+    Args:
+        global_settings (dict): A dictionary containing the global settings.
+        job (dict): The job, with the keys provider, authmethod, tool, profile and output_dir.
 
     Returns:
         bool: True if the execution was interrupted, False otherwise.
     """
-    interrupted = False
+    provider, authmethod, tool = job['provider'], job['authmethod'], job['tool']
+    adapter = tool_adapters.get_adapter(tool)
+    if adapter is None or provider not in adapter.providers:
+        print(f'{RED}{tool} is not available for {provider}{NC}')
+        return False
+    print(f'Running {tool} with {authmethod} for {provider}')
+    return run_tool(global_settings, job, adapter)
+
+
+def run_job_supervised(global_settings, job):
+    """
+    Run a job with the timeouts of its tool, and retry it with exponential backoff after a transient failure.
+
+    The state of every attempt is recorded in {output_dir}/job_states.json (see supervisor.JobStates), so one
+    account that keeps failing doesn't hold up an unattended run, and the failed jobs can be reviewed afterwards.
+
+    Args:
+        global_settings (dict): A dictionary containing the global settings.
+        job (dict): The job, with the keys provider, authmethod, tool, profile and output_dir.
+
+    Returns:
+        bool: True if the execution was interrupted, False otherwise.
+    """
+    states = global_settings['job_states']
+    retries = global_settings.get('retries', DEFAULT_RETRIES)
+    job_output.timeout = global_settings.get('tool_timeouts', DEFAULT_TOOL_TIMEOUTS).get(job['tool'], 0) * 60 or None
+    stall_timeout = global_settings.get('stall_timeout', DEFAULT_STALL_TIMEOUT)
+    job_output.stall_timeout = None if job['tool'] in STALL_TIMEOUT_EXEMPT_TOOLS else stall_timeout * 60 or None
+
+    for attempt in range(1, retries + 2):
+        job_output.outcome = None
+        start = time.monotonic()
+        states.update(job, 'running', attempt=attempt)
+        interrupted = run_job(global_settings, job)
+        # The cached output indexes of the run don't know the files the job wrote
+        output_index.invalidate_output_index(os.path.join(job['output_dir'], job['profile']))
+        # Jobs that didn't start a tool, e.g. because the profile is not logged in, have no outcome
+        outcome = job_output.outcome or {'status': 'skipped', 'returncode': None, 'errors': {}}
+        details = {'attempt': attempt, 'duration': round(time.monotonic() - start), 'returncode': outcome['returncode'], 'errors': outcome['errors']}
+        if interrupted:
+            states.update(job, 'interrupted', **details)
+            return True
+
+        # Only pooled app registrations get fresh credentials when the job is retried, CLI sessions have to be renewed by the user
+        adapter = tool_adapters.get_adapter(job['tool'])
+        can_refresh = job['provider'] == 'azure' and job['authmethod'] == 'cli' and getattr(adapter, 'uses_temp_app', False)
+        reason = supervisor.retry_reason(outcome, can_refresh)
+        if outcome['errors'].get('expired session') and not can_refresh:
+            print(f"{RED}{scheduler.job_name(job)} failed: the session of {job['profile']} expired, re-authenticate "
+                  f"(e.g. with 'aws sso login' or 'az login') and run it again{NC}")
+            states.update(job, 'failed', reason='expired session, re-authenticate', **details)
+            return False
+        if reason and attempt <= retries:
+            delay = supervisor.backoff_delay(attempt)
+            print(f'{YELLOW}{scheduler.job_name(job)} failed ({reason}), retrying in {delay:.0f}s (attempt {attempt + 1}/{retries + 1}){NC}')
+            states.update(job, 'retrying', reason=reason, **details)
+            try:
+                if supervisor.wait_for_retry(delay):
+                    states.update(job, 'interrupted', **details)
+                    return True
+            except KeyboardInterrupt:
+                states.update(job, 'interrupted', **details)
+                return True
+            continue
+
+        if outcome['status'] == 'ok':
+            # A tool that exits cleanly without writing its output is worth a look in the job states
+            artifacts = adapter.find_artifacts(job)
+            details['artifacts'] = len(artifacts)
+            details['output_bytes'] = sum(os.path.getsize(path) for path in artifacts)
+            if global_settings.get('job_history'):
+                global_settings['job_history'].record(job, time.monotonic() - start, details['output_bytes'])
+        states.update(job, 'succeeded' if outcome['status'] == 'ok' else outcome['status'], reason=reason, **details)
+        return False
+
+
+def job_state(global_settings, job):
+    """Returns the state of a job in the job states, e.g. 'succeeded' or 'failed', or None if it has none."""
+    entry = global_settings['job_states'].get(job)
+    return entry['state'] if entry else None
+
+
+def run_job_logged(global_settings, job):
+    """
+    Run a job with its output written to {output_dir}/{profile}/logs/<tool>.log, for jobs that run in parallel.
+
+    With an adaptive concurrency controller in global_settings['concurrency'], throttling in the output of the job
+    lowers the concurrency limit of its tenant/account right away, and a job without throttling raises it again.
+    """
+    log_dir = os.path.join(job['output_dir'], job['profile'], 'logs')
+    os.makedirs(log_dir, exist_ok=True)
+    job_output.log_file = os.path.join(log_dir, f"{job['tool'].lower()}.log")
+    controller = global_settings.get('concurrency')
+    if controller:
+        job_output.on_error = lambda kind: controller.throttled(job['group']) if kind == 'throttling' else None
+    started = time.monotonic()
+    try:
+        return run_job_supervised(global_settings, job)
+    finally:
+        job_output.log_file = None
+        job_output.on_error = None
+        if controller:
+            controller.job_finished(job['group'], started)
+
+
+def print_job_states(global_settings):
+    """Prints the number of jobs per state, and the jobs that did not succeed."""
+    states = global_settings['job_states']
+    counts = states.counts()
+    if not counts:
+        return
+    print(f"{GREEN}{BOLD}Jobs: {', '.join(f'{count} {state}' for state, count in sorted(counts.items()))}{NC}")
+    for name, entry in states.unsuccessful():
+        reason = f", {entry['reason']}" if entry.get('reason') else ''
+        print(f"{RED}  {name}: {entry['state']} after {entry.get('attempt', entry.get('leases', 1))} attempt(s){reason}{NC}")
+
+
+def create_jobs(global_settings):
+    """
+    Create the list of jobs for all selected providers, authentication methods, tools and profiles.
+
+    Each job gets a group: the tenant for Azure subscriptions and the profile for AWS, which is used to limit
+    the number of scans running against the same tenant or account at the same time.
+
+    Args:
+        global_settings (dict): A dictionary containing the global settings.
+
+    Returns:
+        list[dict]: The jobs, in the order the tools were selected.
+    """
+    jobs = []
     for provider, details in global_settings['answers'].items():
-        authmethods = details['authmethod']
-        tools = details['tools']
-        profiles = details['profile']
-        
         # create a directory to store the output of the tools, based on the current date and time
         output_dir = global_settings['base_output_dir'].format(provider)
         os.makedirs(output_dir, exist_ok=True)
 
-        # Run the selected tools for the provider
-        for authmethod in authmethods:
-            for tool in tools:
-                for profile in profiles:
-                    if interrupted:
-                        break
-                    if tool == 'Prowler':
-                        print(f'Running {tool} with {authmethod} for {provider}')
-                        interrupted = run_prowler(provider, authmethod, profile, output_dir)
-                    elif tool == 'ScoutSuite':
-                        print(f'Running {tool} with {authmethod} for {provider}')
-                        interrupted = run_scoutsuite(provider, authmethod, profile, output_dir)
-                    elif tool == 'CloudFox':
-                        print(f'Running {tool} with {authmethod} for {provider}')
-                        interrupted = run_cloudfox(provider, authmethod, profile, output_dir)
-                    elif tool == 'CloudSploit':
-                        print(f'Running {tool} with {authmethod} for {provider}')
-                        interrupted = run_cloudsploit(provider, authmethod, profile, output_dir, global_settings)
-                    elif tool == 'Monkey365':
-                        print(f'Running {tool} with {authmethod} for {provider}')
-                        interrupted = run_monkey365(provider, authmethod, profile, output_dir, global_settings)
+        for authmethod in details['authmethod']:
+            for tool in details['tools']:
+                for profile in details['profile']:
+                    group = profile
+                    if provider == 'azure':
+                        group = (authenticate.get_azure_credentials(profile) or {}).get('directory_id') or profile
+                    jobs.append({'provider': provider, 'authmethod': authmethod, 'tool': tool, 'profile': profile,
+                                 'output_dir': output_dir, 'group': f'{provider}:{group}'})
+    return jobs
+
+
+def run_tools(global_settings, on_job_done=None):
+    """
+    Run the selected tools for each provider based on the global settings.
+
+    With global_settings['max_parallel'] above 1, the jobs run in parallel (fan-out mode), limited per tool by
+    global_settings['tool_limits'], per tenant/account by global_settings['group_limit'] and by the CPU and memory
+    of the machine, using the expected resource use the tool adapters declare. The tenant/account limit is
+    lowered while the cloud APIs throttle the jobs, unless global_settings['adaptive_concurrency'] is False.
+    The jobs that took longest in earlier runs (see job_history.JobHistory) are started first, and the progress
+    messages show the expected remaining time.
+    The output of parallel jobs is written to log files in the profile folders.
+
+    Args:
+        global_settings (dict): A dictionary containing the global settings.
+        on_job_done (callable, optional): Called with each job that finished without being interrupted and its final
+            state, e.g. 'succeeded' or 'failed' (see supervisor.JobStates), e.g. to start analyzing its output. Defaults to None.
+
+    Returns:
+        bool: True if the execution was interrupted, False otherwise.
+    """
+    jobs = create_jobs(global_settings)
+    max_parallel = global_settings.get('max_parallel', 1)
+    global_settings.setdefault('job_states', supervisor.JobStates())
+    history = global_settings.setdefault('job_history', job_history.JobHistory())
+
+    if max_parallel <= 1:
+        interrupted = False
+        for number, job in enumerate(jobs):
+            if interrupted:
+                break
+            seconds = scheduler.estimate_remaining(jobs[number:], [], history.estimate, 1)
+            print(f'{GREEN}Job {number + 1}/{len(jobs)}, about {scheduler.format_duration(seconds)} left{NC}')
+            interrupted = run_job_supervised(global_settings, job)
+            if on_job_done and not interrupted:
+                on_job_done(job, job_state(global_settings, job))
+        print_job_states(global_settings)
+        return interrupted
+
+    # Check out the shared audit app registrations before the jobs start, so the jobs don't wait for each other
+    azure_profiles = [job['profile'] for job in jobs if job['provider'] == 'azure' and job['authmethod'] == 'cli'
+                      and getattr(tool_adapters.get_adapter(job['tool']), 'uses_temp_app', False)]
+    if azure_profiles:
+        prepare_temp_apps(global_settings, list(dict.fromkeys(azure_profiles)))
+
+    # Adapt the concurrency per tenant/account to the throttling of the cloud APIs, up to the configured limit
+    group_limit = global_settings.get('group_limit')
+    if global_settings.get('adaptive_concurrency', True):
+        group_limit = global_settings['concurrency'] = scheduler.AIMDController(group_limit or max_parallel)
+
+    # Start the longest jobs first, so a large account scanned last doesn't keep the run going on its own
+    jobs = history.sort_longest_first(jobs)
+    seconds = scheduler.estimate_remaining(jobs, [], history.estimate, max_parallel)
+    print(f'{GREEN}{BOLD}Running {len(jobs)} jobs with up to {max_parallel} in parallel, expected to take about {scheduler.format_duration(seconds)}, '
+          f'logs are written to <output>/<profile>/logs/{NC}')
+    interrupted, _ = scheduler.run_jobs(jobs, lambda job: run_job_logged(global_settings, job), max_parallel,
+                                        global_settings.get('tool_limits', DEFAULT_TOOL_LIMITS), group_limit,
+                                        on_job_done and (lambda job: on_job_done(job, job_state(global_settings, job))),
+                                        on_interrupt=supervisor.interrupt_all,
+                                        job_resources=lambda job: tool_adapters.get_adapter(job['tool']).resources(),
+                                        capacity=scheduler.machine_capacity(), estimate=history.estimate,
+                                        on_skip=lambda job, reason: global_settings['job_states'].update(job, 'skipped', reason=reason))
+    print_job_states(global_settings)
     return interrupted
 
 
-def post_run_actions(global_settings, interrupted=False):
+def return_temp_apps(global_settings):
+    """Returns the audit app registrations to the pool, and cleans up the ones that expire soon."""
+    if global_settings.get('sp_leases'):
+        print("Returning audit app registrations to the pool...")
+        # Subscriptions of the same tenant share a lease
+        for clientid, lease_id in {(details['clientid'], lease_id) for details, lease_id in global_settings['sp_leases'].values()}:
+            sp_pool.return_principal(clientid, lease_id)
+        global_settings['sp_leases'] = {}
+        sp_pool.cleanup_expired_principals()
+
+
+def run_coordinator(global_settings, queue_url, on_job_done=None):
+    """
+    Queue the jobs of all selected tools and profiles for workers on other hosts, and wait until they are done.
+
+    The workers (see run_worker()) write to the same output folders, so these must be on a filesystem all hosts
+    share, at the same path. Jobs whose worker stops sending heartbeats are queued again for another worker.
+    The progress is recorded in {output_dir}/job_states.json like for local runs.
+
+    Args:
+        global_settings (dict): A dictionary containing the global settings.
+        queue_url (str): The job queue, see job_queue.open_queue(), e.g. 'tcp://0.0.0.0:8765' or 'sqlite:///shared/queue.db'.
+        on_job_done (callable, optional): Called with each job that finished without being interrupted and its final
+            state. Defaults to None.
+
+    Returns:
+        bool: True if the execution was interrupted, False otherwise.
+    """
+    queue, server = job_queue.open_queue(queue_url, serve=True)
+    history = global_settings.setdefault('job_history', job_history.JobHistory())
+    # The workers claim the jobs in queue order, so the longest jobs start first
+    jobs = history.sort_longest_first(create_jobs(global_settings))
+    settings = {key: global_settings[key] for key in WORKER_SETTINGS if key in global_settings}
+    run = str(uuid.uuid4())
+    queue.enqueue(run, [dict(job, settings=settings) for job in jobs])
+    states = global_settings.setdefault('job_states', supervisor.JobStates())
+    print(f'{GREEN}{BOLD}Queued {len(jobs)} jobs, start the workers with: python3 autoCloudAudit.py --worker {queue_url}{NC}')
+
+    seen = {}
+    leased_since = {}
+    progress = None
+    interrupted = False
+    try:
+        while True:
+            queue.requeue_expired()
+            entries = queue.status(run)
+            for entry in entries:
+                job = {key: value for key, value in entry['job'].items() if key != 'settings'}
+                if seen.get(entry['id']) == (entry['state'], entry['worker']):
+                    continue
+                seen[entry['id']] = (entry['state'], entry['worker'])
+                if entry['state'] == 'leased':
+                    leased_since[entry['id']] = time.monotonic()
+                    states.update(job, 'running', worker=entry['worker'], leases=entry['attempts'])
+                elif entry['state'] == 'done':
+                    result = entry['result'] or {'state': 'failed'}
+                    if result['state'] == 'succeeded' and result.get('duration') is not None:
+                        history.record(job, result['duration'], result.get('output_bytes'))
+                    state = result.pop('state')
+                    states.update(job, state, worker=entry['worker'], leases=entry['attempts'], **result)
+                    print(f"{GREEN}Finished {scheduler.job_name(job)} on {entry['worker']}{NC}")
+                    if on_job_done:
+                        on_job_done(job, state)
+                elif entry['state'] == 'lost':
+                    states.update(job, 'lost', worker=entry['worker'], leases=entry['attempts'])
+                    print(f"{RED}Gave up on {scheduler.job_name(job)}, its workers stopped responding{NC}")
+
+            counts = {}
+            for entry in entries:
+                counts[entry['state']] = counts.get(entry['state'], 0) + 1
+            if counts != progress:
+                progress = counts
+                # The workers run about as many jobs at the same time as they are running now
+                leased = [(entry['job'], leased_since.get(entry['id'], time.monotonic())) for entry in entries if entry['state'] == 'leased']
+                queued = [entry['job'] for entry in entries if entry['state'] == 'queued']
+                seconds = scheduler.estimate_remaining(queued, leased, history.estimate, len(leased))
+                print(f"Jobs: {', '.join(f'{count} {state}' for state, count in sorted(counts.items()))}, about {scheduler.format_duration(seconds)} left")
+            if not counts.get('queued') and not counts.get('leased'):
+                break
+            time.sleep(QUEUE_POLL_SECONDS)
+    except KeyboardInterrupt:
+        interrupted = True
+        print(f'{YELLOW}Interrupted, cancelled {queue.cancel(run)} queued jobs. Jobs already running on workers are not waited for.{NC}')
+    finally:
+        if server:
+            server.shutdown()
+    print_job_states(global_settings)
+    return interrupted
+
+
+def run_worker(queue_url, max_parallel=1, worker_id=None, idle_exit=None):
+    """
+    Run jobs from the queue of a coordinator (see run_coordinator()) until interrupted.
+
+    Each job runs like in a local fan-out run, with its output written to the shared output folder and its log to
+    {output_dir}/{profile}/logs/. The worker extends the lease of its jobs with heartbeats, and gives them back to
+    the queue when it is interrupted.
+
+    Args:
+        queue_url (str): The job queue, see job_queue.open_queue().
+        max_parallel (int, optional): The number of jobs this worker runs at the same time. Defaults to 1.
+        worker_id (str, optional): The name of the worker in the job states. Defaults to the host name and process id.
+        idle_exit (float, optional): Stop after this many seconds without jobs. Defaults to None (never stop).
+    """
+    queue, _ = job_queue.open_queue(queue_url)
+    worker_id = worker_id or f'{os.uname().nodename}:{os.getpid()}'
+    global_settings = {'sp_leases': {}, 'job_states': supervisor.JobStates(save=False)}
+    heartbeat_seconds = job_queue.DEFAULT_LEASE_SECONDS / 4
+    print(f'{GREEN}{BOLD}Worker {worker_id} running up to {max_parallel} jobs from {queue_url}, use Ctrl+C to stop it...{NC}')
+
+    def run_slot():
+        idle_since = time.monotonic()
+        while not supervisor.interrupt_event.is_set():
+            try:
+                claimed = queue.claim(worker_id)
+            except job_queue.JobQueueError as e:
+                print(f'{RED}{e}{NC}')
+                claimed = None
+            if claimed is None:
+                if idle_exit is not None and time.monotonic() - idle_since > idle_exit:
+                    return
+                supervisor.interrupt_event.wait(QUEUE_POLL_SECONDS)
+                continue
+
+            job_id, job = claimed
+            job_settings = dict(global_settings, **job.pop('settings', {}))
+            finished = threading.Event()
+
+            def send_heartbeats():
+                while not finished.wait(heartbeat_seconds):
+                    try:
+                        if not queue.heartbeat(job_id, worker_id):
+                            print(f'{YELLOW}Lost the lease of {scheduler.job_name(job)}, another worker may run it as well{NC}')
+                    except job_queue.JobQueueError as e:
+                        print(f'{RED}{e}{NC}')
+
+            print(f'{GREEN}Starting {scheduler.job_name(job)}{NC}')
+            heartbeats = threading.Thread(target=send_heartbeats, daemon=True)
+            heartbeats.start()
+            try:
+                interrupted = run_job_logged(job_settings, job)
+            finally:
+                finished.set()
+                heartbeats.join()
+            try:
+                if interrupted:
+                    queue.release(job_id, worker_id)
+                else:
+                    queue.complete(job_id, worker_id, global_settings['job_states'].get(job))
+                    print(f'{GREEN}Finished {scheduler.job_name(job)}{NC}')
+            except job_queue.JobQueueError as e:
+                print(f'{RED}Could not report {scheduler.job_name(job)} to the coordinator: {e}{NC}')
+            idle_since = time.monotonic()
+
+    slots = [threading.Thread(target=run_slot) for _ in range(max(1, max_parallel))]
+    for slot in slots:
+        slot.start()
+    try:
+        for slot in slots:
+            while slot.is_alive():
+                slot.join(1)
+    except KeyboardInterrupt:
+        print(f'{YELLOW}Interrupted, stopping the running jobs and giving them back to the queue...{NC}')
+        supervisor.interrupt_all()
+        for slot in slots:
+            slot.join()
+    finally:
+        return_temp_apps(global_settings)
+
+
+def post_run_actions(global_settings, interrupted=False, pipeline=None):
     """
     Perform post-run actions after the audit tools have finished running.
 
     Args:
         global_settings (dict): The global settings for the audit.
         interrupted (bool, optional): Indicates if the audit was interrupted. Defaults to False.
+        pipeline (analysis_pipeline.AnalysisPipeline, optional): The pipeline that categorized the output of the
+            jobs while the scans were running. Defaults to None, which categorizes everything now.
     """
-    # Cleanup temporary Azure app registration if it was created
-    if 'temp_app_details' in global_settings and 'clientid' in global_settings['temp_app_details']:
-        print("Cleaning up temporary Azure app registration...")
-        cleanup_temp_azure_app(global_settings['temp_app_details']['clientid'])
+    return_temp_apps(global_settings)
     
     # Analyze the output of the tools
     for provider, details in global_settings['answers'].items():
         output_dir = global_settings['base_output_dir'].format(provider)
+        output_index.invalidate_output_index(output_dir)
+
+        # Compute the aggregate cube of the run once, the summaries are answered from it
+        summary_cube.get_cube(output_dir, provider)
     
         for tool in details['tools']:
-            if tool == 'Prowler':
-                analyze.summarize_prowler(output_dir, provider)
-            elif tool == 'ScoutSuite':
-                analyze.summarize_scoutsuite(output_dir, provider)
-            elif tool == 'CloudFox':
-                analyze.summarize_cloudfox(output_dir, provider)
-            elif tool == 'CloudSploit':
-                analyze.summarize_cloudsploit(output_dir, provider)
-            elif tool == 'Monkey365':
-                analyze.summarize_monkey365(output_dir, provider)
-
-        # Categorize all detected issues
-        analyze.categorize_all_tools_issues(output_dir, provider)
-
-        # Run Prowler dashboard in the background
-        print('Starting Prowler dashboard, use Ctrl+C to stop it...')
-        prowler_dir = os.path.abspath(os.path.join(os.getcwd(), 'tools', 'prowler'))
-        cmd = 'prowler dashboard'
-        interrupted = run_commands([f'source {prowler_dir}/venv_prowler/bin/activate', cmd, 'deactivate', f"echo '{GREEN}{BOLD}Prowler dashboard completed!{NC}'"], f'{output_dir}/prowler', print_output=True)
-    
+            adapter = tool_adapters.get_adapter(tool)
+            if adapter is not None and adapter.summarize is not None:
+                adapter.summarize(output_dir, provider)
+
+        # Categorize all detected issues, using the results the pipeline already produced during the scans
+        if pipeline is not None and pipeline.has_results(output_dir, provider):
+            mapped_checks = pipeline.wait(output_dir, provider)
+            skipped = pipeline.skipped_jobs(output_dir, provider)
+            if skipped:
+                print(f'{YELLOW}The output of {len(skipped)} unsuccessful job(s) is not included in the categorized issues: '
+                      f"{', '.join(f'{tool} for {profile} ({state})' for tool, profile, state in skipped)}{NC}")
+            analyze.sort_categorized_issues(mapped_checks)
+            analyze.export_categorized_issues(mapped_checks, output_dir, provider)
+        else:
+            mapped_checks = analyze.categorize_all_tools_issues(output_dir, provider)
+
+        # Record the run in the catalog, so it can be listed and filtered without reading the run folder
+        job_states = global_settings.get('job_states')
+        try:
+            run_catalog.RunCatalog().record_run(output_dir, provider, interrupted, job_states.counts(output_dir) if job_states else None,
+                                                run_catalog.count_issues(mapped_checks or {}))
+        except (OSError, sqlite3.Error) as e:
+            print(f'{RED}Could not record the run in the catalog: {e}{NC}')
+
+    # Serve the categorized issues of all providers in the background
+    output_dirs = [global_settings['base_output_dir'].format(provider) for provider in global_settings['answers']]
+    server, url = report_server.start_report_server(output_dirs, global_settings.get('report_port', 8000))
+    if server is None:
+        return
+    print(f'{GREEN}{BOLD}Report server running at {url}, use Ctrl+C to stop it...{NC}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(f'{GREEN}{BOLD}Report server stopped!{NC}')
+
+
+def parse_tool_limits(values, defaults=DEFAULT_TOOL_LIMITS, minimum=1):
+    """
+    Parses tool limits of the form Tool=N, e.g. CloudSploit=1, into a dictionary on top of the defaults.
+
+    Raises:
+        ValueError: If a value is not of the form Tool=N, or N is below minimum.
+    """
+    tool_limits = dict(defaults)
+    for value in values or []:
+        tool, _, limit = value.partition('=')
+        try:
+            tool_limits[tool] = int(limit)
+        except ValueError:
+            raise ValueError(f"expected TOOL=N, got '{value}'")
+        if not tool or tool_limits[tool] < minimum:
+            raise ValueError(f"the value of {tool or value} must be at least {minimum}, got '{value}'")
+    return tool_limits
+
+
+def tool_limit_argument(minimum):
+    """Returns an argparse type that checks a Tool=N argument with parse_tool_limits()."""
+    def check(value):
+        try:
+            parse_tool_limits([value], {}, minimum)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+        return value
+    return check
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Run multiple cloud security audit tools and analyze their results.')
+    parser.add_argument('--azure-subscriptions', nargs='+', metavar='PATTERN',
+                        help="Audit the Azure subscriptions matching these patterns (e.g. 'prod-*', a subscription ID, or 'all') instead of selecting them in a menu")
+    parser.add_argument('--max-parallel', type=int, default=1, help='Maximum number of tool runs at the same time (default: 1, sequential)')
+    parser.add_argument('--tenant-limit', type=int, default=None, help='Maximum number of tool runs at the same time per Azure tenant or AWS profile')
+    parser.add_argument('--no-adaptive-concurrency', action='store_true',
+                        help='Keep the tenant limit fixed, instead of lowering it temporarily when a tenant or account is throttled')
+    parser.add_argument('--tool-limit', nargs='+', default=[], metavar='TOOL=N', type=tool_limit_argument(1),
+                        help='Maximum number of runs at the same time per tool, e.g. Prowler=2 (default: no limits)')
+    parser.add_argument('--tool-timeout', nargs='+', default=[], metavar='TOOL=MINUTES', type=tool_limit_argument(0),
+                        help=f"Maximum run time per tool in minutes, 0 for no limit (default: {', '.join(f'{tool}={minutes}' for tool, minutes in DEFAULT_TOOL_TIMEOUTS.items())})")
+    parser.add_argument('--stall-timeout', type=int, default=DEFAULT_STALL_TIMEOUT,
+                        help=f'Stop a tool run that writes no output for this many minutes, 0 to disable (default: {DEFAULT_STALL_TIMEOUT})')
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help=f'Number of retries after throttling, an expired session of a pooled app registration or a stalled run (default: {DEFAULT_RETRIES})')
+    parser.add_argument('--coordinator', metavar='QUEUE_URL',
+                        help="Queue the jobs for workers on other hosts instead of running them, e.g. tcp://0.0.0.0:8765 or sqlite:///shared/queue.db")
+    parser.add_argument('--worker', metavar='QUEUE_URL',
+                        help='Run jobs from the queue of a coordinator, with up to --max-parallel jobs at the same time')
+    parser.add_argument('--analysis-workers', type=int, default=None,
+                        help='Number of processes that analyze finished tool output while the scans run (default: number of CPUs)')
+    parser.add_argument('--report-port', type=int, default=8000, help='Port of the report server started after the analysis (default: 8000)')
+    parser.add_argument('--monkey365-export', nargs='+', metavar='FORMAT', type=str.upper,
+                        choices=['JSON', 'CSV', 'HTML', 'EXCEL', 'CLIXML'],
+                        help='Additional Monkey365 export formats, e.g. HTML for its own report (JSON is always exported for the analysis)')
+    return parser.parse_args()
 
 
 def main():
@@ -566,11 +983,37 @@ def main():
     2. Executes the cloud auditing tools with the settings gathered.
     3. Performs post-run actions, such as generating the reports and cleaning up.
     """
+    args = parse_arguments()
+    if args.worker:
+        run_worker(args.worker, args.max_parallel)
+        return
+    authenticate.print_login_status()
     global_settings = {}
-    global_settings['answers'] = user_questions()
+    global_settings['max_parallel'] = args.max_parallel
+    global_settings['group_limit'] = args.tenant_limit
+    global_settings['adaptive_concurrency'] = not args.no_adaptive_concurrency
+    global_settings['tool_limits'] = parse_tool_limits(args.tool_limit)
+    global_settings['tool_timeouts'] = parse_tool_limits(args.tool_timeout, DEFAULT_TOOL_TIMEOUTS, minimum=0)
+    global_settings['stall_timeout'] = args.stall_timeout
+    global_settings['retries'] = args.retries
+    global_settings['report_port'] = args.report_port
+    global_settings['monkey365_formats'] = list(dict.fromkeys(analyze.MONKEY365_EXPORT_FORMATS + (args.monkey365_export or [])))
+    global_settings['answers'] = user_questions(args.azure_subscriptions)
+    if not run_preflight_checks(global_settings):
+        return
     global_settings['base_output_dir'] = os.path.abspath(os.path.join(os.getcwd(), "output", '{}-' + datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")))
-    run_tools(global_settings)
-    post_run_actions(global_settings, False)
+
+    # Categorize the output of every job in the background as soon as it finishes
+    pipeline = analysis_pipeline.AnalysisPipeline(args.analysis_workers)
+    try:
+        on_job_done = lambda job, state: pipeline.submit(job['output_dir'], job['provider'], job['tool'], job['profile'], state)
+        if args.coordinator:
+            interrupted = run_coordinator(global_settings, args.coordinator, on_job_done)
+        else:
+            interrupted = run_tools(global_settings, on_job_done)
+        post_run_actions(global_settings, interrupted, pipeline)
+    finally:
+        pipeline.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,273 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import concurrent.futures
+import datetime
+import email.utils
+import json
+import os
+import subprocess
+import threading
+import time
+import uuid
+
+import authenticate
+from lazyimport import lazy_import
+
+requests = lazy_import('requests')
+
+# Base URLs of Microsoft Graph and Azure Resource Manager. Point them to a local mock server for testing,
+# e.g. the one in azure_rest_mock.py, together with AUTOCLOUDAUDIT_AZURE_TOKEN.
+GRAPH_URL = os.environ.get('AUTOCLOUDAUDIT_GRAPH_URL', 'https://graph.microsoft.com/v1.0').rstrip('/')
+ARM_URL = os.environ.get('AUTOCLOUDAUDIT_ARM_URL', 'https://management.azure.com').rstrip('/')
+ARM_API_VERSION = '2022-04-01'
+
+# Token resources, and the hosts under which the Azure CLI stores their tokens in the MSAL cache
+RESOURCES = {
+    'graph': ('https://graph.microsoft.com', ['graph.microsoft.com']),
+    'arm': ('https://management.azure.com/', ['management.core.windows.net', 'management.azure.com']),
+}
+
+# Status codes that are retried, honouring the Retry-After header if present
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+MAX_RETRIES = 5
+# The longest wait in seconds before a retry, whatever the Retry-After header asks for
+MAX_RETRY_DELAY = 60
+
+# Shared HTTP session and access tokens, so all requests reuse the same connections
+_session = None
+_session_lock = threading.Lock()
+_tokens = {}
+
+
+class AzureRestError(Exception):
+    '''Raised when a request to Microsoft Graph or Azure Resource Manager fails.'''
+    def __init__(self, status_code, message):
+        super().__init__(f'{status_code}: {message}')
+        self.status_code = status_code
+        self.message = message
+
+
+def get_session(pool_size=16):
+    '''
+    Returns the shared HTTP session, creating it on first use.
+
+    Args:
+        pool_size (int, optional): The number of connections kept open per host. Defaults to 16.
+
+    Returns:
+        requests.Session: The session.
+    '''
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+    return _session
+
+
+def get_access_token(resource='graph', tenant_id=None):
+    '''
+    Returns an access token for Microsoft Graph or Azure Resource Manager.
+
+    The token is taken from the environment variable AUTOCLOUDAUDIT_AZURE_TOKEN (for mock servers), from tokens
+    fetched earlier, from the Azure CLI token cache, or as last resort from 'az account get-access-token'.
+
+    Args:
+        resource (str, optional): Either 'graph' or 'arm'. Defaults to 'graph'.
+        tenant_id (str, optional): The tenant the token must be issued for. Defaults to None, which accepts any tenant.
+
+    Returns:
+        str: The access token.
+    '''
+    if os.environ.get('AUTOCLOUDAUDIT_AZURE_TOKEN'):
+        return os.environ['AUTOCLOUDAUDIT_AZURE_TOKEN']
+
+    now = time.time()
+    cached = _tokens.get((resource, tenant_id))
+    if cached and cached[1] > now + 300:
+        return cached[0]
+
+    resource_url, hosts = RESOURCES[resource]
+    token = authenticate.get_cached_access_token(hosts, tenant_id)
+    if token is None:
+        cmd = ['az', 'account', 'get-access-token', '--resource', resource_url, '--output', 'json']
+        if tenant_id:
+            cmd += ['--tenant', tenant_id]
+        result = json.loads(subprocess.check_output(cmd).decode())
+        expires_on = result.get('expires_on') or datetime.datetime.fromisoformat(result['expiresOn']).timestamp()
+        token = (result['accessToken'], int(expires_on))
+    _tokens[(resource, tenant_id)] = token
+    return token[0]
+
+
+def retry_delay(retry_after, attempt):
+    '''
+    Returns the seconds to wait before retrying a throttled or failed request.
+
+    The Retry-After header is either a number of seconds or an HTTP date. Without a usable header the delay
+    doubles with every attempt. The delay is capped at MAX_RETRY_DELAY.
+
+    Args:
+        retry_after (str): The Retry-After header of the response, or None.
+        attempt (int): The number of the failed attempt, starting at 0.
+
+    Returns:
+        float: The delay in seconds.
+    '''
+    delay = 2 ** attempt
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            try:
+                retry_at = email.utils.parsedate_to_datetime(retry_after)
+                delay = (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                pass
+    return min(max(delay, 0), MAX_RETRY_DELAY)
+
+
+def request(method, api, path, tenant_id=None, params=None, body=None):
+    '''
+    Sends a request to Microsoft Graph or Azure Resource Manager over the shared session.
+
+    Throttled and failed requests are retried with backoff. Responses with a nextLink are followed and their
+    'value' lists are concatenated.
+
+    Args:
+        method (str): The HTTP method.
+        api (str): Either 'graph' or 'arm'.
+        path (str): The path relative to the API base URL, or an absolute URL.
+        tenant_id (str, optional): The tenant to get the access token for. Defaults to None.
+        params (dict, optional): The query parameters. For ARM the api-version is added automatically.
+        body (dict, optional): The JSON body. Defaults to None.
+
+    Returns:
+        dict: The parsed JSON response, or an empty dictionary if the response has no content.
+    '''
+    base_url = GRAPH_URL if api == 'graph' else ARM_URL
+    url = path if path.startswith('http') else f'{base_url}{path}'
+    params = dict(params or {})
+    if api == 'arm' and 'api-version=' not in url:
+        params.setdefault('api-version', ARM_API_VERSION)
+    headers = {'Authorization': f'Bearer {get_access_token(api, tenant_id)}'}
+
+    for attempt in range(MAX_RETRIES + 1):
+        response = get_session().request(method, url, params=params, json=body, headers=headers, timeout=60)
+        if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+            break
+        time.sleep(retry_delay(response.headers.get('Retry-After'), attempt))
+
+    if response.status_code >= 400:
+        try:
+            error = response.json().get('error', {})
+            message = error.get('message', '') if isinstance(error, dict) else str(error)
+        except ValueError:
+            message = response.text
+        raise AzureRestError(response.status_code, message)
+    if not response.content:
+        return {}
+
+    data = response.json()
+    next_link = data.get('@odata.nextLink') or data.get('nextLink')
+    if next_link and 'value' in data:
+        data['value'] += request(method, api, next_link, tenant_id).get('value', [])
+    return data
+
+
+def run_concurrently(function, items, max_workers=8):
+    '''
+    Calls a function for each item concurrently over the shared session.
+
+    Args:
+        function (callable): The function to call with a single item.
+        items (list): The items.
+        max_workers (int, optional): The maximum number of concurrent requests. Defaults to 8.
+
+    Returns:
+        list: The results, in the order of the items. Failed calls return their exception.
+    '''
+    items = list(items)
+    if not items:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        futures = [executor.submit(function, item) for item in items]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+def create_application(display_name):
+    '''Creates an app registration and returns it, including its 'appId' and object 'id'.'''
+    return request('POST', 'graph', '/applications', body={'displayName': display_name})
+
+
+def add_application_password(app_object_id, display_name, end_date):
+    '''Adds a client secret to an app registration and returns the secret text.'''
+    body = {'passwordCredential': {'displayName': display_name, 'endDateTime': f'{end_date}T00:00:00Z'}}
+    return request('POST', 'graph', f'/applications/{app_object_id}/addPassword', body=body)['secretText']
+
+
+def delete_application(client_id):
+    '''Deletes an app registration by its client (app) ID, which also deletes its service principal.'''
+    request('DELETE', 'graph', f"/applications(appId='{client_id}')")
+
+
+def get_service_principal_id(client_id):
+    '''Returns the object ID of the service principal of an app, or None if it has none.'''
+    service_principals = request('GET', 'graph', '/servicePrincipals', params={'$filter': f"appId eq '{client_id}'", '$select': 'id'})['value']
+    return service_principals[0]['id'] if service_principals else None
+
+
+def create_service_principal(client_id):
+    '''Creates the service principal of an app and returns its object ID.'''
+    return request('POST', 'graph', '/servicePrincipals', body={'appId': client_id})['id']
+
+
+def get_role_definition_id(subscription_id, role_name):
+    '''Returns the full ID of a built-in or custom role definition by its name.'''
+    definitions = request('GET', 'arm', f'/subscriptions/{subscription_id}/providers/Microsoft.Authorization/roleDefinitions',
+                          params={'$filter': f"roleName eq '{role_name}'"})['value']
+    if not definitions:
+        raise AzureRestError(404, f"Role definition '{role_name}' not found")
+    return definitions[0]['id']
+
+
+def list_role_assignments(subscription_id, principal_id):
+    '''Returns the role assignments of a principal in a subscription.'''
+    return request('GET', 'arm', f'/subscriptions/{subscription_id}/providers/Microsoft.Authorization/roleAssignments',
+                   params={'$filter': f"assignedTo('{principal_id}')"})['value']
+
+
+def create_role_assignment(subscription_id, principal_id, role_definition_id, retries=6):
+    '''
+    Assigns a role to a service principal on a subscription.
+
+    Setting the principal type lets ARM skip the directory lookup, so new principals can be assigned right away.
+    If ARM still doesn't know the principal yet, the assignment is retried with backoff.
+    '''
+    scope = f'/subscriptions/{subscription_id}'
+    body = {'properties': {'roleDefinitionId': role_definition_id, 'principalId': principal_id, 'principalType': 'ServicePrincipal'}}
+    for attempt in range(retries + 1):
+        try:
+            return request('PUT', 'arm', f'{scope}/providers/Microsoft.Authorization/roleAssignments/{uuid.uuid4()}', body=body)
+        except AzureRestError as e:
+            if e.status_code == 409:
+                return {}  # Already assigned
+            if e.status_code != 400 or ('PrincipalNotFound' not in e.message and 'does not exist' not in e.message) or attempt == retries:
+                raise
+            time.sleep(2 ** attempt)
+
+
+def delete_role_assignment(assignment_id):
+    '''Deletes a role assignment by its full ID.'''
+    request('DELETE', 'arm', assignment_id)
@@ -0,0 +1,153 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import argparse
+import http.server
+import json
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+
+# Built-in roles known by the mock server
+ROLE_DEFINITIONS = {
+    'Security Reader': '39bc4728-0917-49c7-9d2c-d95423bc2eb4',
+    'Log Analytics Reader': '73c42c96-874c-492b-b04d-ab87d138a893',
+    'Reader': 'acdd72a7-3385-48ef-bd42-f606fba81ae7',
+}
+
+
+class MockAzureHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    Minimal in-memory implementation of the Microsoft Graph and ARM endpoints used by azure_rest.py.
+
+    Graph is served under /v1.0, ARM under /subscriptions. The state is stored on the server object.
+    '''
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, data=None):
+        body = json.dumps(data).encode() if data is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _parse(self):
+        url = urllib.parse.urlparse(self.path)
+        query = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length)) if length else {}
+        time.sleep(self.server.latency)
+        return urllib.parse.unquote(url.path), query, body
+
+    def do_GET(self):
+        path, query, _ = self._parse()
+        state = self.server.state
+        with self.server.lock:
+            if path == '/v1.0/servicePrincipals':
+                app_id = re.search(r"appId eq '([^']+)'", query.get('$filter', ''))
+                return self._send(200, {'value': [sp for sp in state['service_principals'].values() if app_id and sp['appId'] == app_id.group(1)]})
+
+            match = re.fullmatch(r'(/subscriptions/[^/]+)/providers/Microsoft.Authorization/roleDefinitions', path)
+            if match:
+                role_name = re.search(r"roleName eq '([^']+)'", query.get('$filter', ''))
+                role_id = ROLE_DEFINITIONS.get(role_name.group(1)) if role_name else None
+                value = [{'id': f'{match.group(1)}/providers/Microsoft.Authorization/roleDefinitions/{role_id}',
+                          'properties': {'roleName': role_name.group(1)}}] if role_id else []
+                return self._send(200, {'value': value})
+
+            match = re.fullmatch(r'(/subscriptions/[^/]+)/providers/Microsoft.Authorization/roleAssignments', path)
+            if match:
+                principal_id = re.search(r"assignedTo\('([^']+)'\)", query.get('$filter', ''))
+                value = [assignment for assignment in state['role_assignments'].values()
+                         if assignment['id'].startswith(match.group(1) + '/')
+                         and (not principal_id or assignment['properties']['principalId'] == principal_id.group(1))]
+                return self._send(200, {'value': value})
+        self._send(404, {'error': {'code': 'NotFound', 'message': f'Unknown path {path}'}})
+
+    def do_POST(self):
+        path, _, body = self._parse()
+        state = self.server.state
+        with self.server.lock:
+            if path == '/v1.0/applications':
+                app = {'id': str(uuid.uuid4()), 'appId': str(uuid.uuid4()), 'displayName': body.get('displayName', '')}
+                state['applications'][app['id']] = app
+                return self._send(201, app)
+
+            match = re.fullmatch(r'/v1.0/applications/([^/]+)/addPassword', path)
+            if match and match.group(1) in state['applications']:
+                return self._send(200, {'secretText': uuid.uuid4().hex, 'keyId': str(uuid.uuid4())})
+
+            if path == '/v1.0/servicePrincipals':
+                service_principal = {'id': str(uuid.uuid4()), 'appId': body.get('appId', '')}
+                state['service_principals'][service_principal['id']] = service_principal
+                return self._send(201, service_principal)
+        self._send(404, {'error': {'code': 'NotFound', 'message': f'Unknown path {path}'}})
+
+    def do_PUT(self):
+        path, _, body = self._parse()
+        with self.server.lock:
+            if re.fullmatch(r'/subscriptions/[^/]+/providers/Microsoft.Authorization/roleAssignments/[^/]+', path):
+                assignment = {'id': path, 'properties': body.get('properties', {})}
+                self.server.state['role_assignments'][path] = assignment
+                return self._send(201, assignment)
+        self._send(404, {'error': {'code': 'NotFound', 'message': f'Unknown path {path}'}})
+
+    def do_DELETE(self):
+        path, _, _ = self._parse()
+        state = self.server.state
+        with self.server.lock:
+            if path in state['role_assignments']:
+                return self._send(200, state['role_assignments'].pop(path))
+
+            match = re.fullmatch(r"/v1.0/applications\(appId='([^']+)'\)", path)
+            if match:
+                for app_object_id, app in list(state['applications'].items()):
+                    if app['appId'] == match.group(1):
+                        del state['applications'][app_object_id]
+                        state['service_principals'] = {key: sp for key, sp in state['service_principals'].items() if sp['appId'] != app['appId']}
+                        return self._send(204)
+        self._send(404, {'error': {'code': 'NotFound', 'message': f'Unknown path {path}'}})
+
+
+def start_mock_server(port=0, latency=0.0):
+    '''
+    Starts the mock server in a background thread.
+
+    Point azure_rest.py to it by setting AUTOCLOUDAUDIT_GRAPH_URL to '<url>/v1.0', AUTOCLOUDAUDIT_ARM_URL to '<url>'
+    and AUTOCLOUDAUDIT_AZURE_TOKEN to any value.
+
+    Args:
+        port (int, optional): The port to listen on. Defaults to 0, which picks a free port.
+        latency (float, optional): Seconds each request is delayed, to simulate a remote API. Defaults to 0.
+
+    Returns:
+        tuple: The server, which holds its state in server.state, and its base URL.
+    '''
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), MockAzureHandler)
+    server.latency = latency
+    server.lock = threading.Lock()
+    server.state = {'applications': {}, 'service_principals': {}, 'role_assignments': {}}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a mock Microsoft Graph/ARM server for testing the Azure app provisioning.')
+    parser.add_argument('--port', type=int, default=8765, help='Port to listen on')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds each request is delayed')
+    args = parser.parse_args()
+
+    server, url = start_mock_server(args.port, args.latency)
+    print(f'Mock server listening on {url}')
+    print(f'export AUTOCLOUDAUDIT_GRAPH_URL={url}/v1.0 AUTOCLOUDAUDIT_ARM_URL={url} AUTOCLOUDAUDIT_AZURE_TOKEN=mock')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
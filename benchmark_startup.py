@@ -0,0 +1,134 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import argparse
+import ast
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# The repository folder, the modules are imported from there wherever the benchmark is started
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Modules whose import time is measured
+MODULES = ['authenticate', 'selectionmenu', 'output_index', 'analyze', 'summary_cube', 'html_report', 'analysis_pipeline', 'report_server', 'autoCloudAudit']
+
+# Dependencies that should only be loaded when they are actually used
+HEAVY_DEPENDENCIES = ['pandas', 'prettytable', 'termcolor', 'requests', 'openpyxl']
+
+# Measures the import time in a fresh interpreter and reports which heavy dependencies got loaded
+IMPORT_PROBE = '''
+import sys, time, types
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [name for name in {heavy!r} if type(sys.modules.get(name)) is types.ModuleType]
+print(repr((elapsed, loaded)))
+'''
+
+GREEN = '\033[92m'
+RED = '\033[91m'
+BOLD = '\033[1m'
+NC = '\033[0m'
+
+
+def measure_import(module, repeats=5):
+    '''
+    Imports a module in fresh interpreters and measures the import and total process time.
+
+    Args:
+        module (str): The module to import.
+        repeats (int, optional): The number of interpreters to start. Defaults to 5.
+
+    Returns:
+        dict: The median import time, median process time (both in ms), the loaded heavy dependencies and the
+            output the module printed during import.
+    '''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [REPO_DIR, env.get('PYTHONPATH')]))
+    import_times = []
+    process_times = []
+    loaded = []
+    import_output = ''
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-c', IMPORT_PROBE.format(module=module, heavy=HEAVY_DEPENDENCIES)],
+                                capture_output=True, text=True, check=True, cwd=REPO_DIR, env=env)
+        process_times.append(time.perf_counter() - start)
+        *printed, probe_line = result.stdout.strip().split('\n')
+        elapsed, loaded = ast.literal_eval(probe_line)
+        import_times.append(elapsed)
+        import_output = '\n'.join(printed)
+    return {
+        'import_ms': statistics.median(import_times) * 1000,
+        'process_ms': statistics.median(process_times) * 1000,
+        'loaded': loaded,
+        'import_output': import_output,
+    }
+
+
+def _worker_ready(module):
+    __import__(module)
+    return time.perf_counter()
+
+
+def measure_worker_start(module='analyze', repeats=5):
+    '''
+    Measures how long it takes until a freshly spawned worker process has imported a module.
+
+    Args:
+        module (str, optional): The module the worker imports. Defaults to 'analyze'.
+        repeats (int, optional): The number of workers to start. Defaults to 5.
+
+    Returns:
+        float: The median start time in ms.
+    '''
+    context = multiprocessing.get_context('spawn')
+    start_times = []
+    for _ in range(repeats):
+        with context.Pool(1) as pool:
+            start = time.perf_counter()
+            ready = pool.apply(_worker_ready, (module,))
+            start_times.append(ready - start)
+    return statistics.median(start_times) * 1000
+
+
+def main():
+    # The spawned workers get the path of this process
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    parser = argparse.ArgumentParser(description='Measure the startup time of the AutoCloudAudit modules.')
+    parser.add_argument('--repeats', type=int, default=5, help='Number of interpreters to start per module')
+    parser.add_argument('--max-import-ms', type=float, default=100, help='Import time above which a module is reported as slow')
+    args = parser.parse_args()
+
+    baseline = measure_import('sys', args.repeats)
+    print(f"Bare interpreter startup: {baseline['process_ms']:.1f} ms")
+
+    failed = False
+    for module in MODULES:
+        result = measure_import(module, args.repeats)
+        problems = []
+        if result['import_ms'] > args.max_import_ms:
+            problems.append('slow import')
+        if result['loaded']:
+            problems.append(f"loads {', '.join(result['loaded'])}")
+        if result['import_output']:
+            problems.append('prints during import')
+        failed = failed or bool(problems)
+        status = f'{RED}{"; ".join(problems)}{NC}' if problems else f'{GREEN}OK{NC}'
+        print(f"{module:<16} import {result['import_ms']:7.1f} ms   process {result['process_ms']:7.1f} ms   {status}")
+
+    print(f"Spawned worker ready (analyze): {measure_worker_start('analyze', args.repeats):.1f} ms")
+    if failed:
+        print(f'{RED}{BOLD}Some modules are slow to import or have import-time side effects{NC}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import argparse
+import base64
+import gzip
+import html
+import json
+import struct
+
+from lazyimport import lazy_import
+
+pd = lazy_import('pandas')
+
+# The columns of the categorized issues shown in the report, in display order
+COLUMNS = ['category', 'severity', 'tool', 'check_id', 'resource_uid']
+SEVERITY_ORDER = {'Low': 1, 'Warning': 2, 'Medium': 3, 'Danger': 4, 'High': 5, 'Critical': 6}
+
+# The page decompresses the embedded data with the browser's DecompressionStream, then keeps every column as
+# an array of codes into its dictionary of distinct values. Filters compare codes, the search matches the
+# dictionaries first, and only the visible rows of the table are rendered.
+TEMPLATE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>__TITLE__</title>
+<style>
+body { font-family: sans-serif; margin: 1em; }
+#layout { display: flex; gap: 1em; }
+#categories { width: 22em; font-size: 13px; }
+#categories div { padding: 2px 4px; cursor: pointer; }
+#categories div.selected { background: #dde; }
+#main { flex: 1; min-width: 0; }
+#viewport { height: 75vh; overflow-y: auto; border: 1px solid #ccc; position: relative; font-size: 13px; }
+#spacer { position: relative; }
+.row { position: absolute; left: 0; right: 0; height: 22px; line-height: 22px; display: flex; border-bottom: 1px solid #eee; }
+.row span { overflow: hidden; white-space: nowrap; text-overflow: ellipsis; padding: 0 6px; }
+.header { display: flex; font-weight: bold; background: #eee; font-size: 13px; line-height: 24px; }
+.header span { padding: 0 6px; cursor: pointer; }
+.c0 { flex: 0 0 18em; } .c1 { flex: 0 0 6em; } .c2 { flex: 0 0 7em; } .c3 { flex: 0 0 22em; } .c4 { flex: 1; }
+.Critical, .High, .Danger { color: #c00; } .Medium { color: #d60; } .Low, .Warning { color: #990; }
+</style></head><body>
+<h2>__TITLE__</h2>
+<div id="status">Loading findings...</div>
+<div id="layout"><div id="categories"></div><div id="main">
+<div>Severity <select id="severity"></select> Tool <select id="tool"></select> Search <input id="search" size="30"> <span id="count"></span></div>
+<div class="header" id="header"></div>
+<div id="viewport"><div id="spacer"></div></div>
+</div></div>
+<script id="data" type="application/octet-stream">__DATA__</script>
+<script>
+const COLUMNS = __COLUMNS__, SEVERITY_ORDER = __SEVERITY_ORDER__, ROW_HEIGHT = 22;
+const $ = id => document.getElementById(id);
+let data, visible = [], sortColumn = "severity", category = -1;
+
+async function decode() {
+  const bytes = Uint8Array.from(atob($("data").textContent.trim()), c => c.charCodeAt(0));
+  const buffer = await new Response(new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"))).arrayBuffer();
+  const headerLength = new DataView(buffer).getUint32(0, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLength)));
+  let offset = 4 + headerLength;
+  const codes = {};
+  COLUMNS.forEach(column => { codes[column] = new Uint32Array(buffer, offset, header.rows); offset += header.rows * 4; });
+  return {rows: header.rows, values: header.values, codes};
+}
+
+function options(select, column) {
+  select.add(new Option("all", -1));
+  data.values[column].forEach((value, code) => select.add(new Option(value, code)));
+  select.onchange = update;
+}
+
+function update() {
+  const severity = +$("severity").value, tool = +$("tool").value, search = $("search").value.toLowerCase();
+  // Indexed search: find the matching dictionary values first, then filter the rows by code
+  const matches = search ? COLUMNS.map(column => new Set(data.values[column].flatMap((value, code) => value.toLowerCase().includes(search) ? [code] : []))) : null;
+  const c = data.codes, result = [];
+  for (let row = 0; row < data.rows; row++) {
+    if (category >= 0 && c.category[row] != category) continue;
+    if (severity >= 0 && c.severity[row] != severity) continue;
+    if (tool >= 0 && c.tool[row] != tool) continue;
+    if (matches && !COLUMNS.some((column, i) => matches[i].has(c[column][row]))) continue;
+    result.push(row);
+  }
+  // Counting sort on the rank of the codes, which is linear in the number of rows
+  const codes = c[sortColumn], values = data.values[sortColumn], rank = new Uint32Array(values.length);
+  if (sortColumn == "severity") {
+    const maxRank = Math.max(0, ...Object.values(SEVERITY_ORDER));
+    values.forEach((value, code) => rank[code] = maxRank - (SEVERITY_ORDER[value] || 0));
+  } else {
+    values.forEach((value, code) => rank[code] = code);  // The dictionaries are sorted
+  }
+  const starts = new Uint32Array(rank.reduce((a, b) => Math.max(a, b), 0) + 2);
+  result.forEach(row => starts[rank[codes[row]] + 1]++);
+  for (let i = 1; i < starts.length; i++) starts[i] += starts[i - 1];
+  visible = new Uint32Array(result.length);
+  result.forEach(row => visible[starts[rank[codes[row]]]++] = row);
+  $("count").textContent = visible.length + " of " + data.rows + " findings";
+  $("spacer").style.height = visible.length * ROW_HEIGHT + "px";
+  render();
+}
+
+function render() {
+  const viewport = $("viewport"), first = Math.floor(viewport.scrollTop / ROW_HEIGHT);
+  const last = Math.min(visible.length, first + Math.ceil(viewport.clientHeight / ROW_HEIGHT) + 1);
+  const fragment = document.createDocumentFragment();
+  for (let i = first; i < last; i++) {
+    const row = visible[i], div = document.createElement("div");
+    div.className = "row"; div.style.top = i * ROW_HEIGHT + "px";
+    COLUMNS.forEach((column, n) => {
+      const span = document.createElement("span"), value = data.values[column][data.codes[column][row]];
+      span.className = "c" + n + (column == "severity" ? " " + value : ""); span.textContent = value; span.title = value;
+      div.append(span);
+    });
+    fragment.append(div);
+  }
+  $("spacer").replaceChildren(fragment);
+}
+
+function categories() {
+  const counts = new Uint32Array(data.values.category.length);
+  data.codes.category.forEach(code => counts[code]++);
+  const entries = [[-1, "All categories", data.rows]].concat(data.values.category.map((value, code) => [code, value, counts[code]]));
+  $("categories").replaceChildren(...entries.map(([code, value, count]) => {
+    const div = document.createElement("div");
+    div.textContent = value + " (" + count + ")";
+    div.onclick = () => { category = code; [...$("categories").children].forEach(d => d.classList.remove("selected")); div.classList.add("selected"); update(); };
+    return div;
+  }));
+}
+
+decode().then(decoded => {
+  data = decoded;
+  options($("severity"), "severity"); options($("tool"), "tool");
+  COLUMNS.forEach((column, n) => {
+    const span = document.createElement("span"); span.className = "c" + n; span.textContent = column;
+    span.onclick = () => { sortColumn = column; update(); };
+    $("header").append(span);
+  });
+  categories();
+  let timer; $("search").oninput = () => { clearTimeout(timer); timer = setTimeout(update, 200); };
+  $("viewport").onscroll = () => requestAnimationFrame(render);
+  $("status").textContent = "";
+  update();
+}).catch(error => { $("status").textContent = "Could not load the findings: " + error; });
+</script></body></html>
+'''
+
+
+def encode_findings(df):
+    '''
+    Encodes the findings as compressed, dictionary-encoded columns.
+
+    Every column is stored as its distinct values and a little-endian uint32 code per row. The layout is a uint32
+    header length, the JSON header ({'rows', 'values'}) and the code arrays in COLUMNS order, gzipped and base64 encoded.
+
+    Args:
+        df (pandas.DataFrame): The categorized issues, with at least the columns in COLUMNS.
+
+    Returns:
+        str: The encoded data.
+    '''
+    values = {}
+    code_arrays = []
+    for column in COLUMNS:
+        series = df[column].fillna('').astype(str) if column in df else pd.Series([''] * len(df))
+        codes, uniques = pd.factorize(series, sort=True)
+        values[column] = uniques.tolist()
+        code_arrays.append(codes.astype('<u4').tobytes())
+
+    header = json.dumps({'rows': len(df), 'values': values}).encode()
+    # Pad the header so the code arrays start at a multiple of 4 bytes
+    header += b' ' * (-(4 + len(header)) % 4)
+    payload = struct.pack('<I', len(header)) + header + b''.join(code_arrays)
+    return base64.b64encode(gzip.compress(payload, compresslevel=6)).decode()
+
+
+def write_html_report(df, html_file, title='AutoCloudAudit categorized issues'):
+    '''
+    Writes a self-contained HTML report of the categorized issues, which opens in any browser without a server.
+
+    Args:
+        df (pandas.DataFrame): The categorized issues, as returned by analyze.combine_categories().
+        html_file (str): The path of the HTML file to write.
+        title (str, optional): The title of the report. Defaults to 'AutoCloudAudit categorized issues'.
+    '''
+    page = (TEMPLATE.replace('__TITLE__', html.escape(title))
+            .replace('__COLUMNS__', json.dumps(COLUMNS))
+            .replace('__SEVERITY_ORDER__', json.dumps(SEVERITY_ORDER))
+            .replace('__DATA__', encode_findings(df)))
+    with open(html_file, 'w') as f:
+        f.write(page)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a self-contained HTML report from a categorized issues CSV file.')
+    parser.add_argument('csv_file', help='The categorized issues, e.g. output/aws-2024-01-01_12-00-00/aws_categorized_issues.csv')
+    parser.add_argument('html_file', help='The HTML file to write')
+    args = parser.parse_args()
+
+    write_html_report(pd.read_csv(args.csv_file, dtype=str), args.html_file)
@@ -0,0 +1,156 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import contextlib
+import datetime
+import fcntl
+import json
+import os
+import statistics
+import threading
+
+# The file the durations of finished jobs are kept in, shared by all runs
+HISTORY_FILE = os.path.join('output', 'job_history.json')
+HISTORY_VERSION = 1
+
+# The number of recent runs kept per tool, provider and profile
+MAX_SAMPLES = 5
+
+# The expected duration in seconds of a job without any history for its tool
+DEFAULT_ESTIMATE = 15 * 60
+
+
+def job_key(job):
+    '''Returns the key of a job in the history: its tool, provider and profile.'''
+    return f"{job['tool']}|{job['provider']}|{job['profile']}"
+
+
+class JobHistory:
+    '''
+    Keeps the durations of successful jobs per tool, provider and profile, with the size of the output they wrote
+    as a measure of the number of resources scanned, to estimate how long the jobs of the next run take.
+
+    The history is saved after every job, so it is also kept when a run is interrupted. The file is locked while
+    a sample is added, and the sample is added to the entry on disk, so runs that finish the same job at the same
+    time both keep their samples.
+    '''
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self.jobs = self._load()
+        self._index = None
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                history = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return history.get('jobs', {}) if history.get('version') == HISTORY_VERSION else {}
+
+    @contextlib.contextmanager
+    def _locked_file(self):
+        '''Locks the history file exclusively, so concurrent runs don't read and write it at the same time.'''
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path + '.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save(self):
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump({'version': HISTORY_VERSION, 'jobs': self.jobs}, f, indent=2)
+        os.replace(self.path + '.tmp', self.path)
+
+    def record(self, job, duration, output_bytes=None):
+        '''
+        Adds the duration of a successful job to the history and saves it.
+
+        Args:
+            job (dict): The job, with the keys tool, provider and profile.
+            duration (float): The run time of the job in seconds.
+            output_bytes (int, optional): The size of the output artifacts the job wrote. Defaults to None.
+        '''
+        key = job_key(job)
+        sample = {'duration': round(duration, 1), 'output_bytes': output_bytes,
+                  'finished': datetime.datetime.now().isoformat(timespec='seconds')}
+        with self._lock, self._locked_file():
+            # Add the sample to the history on disk, which has the jobs other runs recorded in the meantime
+            self.jobs = self._load()
+            entry = self.jobs.setdefault(key, {'tool': job['tool'], 'provider': job['provider'], 'profile': job['profile'], 'samples': []})
+            entry['samples'] = (entry['samples'] + [sample])[-MAX_SAMPLES:]
+            self._index = None
+            self._save()
+
+    def _relative_sizes(self, medians):
+        '''Returns how the median of every job compares to the median of its tool, per provider and profile.'''
+        by_tool = {}
+        for key, value in medians.items():
+            entry = self.jobs[key]
+            by_tool.setdefault((entry['tool'], entry['provider']), []).append(value)
+        tool_medians = {tool: statistics.median(values) for tool, values in by_tool.items()}
+        factors = {}
+        for key, value in medians.items():
+            entry = self.jobs[key]
+            usual = tool_medians[(entry['tool'], entry['provider'])]
+            if usual:
+                factors.setdefault((entry['provider'], entry['profile']), []).append((entry['tool'], value / usual))
+        return tool_medians, factors
+
+    def _build_index(self):
+        '''
+        Computes the median duration of every job and tool, and the relative size of every profile per tool, both
+        by duration and by output size.
+        '''
+        durations = {key: statistics.median(sample['duration'] for sample in entry['samples'])
+                     for key, entry in self.jobs.items() if entry['samples']}
+        output_sizes = {}
+        for key, entry in self.jobs.items():
+            sizes = [sample['output_bytes'] for sample in entry['samples'] if sample.get('output_bytes')]
+            if sizes:
+                output_sizes[key] = statistics.median(sizes)
+        tool_durations, duration_factors = self._relative_sizes(durations)
+        _, size_factors = self._relative_sizes(output_sizes)
+        self._index = (durations, tool_durations, duration_factors, size_factors)
+
+    def estimate(self, job, default=DEFAULT_ESTIMATE):
+        '''
+        Estimates the duration of a job in seconds.
+
+        A job that ran before is expected to take the median of its recent durations. A profile that is new
+        to the tool is expected to take the tool's median duration, scaled by the size of the profile: how much
+        more or less output the other tools wrote for it than they usually do, as a measure of the number of
+        resources. Without output sizes, e.g. in older history files, the size is taken from how much longer or
+        shorter the other tools took for that profile. This way a large account is expected to be large for
+        every tool.
+
+        Args:
+            job (dict): The job, with the keys tool, provider and profile.
+            default (float, optional): The estimate for a tool without history. Defaults to DEFAULT_ESTIMATE.
+
+        Returns:
+            float: The expected duration in seconds.
+        '''
+        with self._lock:
+            if self._index is None:
+                self._build_index()
+            durations, tool_durations, duration_factors, size_factors = self._index
+        duration = durations.get(job_key(job))
+        if duration is not None:
+            return duration
+        tool_duration = tool_durations.get((job['tool'], job['provider']))
+        if tool_duration is None:
+            return default
+        for factors in (size_factors, duration_factors):
+            profile_factors = [factor for tool, factor in factors.get((job['provider'], job['profile']), []) if tool != job['tool']]
+            if profile_factors:
+                return tool_duration * statistics.median(profile_factors)
+        return tool_duration
+
+    def sort_longest_first(self, jobs):
+        '''Returns the jobs ordered by expected duration, longest first, which shortens the total run time of parallel runs.'''
+        return sorted(jobs, key=self.estimate, reverse=True)
@@ -0,0 +1,229 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import hmac
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+import urllib.parse
+import uuid
+
+# Seconds a worker may hold a job without a heartbeat before the job is given to another worker
+DEFAULT_LEASE_SECONDS = 120
+
+# Number of times a job is handed out before it is given up as lost
+DEFAULT_MAX_ATTEMPTS = 3
+
+# Shared secret of the socket queue, must be the same on the coordinator and the workers
+TOKEN = os.environ.get('AUTOCLOUDAUDIT_QUEUE_TOKEN', '')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    run TEXT NOT NULL,
+    job TEXT NOT NULL,
+    state TEXT NOT NULL,
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, run);
+'''
+
+
+class JobQueueError(Exception):
+    '''Raised when the job queue can't be opened or reached.'''
+
+
+class SQLiteJobQueue:
+    '''
+    A job queue in a SQLite database, shared by the coordinator and the workers of a distributed run.
+
+    Jobs go from 'queued' to 'leased' when a worker claims them, and to 'done' when the worker completes them.
+    A leased job whose worker stops sending heartbeats is queued again by requeue_expired(), or marked 'lost'
+    after max_attempts. The database can be a file on a filesystem the workers share, or ':memory:' behind a
+    JobQueueServer.
+    '''
+    def __init__(self, path, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def _transaction(self, function):
+        '''Runs a function with the database connection in a write transaction.'''
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                result = function(self._db)
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+            return result
+
+    def enqueue(self, run, jobs):
+        '''Adds jobs to the queue for a run, and returns their ids.'''
+        ids = [str(uuid.uuid4()) for _ in jobs]
+        now = time.time()
+        self._transaction(lambda db: db.executemany('INSERT INTO jobs (id, run, job, state, updated) VALUES (?, ?, ?, ?, ?)',
+                                                    [(job_id, run, json.dumps(job), 'queued', now) for job_id, job in zip(ids, jobs)]))
+        return ids
+
+    def claim(self, worker):
+        '''Leases the oldest queued job to a worker. Returns (job id, job), or None if no job is queued.'''
+        def claim_job(db):
+            row = db.execute("SELECT id, job FROM jobs WHERE state = 'queued' ORDER BY rowid LIMIT 1").fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            db.execute("UPDATE jobs SET state = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                       (worker, now + self.lease_seconds, now, row[0]))
+            return row[0], json.loads(row[1])
+        return self._transaction(claim_job)
+
+    def heartbeat(self, job_id, worker):
+        '''Extends the lease of a job. Returns False if the worker no longer holds the lease.'''
+        now = time.time()
+        cursor = self._transaction(lambda db: db.execute("UPDATE jobs SET lease_expires = ?, updated = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                                                         (now + self.lease_seconds, now, job_id, worker)))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker, result):
+        '''Marks a job as done with its result. Returns False if the worker no longer held the lease.'''
+        cursor = self._transaction(lambda db: db.execute("UPDATE jobs SET state = 'done', result = ?, updated = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                                                         (json.dumps(result), time.time(), job_id, worker)))
+        return cursor.rowcount == 1
+
+    def release(self, job_id, worker):
+        '''Gives a leased job back to the queue, e.g. when its worker is stopped. Returns False if the lease was lost.'''
+        cursor = self._transaction(lambda db: db.execute("UPDATE jobs SET state = 'queued', worker = NULL, updated = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                                                         (time.time(), job_id, worker)))
+        return cursor.rowcount == 1
+
+    def requeue_expired(self):
+        '''Queues the leased jobs whose lease expired again, or marks them lost. Returns the number of jobs.'''
+        def requeue(db):
+            now = time.time()
+            lost = db.execute("UPDATE jobs SET state = 'lost', updated = ? WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                              (now, now, self.max_attempts)).rowcount
+            queued = db.execute("UPDATE jobs SET state = 'queued', worker = NULL, updated = ? WHERE state = 'leased' AND lease_expires < ?",
+                                (now, now)).rowcount
+            return lost + queued
+        return self._transaction(requeue)
+
+    def cancel(self, run):
+        '''Removes the queued jobs of a run, so workers don't start them. Returns the number of jobs.'''
+        return self._transaction(lambda db: db.execute("UPDATE jobs SET state = 'cancelled', updated = ? WHERE run = ? AND state = 'queued'",
+                                                       (time.time(), run)).rowcount)
+
+    def status(self, run):
+        '''Returns the id, job, state, worker, attempts and result of every job of a run.'''
+        with self._lock:
+            rows = self._db.execute('SELECT id, job, state, worker, attempts, result FROM jobs WHERE run = ? ORDER BY rowid', (run,)).fetchall()
+        return [{'id': row[0], 'job': json.loads(row[1]), 'state': row[2], 'worker': row[3], 'attempts': row[4],
+                 'result': json.loads(row[5]) if row[5] else None} for row in rows]
+
+
+class JobQueueServer(socketserver.ThreadingTCPServer):
+    '''
+    Serves a job queue to workers over TCP, one JSON request and response line per call.
+
+    A request is {"token", "method", "args"}, with method one of claim, heartbeat, complete and release. The response is
+    {"result"} or {"error"}. Requests without the right token are refused.
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+    METHODS = ['claim', 'heartbeat', 'complete', 'release']
+
+    def __init__(self, address, queue, token=TOKEN):
+        self.queue = queue
+        self.token = token
+        super().__init__(address, JobQueueRequestHandler)
+
+
+class JobQueueRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                if not hmac.compare_digest(str(request.get('token', '')), self.server.token):
+                    response = {'error': 'invalid token'}
+                elif request.get('method') not in self.server.METHODS:
+                    response = {'error': f"unknown method {request.get('method')}"}
+                else:
+                    response = {'result': getattr(self.server.queue, request['method'])(*request.get('args', []))}
+            except (ValueError, TypeError, sqlite3.Error) as e:
+                response = {'error': str(e)}
+            self.wfile.write((json.dumps(response) + '\n').encode())
+
+
+class SocketJobQueue:
+    '''The worker side of a queue served by a JobQueueServer, with the same claim/heartbeat/complete/release methods.'''
+    def __init__(self, host, port, token=TOKEN, timeout=30):
+        self.address = (host, port)
+        self.token = token
+        self.timeout = timeout
+
+    def _call(self, method, *args):
+        try:
+            with socket.create_connection(self.address, timeout=self.timeout) as connection:
+                connection.sendall((json.dumps({'token': self.token, 'method': method, 'args': args}) + '\n').encode())
+                response = json.loads(connection.makefile('rb').readline() or b'{"error": "connection closed"}')
+        except OSError as e:
+            raise JobQueueError(f'Job queue at {self.address[0]}:{self.address[1]} is not reachable: {e}')
+        if 'error' in response:
+            raise JobQueueError(response['error'])
+        return response['result']
+
+    def claim(self, worker):
+        result = self._call('claim', worker)
+        return tuple(result) if result else None
+
+    def heartbeat(self, job_id, worker):
+        return self._call('heartbeat', job_id, worker)
+
+    def complete(self, job_id, worker, result):
+        return self._call('complete', job_id, worker, result)
+
+    def release(self, job_id, worker):
+        return self._call('release', job_id, worker)
+
+
+def open_queue(url, serve=False):
+    '''
+    Opens a job queue from its URL.
+
+    'sqlite:///path/to/queue.db' opens a SQLite queue file, which all workers must be able to reach, e.g. on a
+    shared filesystem. 'tcp://host:port' connects to the queue the coordinator serves. With serve=True (the
+    coordinator), a tcp:// URL starts a JobQueueServer on that address with an in-memory queue instead.
+
+    Args:
+        url (str): The queue URL.
+        serve (bool, optional): Whether to serve the queue, for the coordinator. Defaults to False.
+
+    Returns:
+        The queue, and for a served queue the server as second value: (queue, server or None).
+    '''
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme == 'sqlite':
+        return SQLiteJobQueue(parsed.path or ':memory:'), None
+    if parsed.scheme == 'tcp' and parsed.hostname and parsed.port:
+        if not serve:
+            return SocketJobQueue(parsed.hostname, parsed.port), None
+        if not TOKEN and parsed.hostname not in ['127.0.0.1', 'localhost', '::1']:
+            raise JobQueueError('Set AUTOCLOUDAUDIT_QUEUE_TOKEN on the coordinator and the workers to serve the queue on the network')
+        queue = SQLiteJobQueue(':memory:')
+        server = JobQueueServer((parsed.hostname, parsed.port), queue)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return queue, server
+    raise JobQueueError(f"Unsupported job queue URL '{url}', use sqlite:///path or tcp://host:port")
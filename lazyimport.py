@@ -0,0 +1,51 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import importlib.util
+import sys
+import threading
+
+_load_lock = threading.Lock()
+
+
+def lazy_import(name):
+    '''
+    Imports a module lazily: the module is only loaded on first attribute access.
+
+    This keeps heavy dependencies like pandas out of the startup time of the scripts
+    and of worker processes that never use them.
+
+    Args:
+        name (str): The name of the module, e.g. 'pandas'.
+
+    Returns:
+        module: The module, or a lazy placeholder that loads it on first use.
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def ensure_loaded(module):
+    '''
+    Loads a lazily imported module now.
+
+    LazyLoader is not thread-safe before Python 3.12: threads that use the module at the same time can see it
+    half-loaded. Call this before handing the module to a thread pool.
+
+    Args:
+        module (module): The module returned by lazy_import().
+    '''
+    with _load_lock:
+        getattr(module, '__dict__')
@@ -0,0 +1,267 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import os
+import threading
+
+# Names of the directories the tool runners write to, mapped to their display names
+TOOL_DIRS = {
+    'prowler': 'Prowler',
+    'scoutsuite': 'ScoutSuite',
+    'cloudfox': 'CloudFox',
+    'cloudsploit': 'CloudSploit',
+    'monkey365': 'Monkey365',
+}
+
+# Directories inside an output folder that hold derived results instead of tool output
+SKIPPED_DIRS = ['combined_profiles']
+
+# Indexes that were already built, keyed by the absolute path of the indexed folder, with the signature of
+# the folder when they were built
+_index_cache = {}
+_index_signatures = {}
+_cache_lock = threading.Lock()
+
+# The number of folder levels below an indexed folder whose modification times make up its signature: the
+# profile and tool folders of a run folder, or the tool folders and their subfolders of a profile folder
+SIGNATURE_DEPTH = 2
+
+
+def classify_artifact(tool, rel_parts):
+    '''
+    Determines the artifact type of a file written by one of the tools.
+
+    Args:
+        tool (str): The tool directory name, e.g. 'prowler'.
+        rel_parts (list[str]): The path components of the file relative to the tool directory.
+
+    Returns:
+        str: The artifact type, e.g. 'csv', 'ocsf' or 'results'. None if the file should not be indexed.
+    '''
+    name = rel_parts[-1].lower()
+    if name.startswith('.') or '.' not in name:
+        return None
+
+    if tool == 'prowler':
+        if 'compliance' in rel_parts[:-1]:
+            return 'compliance'
+        if name.endswith('.ocsf.json'):
+            return 'ocsf'
+        if name.endswith('.asff.json'):
+            return 'asff'
+    elif tool == 'scoutsuite':
+        if name.startswith('scoutsuite_results_') and name.endswith('.js'):
+            return 'results'
+        if name.startswith('scoutsuite_exceptions_') and name.endswith('.js'):
+            return 'exceptions'
+
+    return name.rsplit('.', 1)[-1]
+
+
+def build_output_index(output_path):
+    '''
+    Walks an output folder once and indexes all tool artifacts found in it.
+
+    The folder can either be a run folder ({output_dir}/{profile}/<tool>/...) or a single
+    profile folder ({profile}/<tool>/...). In the latter case the folder name is used as profile.
+    Symlinks are not followed, so the 'output' link that Prowler runs create is skipped.
+
+    Args:
+        output_path (str): The folder to index.
+
+    Returns:
+        dict: A dictionary mapping (profile, tool, artifact type) to a sorted list of file paths.
+    '''
+    root_path = os.path.abspath(output_path)
+    index = {}
+    for root, dirs, files in os.walk(root_path):
+        rel_dir = os.path.relpath(root, root_path)
+        rel_dir_parts = [] if rel_dir == '.' else rel_dir.split(os.sep)
+
+        # Prune folders with derived results and hidden folders
+        if not rel_dir_parts:
+            dirs[:] = [d for d in dirs if d not in SKIPPED_DIRS]
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+
+        # The first known tool directory in the path determines the tool, everything before it the profile
+        tool_pos = next((i for i, part in enumerate(rel_dir_parts) if part in TOOL_DIRS), None)
+        if tool_pos is None:
+            continue
+        tool = rel_dir_parts[tool_pos]
+        profile = os.sep.join(rel_dir_parts[:tool_pos]) or os.path.basename(root_path)
+
+        for file in files:
+            artifact = classify_artifact(tool, rel_dir_parts[tool_pos + 1:] + [file])
+            if artifact is None:
+                continue
+            index.setdefault((profile, tool, artifact), []).append(os.path.join(root, file))
+
+    for files in index.values():
+        files.sort()
+    return index
+
+
+def folder_signature(output_path, depth=SIGNATURE_DEPTH):
+    '''
+    Returns the modification times of a folder and of the folders in its first levels.
+
+    A folder's modification time changes when a file or folder is added to or removed from it, so the
+    signature changes when a tool starts writing to a new profile or tool folder, or adds files to one.
+    Files added deeper down are only noticed when the index is invalidated, which the job runner does when
+    a job finishes.
+
+    Args:
+        output_path (str): The folder.
+        depth (int, optional): The number of folder levels below output_path to include. Defaults to SIGNATURE_DEPTH.
+
+    Returns:
+        tuple: The sorted (path, modification time) pairs, empty if the folder doesn't exist.
+    '''
+    signature = []
+    folders = [(output_path, 0)]
+    while folders:
+        folder, level = folders.pop()
+        try:
+            signature.append((folder, os.stat(folder).st_mtime_ns))
+            if level < depth:
+                with os.scandir(folder) as entries:
+                    folders.extend((entry.path, level + 1) for entry in entries
+                                   if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.'))
+        except OSError:
+            pass
+    return tuple(sorted(signature))
+
+
+def get_output_index(output_path, refresh=False):
+    '''
+    Returns the index of an output folder, building it only if it was not built before or if the folder
+    changed since (see folder_signature()).
+
+    If a parent folder was already indexed and didn't change, the entries below output_path are taken
+    from that index instead of walking the filesystem again.
+
+    Args:
+        output_path (str): The folder to get the index for.
+        refresh (bool, optional): Whether to rebuild the index, e.g. after new output was written. Defaults to False.
+
+    Returns:
+        dict: A dictionary mapping (profile, tool, artifact type) to a sorted list of file paths.
+    '''
+    path = os.path.abspath(output_path)
+    if refresh:
+        invalidate_output_index(path)
+    else:
+        with _cache_lock:
+            cached = dict(_index_cache)
+        if path in cached and _index_signatures.get(path) == folder_signature(path):
+            return cached[path]
+        for root, index in cached.items():
+            if path.startswith(root + os.sep) and _index_signatures.get(root) == folder_signature(root):
+                prefix = path + os.sep
+                sub_index = {}
+                for key, files in index.items():
+                    matching_files = [f for f in files if f.startswith(prefix)]
+                    if matching_files:
+                        sub_index[key] = matching_files
+                return sub_index
+        # The cached indexes of the folder and the folders around it are outdated
+        invalidate_output_index(path)
+
+    # Take the signature first, so output written while the folder is walked makes the index outdated
+    signature = folder_signature(path)
+    index = build_output_index(path)
+    with _cache_lock:
+        _index_cache[path] = index
+        _index_signatures[path] = signature
+    return index
+
+
+def set_output_index(output_path, index):
+    '''
+    Stores an index that was built elsewhere, e.g. in the parent of a worker process.
+
+    Args:
+        output_path (str): The folder the index belongs to.
+        index (dict): The index, as returned by get_output_index().
+    '''
+    path = os.path.abspath(output_path)
+    with _cache_lock:
+        _index_cache[path] = index
+        _index_signatures[path] = folder_signature(path)
+
+
+def invalidate_output_index(output_path=None):
+    '''
+    Forgets the cached index of an output folder and of the folders around it.
+
+    Args:
+        output_path (str, optional): The folder whose index is outdated. Defaults to None, which forgets all indexes.
+    '''
+    with _cache_lock:
+        if output_path is None:
+            _index_cache.clear()
+            _index_signatures.clear()
+            return
+        path = os.path.abspath(output_path)
+        for root in list(_index_cache):
+            if root == path or root.startswith(path + os.sep) or path.startswith(root + os.sep):
+                del _index_cache[root]
+                _index_signatures.pop(root, None)
+
+
+def find_artifacts(output_path, tool, artifact, profile=None):
+    '''
+    Returns all files of an artifact type written by a tool in an output folder.
+
+    Args:
+        output_path (str): The run or profile folder to search in.
+        tool (str): The tool directory name, e.g. 'prowler'.
+        artifact (str): The artifact type, e.g. 'csv'.
+        profile (str, optional): Only return files of this profile. Defaults to None, which returns files of all profiles.
+
+    Returns:
+        list[str]: The file paths, ordered by profile.
+    '''
+    index = get_output_index(output_path)
+    files = []
+    for (file_profile, file_tool, file_artifact), paths in sorted(index.items()):
+        if file_tool == tool and file_artifact == artifact and (profile is None or file_profile == profile):
+            files.extend(paths)
+    return files
+
+
+def find_artifacts_by_profile(output_path, tool, artifact):
+    '''
+    Returns all files of an artifact type written by a tool, grouped by profile.
+
+    Args:
+        output_path (str): The run or profile folder to search in.
+        tool (str): The tool directory name, e.g. 'prowler'.
+        artifact (str): The artifact type, e.g. 'csv'.
+
+    Returns:
+        dict: A dictionary mapping each profile to its list of file paths.
+    '''
+    index = get_output_index(output_path)
+    files_by_profile = {}
+    for (file_profile, file_tool, file_artifact), paths in sorted(index.items()):
+        if file_tool == tool and file_artifact == artifact:
+            files_by_profile.setdefault(file_profile, []).extend(paths)
+    return files_by_profile
+
+
+def list_profiles(output_path, tool=None):
+    '''
+    Returns the profiles that have tool output in an output folder.
+
+    Args:
+        output_path (str): The run folder to search in.
+        tool (str, optional): Only return profiles with output of this tool. Defaults to None.
+
+    Returns:
+        list[str]: The sorted profile names.
+    '''
+    index = get_output_index(output_path)
+    return sorted({profile for profile, file_tool, _ in index if tool is None or file_tool == tool})
@@ -0,0 +1,222 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import atexit
+import base64
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import supervisor
+
+# The PowerShell executable, can be overridden for testing
+PWSH = os.environ.get('AUTOCLOUDAUDIT_PWSH', 'pwsh')
+
+# Lines the host writes to stdout to report back to Python
+READY_MARKER = '__AUTOCLOUDAUDIT_READY__'
+DONE_MARKER = '__AUTOCLOUDAUDIT_DONE__'
+
+# The script the host runs: it imports the module once, then reads one job per line from stdin as JSON
+# ({"id", "command", "parameters", "secure"}) and runs it. Parameters listed in "secure" are converted to a
+# SecureString first. After each job a DONE_MARKER line with the job id, status and error message is written.
+HOST_SCRIPT = '''
+$ErrorActionPreference = 'Continue'
+$ProgressPreference = 'SilentlyContinue'
+Import-Module '{module}'
+[Console]::Out.WriteLine('{ready}')
+while ($null -ne ($line = [Console]::In.ReadLine())) {{
+    $job = $line | ConvertFrom-Json -AsHashtable
+    $parameters = $job.parameters
+    foreach ($name in $job.secure) {{
+        $parameters[$name] = ConvertTo-SecureString $parameters[$name] -AsPlainText -Force
+    }}
+    $status = 'ok'
+    $message = ''
+    try {{
+        & $job.command @parameters *>&1 | Out-Host
+    }} catch {{
+        $status = 'error'
+        $message = $_.Exception.Message
+    }}
+    $parameters = $null
+    [GC]::Collect()
+    [Console]::Out.WriteLine('{done} ' + (@{{id = $job.id; status = $status; message = $message}} | ConvertTo-Json -Compress))
+}}
+'''
+
+# Idle hosts per (directory, module), shared by all jobs of this process
+_idle_hosts = {}
+_hosts_lock = threading.Lock()
+
+
+class PowerShellHostError(Exception):
+    '''Raised when the PowerShell host fails to start or exits while running a job.'''
+
+
+class PowerShellJobStopped(PowerShellHostError):
+    '''Raised when a job was stopped because it timed out or stopped writing output.'''
+    def __init__(self, reason, errors):
+        super().__init__(f'PowerShell job stopped: {"timeout" if reason == "timeout" else "no output"}')
+        self.reason = reason
+        self.errors = errors
+
+
+class PowerShellHost:
+    '''
+    A long-lived PowerShell process that imports a module once and then runs jobs sent over its stdin.
+
+    Jobs run one at a time. Their output is forwarded line by line to the console or to a log file.
+    '''
+    def __init__(self, directory, module):
+        self.directory = directory
+        self.module = module
+        self.jobs_run = 0
+        script = HOST_SCRIPT.format(module=module.replace("'", "''"), ready=READY_MARKER, done=DONE_MARKER)
+        encoded = base64.b64encode(script.encode('utf-16-le')).decode()
+        start = time.perf_counter()
+        self.process = subprocess.Popen([PWSH, '-NoLogo', '-NoProfile', '-NonInteractive', '-EncodedCommand', encoded],
+                                        cwd=directory, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                        text=True, bufsize=1)
+        self._read_until(READY_MARKER)
+        self.startup_seconds = time.perf_counter() - start
+
+    def _read_until(self, marker, output=None, watchdog=None):
+        '''Forwards the output of the host until a line starting with the marker, and returns that line.'''
+        for line in self.process.stdout:
+            if line.startswith(marker):
+                return line.rstrip('\n')
+            if watchdog:
+                watchdog.output(line)
+            (output or sys.stdout).write(line)
+            if output:
+                output.flush()
+        raise PowerShellHostError(f'PowerShell host exited with code {self.process.wait()}')
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def run(self, command, parameters, secure=(), output=None, watchdog=None):
+        '''
+        Runs a command in the host and waits for it to finish.
+
+        Args:
+            command (str): The command to run, e.g. 'Invoke-Monkey365'.
+            parameters (dict): The parameters, splatted onto the command. Lists become arrays, True enables switches.
+            secure (list[str], optional): Names of parameters that are passed as SecureString. Defaults to ().
+            output (file, optional): Where to write the output of the command. Defaults to None (the console).
+            watchdog (supervisor.Watchdog, optional): Receives the output of the command. Defaults to None.
+
+        Returns:
+            dict: The job id, status ('ok' or 'error'), error message and duration in seconds.
+        '''
+        job_id = str(uuid.uuid4())
+        start = time.perf_counter()
+        self.process.stdin.write(json.dumps({'id': job_id, 'command': command, 'parameters': parameters, 'secure': list(secure)}) + '\n')
+        self.process.stdin.flush()
+        result = json.loads(self._read_until(DONE_MARKER, output, watchdog)[len(DONE_MARKER):])
+        result['duration'] = time.perf_counter() - start
+        self.jobs_run += 1
+        return result
+
+    def close(self):
+        '''Stops the host, killing it if it doesn't exit by itself.'''
+        if not self.alive():
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=10)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+
+def acquire_host(directory, module):
+    '''
+    Returns an idle host that has imported the module, or starts a new one if all hosts are busy.
+
+    Args:
+        directory (str): The working directory of the host.
+        module (str): The path of the module to import, relative to the directory.
+
+    Returns:
+        PowerShellHost: The host. Give it back with release_host() when the job is done.
+    '''
+    with _hosts_lock:
+        idle = _idle_hosts.setdefault((directory, module), [])
+        while idle:
+            host = idle.pop()
+            if host.alive():
+                return host
+    host = PowerShellHost(directory, module)
+    print(f'Started a PowerShell host for {module} in {host.startup_seconds:.1f}s')
+    return host
+
+
+def release_host(host):
+    '''Makes a host available for the next job, or stops it if it has exited.'''
+    if not host.alive():
+        return
+    with _hosts_lock:
+        _idle_hosts.setdefault((host.directory, host.module), []).append(host)
+
+
+def shutdown_hosts():
+    '''Stops all idle hosts.'''
+    with _hosts_lock:
+        hosts = [host for idle in _idle_hosts.values() for host in idle]
+        _idle_hosts.clear()
+    for host in hosts:
+        host.close()
+
+
+atexit.register(shutdown_hosts)
+
+
+def run_job(directory, module, command, parameters, secure=(), log_file=None, timeout=None, stall_timeout=None, on_error=None):
+    '''
+    Runs a command in a warm PowerShell host that already imported the module.
+
+    If the job is interrupted, times out, stalls or the host fails, the host is stopped instead of reused.
+
+    Args:
+        directory (str): The working directory of the host.
+        module (str): The path of the module to import, relative to the directory.
+        command (str): The command to run.
+        parameters (dict): The parameters of the command.
+        secure (list[str], optional): Names of parameters that are passed as SecureString. Defaults to ().
+        log_file (str, optional): Append the output to this file instead of printing it. Defaults to None.
+        timeout (float, optional): Stop the job after this many seconds. Defaults to None (no timeout).
+        stall_timeout (float, optional): Stop the job if it writes no output for this many seconds. Defaults to None.
+        on_error (callable, optional): Called with the kind of each transient error found in the output. Defaults to None.
+
+    Returns:
+        dict: The job id, status ('ok' or 'error'), error message, duration in seconds and the number of
+            transient errors per kind found in the output (see supervisor.TRANSIENT_ERROR_PATTERNS).
+
+    Raises:
+        PowerShellJobStopped: If the job timed out or stalled.
+    '''
+    host = acquire_host(directory, module)
+    try:
+        with supervisor.Watchdog(host.process.kill, timeout, stall_timeout, on_error=on_error) as watchdog:
+            if log_file:
+                with open(log_file, 'a') as log:
+                    log.write(f'> {command} (PowerShell host {host.process.pid}, job {host.jobs_run + 1})\n')
+                    result = host.run(command, parameters, secure, log, watchdog)
+            else:
+                result = host.run(command, parameters, secure, watchdog=watchdog)
+    except BaseException:
+        host.process.kill()
+        host.process.wait()
+        if watchdog.reason:
+            raise PowerShellJobStopped(watchdog.reason, watchdog.errors)
+        raise
+    release_host(host)
+    result['errors'] = watchdog.errors
+    return result
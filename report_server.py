@@ -0,0 +1,256 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import argparse
+import csv
+import functools
+import glob
+import http.server
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+# Colors for the terminal
+GREEN = '\033[92m'
+BOLD = '\033[1m'
+NC = '\033[0m'
+
+# Columns of the categorized issues that can be filtered on with exact values
+FACETS = ['category', 'severity', 'tool']
+SEVERITY_ORDER = {'Low': 1, 'Warning': 2, 'Medium': 3, 'Danger': 4, 'High': 5, 'Critical': 6}
+MAX_PAGE_SIZE = 1000
+
+INDEX_PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>AutoCloudAudit report</title>
+<style>
+body { font-family: sans-serif; margin: 1em; }
+table { border-collapse: collapse; width: 100%; font-size: 13px; }
+th, td { border: 1px solid #ccc; padding: 3px 6px; text-align: left; }
+th { background: #eee; cursor: pointer; }
+.Critical, .High, .Danger { color: #c00; } .Medium { color: #d60; } .Low, .Warning { color: #990; }
+</style></head><body>
+<h2>AutoCloudAudit report</h2>
+<div>Report <select id="report"></select> <span id="filters"></span>
+Search <input id="q" size="30"> <span id="total"></span>
+<button id="prev">&lt;</button> <span id="page"></span> <button id="next">&gt;</button></div>
+<table><thead><tr id="head"></tr></thead><tbody id="rows"></tbody></table>
+<script>
+const facets = ["category", "severity", "tool"], columns = ["category", "severity", "tool", "check_id", "resource_uid"];
+let state = {page: 1, sort: "severity"};
+const $ = id => document.getElementById(id);
+async function get(path, params) { return (await fetch(path + "?" + new URLSearchParams(params))).json(); }
+function params() {
+  const p = {report: $("report").value, page: state.page, page_size: 100, sort: state.sort, q: $("q").value};
+  facets.forEach(f => { const v = $("f_" + f).value; if (v) p[f] = v; });
+  return p;
+}
+async function load() {
+  const data = await get("/api/findings", params());
+  $("total").textContent = data.total + " findings";
+  $("page").textContent = data.page + " / " + Math.max(1, Math.ceil(data.total / data.page_size));
+  $("rows").innerHTML = "";
+  data.rows.forEach(row => {
+    const tr = $("rows").insertRow();
+    columns.forEach(c => { const td = tr.insertCell(); td.textContent = row[c]; if (c == "severity") td.className = row[c]; });
+  });
+}
+async function loadFacets() {
+  const data = await get("/api/facets", {report: $("report").value});
+  $("filters").innerHTML = "";
+  facets.forEach(f => {
+    const select = document.createElement("select"); select.id = "f_" + f;
+    select.add(new Option("all " + f, ""));
+    Object.entries(data[f]).forEach(([value, count]) => select.add(new Option(value + " (" + count + ")", value)));
+    select.onchange = () => { state.page = 1; load(); };
+    $("filters").append(select, " ");
+  });
+  load();
+}
+async function init() {
+  (await get("/api/reports", {})).forEach(r => $("report").add(new Option(r.findings === null ? r.name : r.name + " (" + r.findings + ")", r.name)));
+  columns.forEach(c => { const th = document.createElement("th"); th.textContent = c; th.onclick = () => { state.sort = c; state.page = 1; load(); }; $("head").append(th); });
+  $("report").onchange = () => { state.page = 1; loadFacets(); };
+  let timer; $("q").oninput = () => { clearTimeout(timer); timer = setTimeout(() => { state.page = 1; load(); }, 250); };
+  $("prev").onclick = () => { if (state.page > 1) { state.page--; load(); } };
+  $("next").onclick = () => { state.page++; load(); };
+  loadFacets();
+}
+init();
+</script></body></html>
+'''
+
+
+class Report:
+    '''
+    The categorized issues of one run folder, loaded once with indexes for fast filtering, sorting and paging.
+    '''
+    def __init__(self, name, csv_file):
+        self.name = name
+        self.csv_file = csv_file
+        with open(csv_file, newline='') as f:
+            self.rows = list(csv.DictReader(f))
+
+        # The row numbers for every value of every facet, and the facet counts
+        self.index = {facet: {} for facet in FACETS}
+        for number, row in enumerate(self.rows):
+            for facet in FACETS:
+                self.index[facet].setdefault(row.get(facet, ''), []).append(number)
+        self.facets = {facet: {value: len(numbers) for value, numbers in sorted(values.items())} for facet, values in self.index.items()}
+        self.search_text = [' '.join(row.values()).lower() for row in self.rows]
+        self._lock = threading.Lock()
+
+    @functools.lru_cache(maxsize=8)
+    def sort_order(self, column):
+        '''Returns the row numbers sorted by a column. Severity sorts from highest to lowest.'''
+        if column == 'severity':
+            return sorted(range(len(self.rows)), key=lambda number: (-SEVERITY_ORDER.get(self.rows[number].get('severity'), 0), self.rows[number].get('category', '')))
+        return sorted(range(len(self.rows)), key=lambda number: self.rows[number].get(column) or '')
+
+    @functools.lru_cache(maxsize=64)
+    def matching_rows(self, sort, filters, query):
+        '''Returns the sorted row numbers that match the facet filters and the search query.'''
+        selected = None
+        for facet, value in filters:
+            numbers = set(self.index[facet].get(value, []))
+            selected = numbers if selected is None else selected & numbers
+        order = self.sort_order(sort if sort in self.rows[0] else 'severity') if self.rows else []
+        return [number for number in order
+                if (selected is None or number in selected) and (not query or query in self.search_text[number])]
+
+    def page(self, page=1, page_size=100, sort='severity', filters=(), query=''):
+        '''Returns one page of the matching findings and the total number of matches.'''
+        with self._lock:
+            numbers = self.matching_rows(sort, tuple(sorted(filters)), query.lower())
+        start = (page - 1) * page_size
+        return {'total': len(numbers), 'page': page, 'page_size': page_size,
+                'rows': [self.rows[number] for number in numbers[start:start + page_size]]}
+
+
+def find_reports(folders):
+    '''
+    Finds the categorized issues of run folders, including the combined report of their profiles.
+
+    Args:
+        folders (list[str]): The run folders.
+
+    Returns:
+        dict: A dictionary mapping report names to CSV files.
+    '''
+    reports = {}
+    for folder in folders:
+        folder_name = os.path.basename(os.path.normpath(folder))
+        for csv_file in sorted(glob.glob(os.path.join(folder, '*_categorized_issues.csv'))):
+            reports[folder_name] = csv_file
+        for csv_file in sorted(glob.glob(os.path.join(folder, 'combined_profiles', '*_categorized_issues.csv'))):
+            reports[f'{folder_name} (combined profiles)'] = csv_file
+    return reports
+
+
+class ReportHandler(http.server.BaseHTTPRequestHandler):
+    '''Serves the report page and the JSON endpoints /api/reports, /api/facets and /api/findings.'''
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type='application/json'):
+        body = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = {key: values[0] for key, values in urllib.parse.parse_qs(url.query).items()}
+        if url.path == '/':
+            return self._send(200, INDEX_PAGE, 'text/html; charset=utf-8')
+        if url.path == '/api/reports':
+            # Don't wait for the reports that are still loading, their number of findings is left out
+            return self._send(200, [{'name': name, 'findings': len(report.rows) if report else None}
+                                    for name, report in ((name, self.server.loaded_report(name)) for name in self.server.reports)])
+
+        report = self.server.get_report(query.get('report') or next(iter(self.server.reports), None))
+        if report is None:
+            return self._send(404, {'error': 'Unknown report'})
+        if url.path == '/api/facets':
+            return self._send(200, report.facets)
+        if url.path == '/api/findings':
+            try:
+                page = max(1, int(query.get('page', 1)))
+                page_size = min(MAX_PAGE_SIZE, max(1, int(query.get('page_size', 100))))
+            except ValueError:
+                return self._send(400, {'error': 'page and page_size must be numbers'})
+            filters = [(facet, query[facet]) for facet in FACETS if query.get(facet)]
+            return self._send(200, report.page(page, page_size, query.get('sort', 'severity'), filters, query.get('q', '')))
+        self._send(404, {'error': f'Unknown path {url.path}'})
+
+
+class ReportServer(http.server.ThreadingHTTPServer):
+    '''HTTP server that loads its reports in the background, so it is available right after starting.'''
+    daemon_threads = True
+
+    def __init__(self, address, reports):
+        super().__init__(address, ReportHandler)
+        self.reports = reports
+        self._loaded = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=lambda: [self.get_report(name) for name in reports], daemon=True).start()
+
+    def loaded_report(self, name):
+        '''Returns a report if it is loaded already, or None without waiting for it.'''
+        return self._loaded.get(name)
+
+    def get_report(self, name):
+        '''Returns a report, loading it on first use.'''
+        if name not in self.reports:
+            return None
+        with self._lock:
+            if name not in self._loaded:
+                self._loaded[name] = Report(name, self.reports[name])
+            return self._loaded[name]
+
+
+def start_report_server(folders, port=8000, host='127.0.0.1'):
+    '''
+    Starts the report server in a background thread.
+
+    Args:
+        folders (list[str]): The run folders whose categorized issues are served.
+        port (int, optional): The port to listen on. If it is in use, a free port is picked. Defaults to 8000.
+        host (str, optional): The address to listen on. Defaults to '127.0.0.1'.
+
+    Returns:
+        tuple: The server and its URL, or (None, None) if there are no categorized issues to serve.
+    '''
+    reports = find_reports(folders)
+    if not reports:
+        return None, None
+    try:
+        server = ReportServer((host, port), reports)
+    except OSError:
+        server = ReportServer((host, 0), reports)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}/'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the categorized issues of AutoCloudAudit output folders.')
+    parser.add_argument('folders', nargs='+', help='Output folders, e.g. output/aws-2024-01-01_12-00-00')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    server, url = start_report_server(args.folders, args.port)
+    if server is None:
+        print('No categorized issues found in the given folders')
+    else:
+        print(f'{GREEN}{BOLD}Report server started in {time.perf_counter() - start:.2f}s at {url}, use Ctrl+C to stop it...{NC}')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
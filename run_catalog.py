@@ -0,0 +1,291 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import csv
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import output_index
+
+# The catalog of all runs in the output folder
+CATALOG_FILE = os.path.join('output', 'catalog.db')
+
+# The severities counted as high in the headline counts
+HIGH_SEVERITIES = ['High', 'Critical', 'Danger']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    folder TEXT PRIMARY KEY,
+    provider TEXT NOT NULL,
+    started TEXT,
+    finished TEXT,
+    interrupted INTEGER,
+    size_bytes INTEGER,
+    files INTEGER,
+    jobs_succeeded INTEGER,
+    jobs_unsuccessful INTEGER,
+    categories INTEGER,
+    issues INTEGER,
+    high_issues INTEGER,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS run_profiles (
+    folder TEXT NOT NULL REFERENCES runs (folder) ON DELETE CASCADE,
+    profile TEXT NOT NULL,
+    PRIMARY KEY (folder, profile)
+);
+CREATE TABLE IF NOT EXISTS run_tools (
+    folder TEXT NOT NULL REFERENCES runs (folder) ON DELETE CASCADE,
+    tool TEXT NOT NULL,
+    PRIMARY KEY (folder, tool)
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started);
+CREATE INDEX IF NOT EXISTS run_profiles_profile ON run_profiles (profile);
+CREATE INDEX IF NOT EXISTS run_tools_tool ON run_tools (tool);
+'''
+
+# The columns of a run as returned by list_runs()
+RUN_COLUMNS = ['folder', 'provider', 'started', 'finished', 'interrupted', 'size_bytes', 'files', 'jobs_succeeded',
+               'jobs_unsuccessful', 'categories', 'issues', 'high_issues']
+
+
+def parse_folder_name(folder):
+    '''
+    Returns the provider and start time of a run folder named {provider}-YYYY-MM-DD_HH-MM-SS.
+
+    Returns:
+        tuple: The provider and the start time in ISO format, or None for folders that are not runs.
+    '''
+    provider, _, timestamp = folder.partition('-')
+    try:
+        started = datetime.datetime.strptime(timestamp, '%Y-%m-%d_%H-%M-%S')
+    except ValueError:
+        return None
+    return provider, started.isoformat()
+
+
+def folder_stats(folder_path):
+    '''Returns the total size in bytes and the number of files of a folder, without following symlinks.'''
+    size = files = 0
+    for root, _, names in os.walk(folder_path):
+        for name in names:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+                files += 1
+            except OSError:
+                pass
+    return size, files
+
+
+def count_issues(mapped_checks):
+    '''Returns the headline counts of categorized issues: the number of categories, issues and high issues.'''
+    severities = [severity for df in mapped_checks.values() for severity in df['severity']]
+    return {
+        'categories': len(mapped_checks),
+        'issues': len(severities),
+        'high_issues': sum(1 for severity in severities if severity in HIGH_SEVERITIES),
+    }
+
+
+def count_job_states(folder_path):
+    '''Returns the number of jobs per state from the job_states.json file of a run, or None if it has none.'''
+    try:
+        with open(os.path.join(folder_path, 'job_states.json'), 'r') as f:
+            jobs = json.load(f)
+    except (OSError, ValueError):
+        return None
+    counts = {}
+    for entry in jobs.values():
+        counts[entry.get('state')] = counts.get(entry.get('state'), 0) + 1
+    return counts
+
+
+def count_exported_issues(folder_path, provider):
+    '''Returns the headline counts from the {provider}_categorized_issues.csv file of a run, or None if it has none.'''
+    try:
+        with open(os.path.join(folder_path, f'{provider}_categorized_issues.csv'), newline='') as f:
+            categories = set()
+            issues = high_issues = 0
+            for row in csv.DictReader(f):
+                categories.add(row.get('category'))
+                issues += 1
+                high_issues += row.get('severity') in HIGH_SEVERITIES
+    except (OSError, csv.Error):
+        return None
+    return {'categories': len(categories), 'issues': issues, 'high_issues': high_issues}
+
+
+class RunCatalog:
+    '''
+    A SQLite catalog of the runs in the output folder, so runs can be listed, filtered and picked without
+    opening the run folders.
+
+    Every run is recorded with its provider, profiles, tools, start and finish time, size and headline
+    counts when it finishes. Folders the catalog doesn't know yet, e.g. runs from before the catalog existed,
+    are added by sync(), which only reads the new folders.
+    '''
+    def __init__(self, path=CATALOG_FILE):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA foreign_keys = ON')
+        self._db.executescript(SCHEMA)
+
+    def record_run(self, folder_path, provider=None, interrupted=None, job_counts=None, issue_counts=None, finished=None):
+        '''
+        Adds a run to the catalog, or updates it.
+
+        Args:
+            folder_path (str): The path of the run folder.
+            provider (str, optional): The cloud provider. Defaults to None, which takes it from the folder name.
+            interrupted (bool, optional): Whether the run was interrupted. Defaults to None (unknown).
+            job_counts (dict, optional): The number of jobs per state, see supervisor.JobStates.counts(). Defaults to None,
+                which reads them from the job_states.json file of the run.
+            issue_counts (dict, optional): The headline counts, see count_issues(). Defaults to None, which reads them
+                from the exported categorized issues.
+            finished (str, optional): The finish time in ISO format. Defaults to None, which uses the current time.
+        '''
+        folder = os.path.basename(os.path.normpath(folder_path))
+        parsed = parse_folder_name(folder)
+        provider = provider or (parsed[0] if parsed else folder.split('-')[0])
+        # Not cached, the run may have written output since it was last indexed, and sync() reads many folders once
+        index = output_index.build_output_index(folder_path)
+        profiles = sorted({profile for profile, _, _ in index})
+        tools = sorted({output_index.TOOL_DIRS[tool] for _, tool, _ in index})
+        size, files = folder_stats(folder_path)
+        issue_counts = issue_counts or count_exported_issues(folder_path, provider) or {}
+        job_counts = job_counts or count_job_states(folder_path) or {}
+        jobs_succeeded = job_counts.get('succeeded') if job_counts else None
+        jobs_unsuccessful = sum(count for state, count in job_counts.items() if state != 'succeeded') if job_counts else None
+        finished = finished or datetime.datetime.now().isoformat(timespec='seconds')
+
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                self._db.execute('DELETE FROM runs WHERE folder = ?', (folder,))
+                self._db.execute('INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                 (folder, provider, parsed[1] if parsed else None, finished,
+                                  None if interrupted is None else int(interrupted), size, files, jobs_succeeded, jobs_unsuccessful,
+                                  issue_counts.get('categories'), issue_counts.get('issues'), issue_counts.get('high_issues'), time.time()))
+                self._db.executemany('INSERT INTO run_profiles VALUES (?, ?)', [(folder, profile) for profile in profiles])
+                self._db.executemany('INSERT INTO run_tools VALUES (?, ?)', [(folder, tool) for tool in tools])
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+            self._db.execute('COMMIT')
+
+    def update_counts(self, folder, issue_counts):
+        '''Updates the headline counts of a run, e.g. after it was analyzed again.'''
+        with self._lock:
+            self._db.execute('UPDATE runs SET categories = ?, issues = ?, high_issues = ?, updated = ? WHERE folder = ?',
+                             (issue_counts.get('categories'), issue_counts.get('issues'), issue_counts.get('high_issues'), time.time(), folder))
+
+    def sync(self, output_base_path):
+        '''
+        Adds the run folders in the output folder that are not in the catalog yet, and removes the runs whose
+        folder no longer exists. Only the names of the folders are listed, known runs are not read again.
+
+        Returns:
+            tuple: The number of added and removed runs.
+        '''
+        folders = {entry.name for entry in os.scandir(output_base_path)
+                   if entry.is_dir(follow_symlinks=False) and parse_folder_name(entry.name)}
+        with self._lock:
+            known = {row[0] for row in self._db.execute('SELECT folder FROM runs')}
+        for folder in sorted(folders - known):
+            path = os.path.join(output_base_path, folder)
+            finished = datetime.datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec='seconds')
+            self.record_run(path, finished=finished)
+        removed = known - folders
+        if removed:
+            with self._lock:
+                self._db.executemany('DELETE FROM runs WHERE folder = ?', [(folder,) for folder in removed])
+        return len(folders - known), len(removed)
+
+    def list_runs(self, provider=None, profile=None, tool=None, since=None, until=None, limit=None):
+        '''
+        Returns the runs in the catalog, newest first.
+
+        Args:
+            provider (str, optional): Only runs of this provider. Defaults to None.
+            profile (str, optional): Only runs that audited this profile, * and ? are wildcards. Defaults to None.
+            tool (str, optional): Only runs with output of this tool, e.g. 'Prowler'. Defaults to None.
+            since (str, optional): Only runs started at or after this ISO date or time. Defaults to None.
+            until (str, optional): Only runs started before this ISO date or time. Defaults to None.
+            limit (int, optional): The maximum number of runs. Defaults to None (all runs).
+
+        Returns:
+            list[dict]: The runs, with the keys in RUN_COLUMNS and the lists 'profiles' and 'tools'.
+        '''
+        conditions, parameters = [], []
+        if provider:
+            conditions.append('provider = ?')
+            parameters.append(provider)
+        if profile:
+            conditions.append('folder IN (SELECT folder FROM run_profiles WHERE profile GLOB ?)')
+            parameters.append(profile)
+        if tool:
+            conditions.append('folder IN (SELECT folder FROM run_tools WHERE tool = ?)')
+            parameters.append(tool)
+        if since:
+            conditions.append('started >= ?')
+            parameters.append(since)
+        if until:
+            conditions.append('started < ?')
+            parameters.append(until)
+        query = f"SELECT {', '.join(RUN_COLUMNS)} FROM runs"
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY started DESC, folder DESC'
+        if limit:
+            query += f' LIMIT {int(limit)}'
+
+        with self._lock:
+            runs = [dict(zip(RUN_COLUMNS, row)) for row in self._db.execute(query, parameters)]
+            folders = [run['folder'] for run in runs]
+            profiles, tools = {}, {}
+            # Look up the profiles and tools of the listed runs in batches, SQLite limits the number of parameters
+            for start in range(0, len(folders), 500):
+                batch = folders[start:start + 500]
+                placeholders = ', '.join('?' * len(batch))
+                for folder, profile_name in self._db.execute(f'SELECT folder, profile FROM run_profiles WHERE folder IN ({placeholders}) ORDER BY profile', batch):
+                    profiles.setdefault(folder, []).append(profile_name)
+                for folder, tool_name in self._db.execute(f'SELECT folder, tool FROM run_tools WHERE folder IN ({placeholders}) ORDER BY tool', batch):
+                    tools.setdefault(folder, []).append(tool_name)
+        for run in runs:
+            run['profiles'] = profiles.get(run['folder'], [])
+            run['tools'] = tools.get(run['folder'], [])
+        return runs
+
+    def close(self):
+        self._db.close()
+
+
+def format_size(size):
+    '''Formats a size in bytes, e.g. "12.3 MB".'''
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024 or unit == 'GB':
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+
+def describe_run(run):
+    '''Returns a one-line description of a run for the selection menu.'''
+    profiles = run['profiles']
+    parts = [run['folder'], f"{len(profiles)} profile{'s' if len(profiles) != 1 else ''}" + (f" ({', '.join(profiles[:3])}{', ...' if len(profiles) > 3 else ''})" if profiles else ''),
+             ', '.join(run['tools']) or 'no tool output']
+    if run['issues'] is not None:
+        parts.append(f"{run['issues']} issues ({run['high_issues']} high)")
+    if run['jobs_unsuccessful']:
+        parts.append(f"{run['jobs_unsuccessful']} jobs not succeeded")
+    if run['interrupted']:
+        parts.append('interrupted')
+    if run['size_bytes'] is not None:
+        parts.append(format_size(run['size_bytes']))
+    return ' | '.join(parts)
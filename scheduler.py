@@ -0,0 +1,233 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import concurrent.futures
+import os
+import threading
+import time
+
+# Colors for the terminal
+GREEN = '\033[92m'
+YELLOW = '\033[93m'
+RED = '\033[91m'
+BOLD = '\033[1m'
+NC = '\033[0m'
+
+
+def format_duration(seconds):
+    '''Formats a duration in seconds for progress messages, e.g. "1h05m", "12m" or "40s".'''
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f'{seconds // 3600}h{seconds % 3600 // 60:02d}m'
+    if seconds >= 60:
+        return f'{seconds // 60}m'
+    return f'{seconds}s'
+
+
+class JobSkipped(Exception):
+    '''The result of a job that run_jobs() could not start, e.g. because the limit of its tool is 0.'''
+
+
+def job_name(job):
+    '''Returns a short human readable name of a job, e.g. "Prowler azure - Sub One (1234)".'''
+    return f"{job['tool']} {job['provider']} - {job['profile']}"
+
+
+class AIMDController:
+    '''
+    Adapts the number of concurrent jobs per group (account/tenant) to the API throttling of the cloud provider.
+
+    Every group starts at the maximum. When a job reports throttling, the limit of its group is halved
+    (multiplicative decrease), at most once per cooldown period, because a single burst of throttling is
+    reported by several jobs and many times per job. Each job that finishes without throttling of its group
+    during its run raises the limit by one again (additive increase). Jobs that are already running are not
+    stopped when the limit drops, new jobs of the group wait until the group is below its limit.
+    '''
+    def __init__(self, maximum, minimum=1, decrease_factor=0.5, cooldown=60):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.limits = {}
+        self.last_throttled = {}
+        self._lock = threading.Lock()
+
+    def limit(self, group):
+        '''Returns the current concurrency limit of a group.'''
+        with self._lock:
+            return self.limits.get(group, self.maximum)
+
+    def throttled(self, group):
+        '''Registers throttling of a group, and decreases its limit if it wasn't decreased during the cooldown.'''
+        now = time.monotonic()
+        with self._lock:
+            previous = self.last_throttled.get(group)
+            self.last_throttled[group] = now
+            if previous is not None and now - previous < self.cooldown:
+                return
+            old_limit = self.limits.get(group, self.maximum)
+            new_limit = self.limits[group] = max(self.minimum, int(old_limit * self.decrease_factor))
+        if new_limit < old_limit:
+            print(f'{YELLOW}Throttling detected for {group}, lowering its concurrency limit to {new_limit}{NC}')
+
+    def job_finished(self, group, started):
+        '''Increases the limit of a group if it was not throttled since the job started (a time.monotonic() value).'''
+        with self._lock:
+            if self.last_throttled.get(group, float('-inf')) >= started:
+                return
+            self.limits[group] = min(self.maximum, self.limits.get(group, self.maximum) + 1)
+
+
+def machine_capacity(memory_fraction=0.8):
+    '''Returns the CPU cores and the memory in MB of the machine that jobs may use together.'''
+    capacity = {'cpu': os.cpu_count() or 1}
+    try:
+        capacity['memory_mb'] = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') / 2**20 * memory_fraction
+    except (AttributeError, ValueError, OSError):
+        pass
+    return capacity
+
+
+def _has_capacity(job, running, tool_limits, group_limit, job_resources=None, capacity=None):
+    '''
+    Checks if a job can start without exceeding the limit of its tool or of its group (account/tenant), or the
+    capacity of the machine.
+
+    The group limit is a number, or an AIMDController that adapts it per group. It limits the total 'api_cost' of
+    the running jobs of the group, which is 1 per job if job_resources doesn't return it. A job always starts if
+    no other job of its group, or no other job at all for the machine capacity, is running, so jobs that need
+    more than the limit still run on their own.
+    '''
+    tool_running = sum(1 for other in running if other['tool'] == job['tool'])
+    if tool_running >= tool_limits.get(job['tool'], float('inf')):
+        return False
+    needed = job_resources(job) if job_resources else {}
+    if capacity and running:
+        for resource, available in capacity.items():
+            used = sum((job_resources(other) if job_resources else {}).get(resource, 0) for other in running)
+            if used + needed.get(resource, 0) > available:
+                return False
+    if isinstance(group_limit, AIMDController):
+        group_limit = group_limit.limit(job['group'])
+    group_running = [other for other in running if other['group'] == job['group']]
+    group_cost = sum((job_resources(other) if job_resources else {}).get('api_cost', 1) for other in group_running)
+    return group_limit is None or not group_running or group_cost + needed.get('api_cost', 1) <= group_limit
+
+
+def estimate_remaining(pending, running, estimate, max_parallel):
+    '''
+    Estimates the seconds until all jobs are done, from the expected duration of each job.
+
+    Args:
+        pending (list[dict]): The jobs that have not started yet.
+        running (list[tuple]): The running jobs and their start times (time.monotonic() values).
+        estimate (callable): Called with a job, returns its expected duration in seconds.
+        max_parallel (int): The maximum number of jobs running at the same time.
+
+    Returns:
+        float: The expected remaining time in seconds.
+    '''
+    now = time.monotonic()
+    running_left = [max(0, estimate(job) - (now - started)) for job, started in running]
+    work_left = sum(running_left) + sum(estimate(job) for job in pending)
+    # The remaining work spread over the slots, but at least the longest running job
+    return max(max(running_left, default=0), work_left / max(1, max_parallel))
+
+
+def run_jobs(jobs, run_job, max_parallel=4, tool_limits=None, group_limit=None, on_done=None, on_interrupt=None,
+             job_resources=None, capacity=None, estimate=None, on_skip=None):
+    '''
+    Runs jobs concurrently in threads, respecting concurrency limits per tool and per group.
+
+    A job is a dictionary with at least the keys 'provider', 'tool', 'profile' and 'group'. The group is the
+    account or tenant the job runs against, so a single tenant is not hit by too many scans at the same time.
+    Jobs are started in list order whenever a slot is free; a job whose tool or group is at its limit, or that doesn't
+    fit in the CPU and memory left on the machine, is skipped until a running job finishes, so smaller jobs can use
+    the free capacity in the meantime.
+
+    Args:
+        jobs (list[dict]): The jobs to run.
+        run_job (callable): Called with a job, runs it and returns True if it was interrupted by the user.
+        max_parallel (int, optional): The maximum number of jobs running at the same time. Defaults to 4.
+        tool_limits (dict, optional): The maximum number of concurrent jobs per tool name. Defaults to None.
+        group_limit (int or AIMDController, optional): The maximum number of concurrent jobs per group, or a
+            controller that adapts it to throttling. Defaults to None (no limit).
+        on_done (callable, optional): Called with each job that finished without being interrupted. Defaults to None.
+        on_interrupt (callable, optional): Called when the user presses Ctrl+C, to stop the running jobs. No new jobs
+            are started afterwards, and the running jobs are waited for. Defaults to None.
+        job_resources (callable, optional): Called with a job, returns its expected resource use, e.g.
+            {'cpu': 1.0, 'memory_mb': 1024, 'api_cost': 1.0}. Defaults to None (1 API cost unit per job).
+        capacity (dict, optional): The resources of the machine the running jobs may use together, e.g. from
+            machine_capacity(). Defaults to None (no limit besides max_parallel).
+        estimate (callable, optional): Called with a job, returns its expected duration in seconds, to show the
+            expected remaining time as jobs finish. Defaults to None.
+        on_skip (callable, optional): Called with each job that can't start at all and its reason, e.g. because the
+            limit of its tool is below 1. Defaults to None.
+
+    Returns:
+        tuple: Whether any job was interrupted, and a dictionary mapping the index of each job to its result or the
+            exception it raised. Jobs that could not start have a JobSkipped exception, jobs that were not started
+            because the run was interrupted have no result.
+    '''
+    tool_limits = tool_limits or {}
+    pending = list(enumerate(jobs))
+    running = {}
+    started = {}
+    results = {}
+    interrupted = False
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        while pending or running:
+            # Start as many pending jobs as the limits allow
+            for index, job in list(pending):
+                if interrupted or len(running) >= max_parallel:
+                    break
+                if _has_capacity(job, [other for _, other in running.values()], tool_limits, group_limit, job_resources, capacity):
+                    pending.remove((index, job))
+                    print(f'{GREEN}Starting {job_name(job)} ({len(jobs) - len(pending)}/{len(jobs)}){NC}')
+                    future = executor.submit(run_job, job)
+                    running[future] = (index, job)
+                    started[future] = time.monotonic()
+            if interrupted:
+                pending.clear()
+
+            if not running:
+                # With nothing running, the jobs that still can't start never will
+                for index, job in pending:
+                    limit = tool_limits.get(job['tool'], float('inf'))
+                    reason = f"the limit of {job['tool']} is {limit}" if limit < 1 else 'it exceeds the concurrency limits'
+                    results[index] = JobSkipped(reason)
+                    print(f'{RED}Skipped {job_name(job)}: {reason}{NC}')
+                    if on_skip:
+                        on_skip(job, reason)
+                break
+
+            try:
+                done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            except KeyboardInterrupt:
+                print(f'{YELLOW}Interrupted, stopping the running jobs...{NC}')
+                interrupted = True
+                if on_interrupt:
+                    on_interrupt()
+                continue
+            for future in done:
+                index, job = running.pop(future)
+                started.pop(future)
+                try:
+                    results[index] = future.result()
+                    interrupted = interrupted or results[index] is True
+                    eta = ''
+                    if estimate and (pending or running):
+                        seconds = estimate_remaining([other for _, other in pending], [(other, started[f]) for f, (_, other) in running.items()],
+                                                     estimate, max_parallel)
+                        eta = f', about {format_duration(seconds)} left'
+                    print(f'{GREEN}Finished {job_name(job)} ({len(results)}/{len(jobs)}{eta}){NC}')
+                    if on_done and results[index] is not True:
+                        on_done(job)
+                except Exception as e:
+                    results[index] = e
+                    print(f'{RED}Job {job_name(job)} failed: {e}{NC}')
+
+    return interrupted, results
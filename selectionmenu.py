@@ -1,91 +1,220 @@
 # Copyright (c) 2024 Guido Borst
-# 
+#
 # This software is released under the MIT License.
 # https://opensource.org/licenses/MIT
 
 import curses
 
-def draw_menu(stdscr, current_index, options, counters, menu_text, bool_input):
-    stdscr.clear()
-    curses.curs_set(0)
-    curses.init_pair(1, curses.COLOR_WHITE, curses.COLOR_BLACK)
-    curses.init_pair(2, curses.COLOR_BLACK, curses.COLOR_WHITE)
+# Lines above the options (menu text and filter) and below them (instructions)
+HEADER_LINES = 2
+FOOTER_LINES = 2
 
-    stdscr.addstr(0, 0, menu_text)
-    height, width = stdscr.getmaxyx()
+# Escape, Backspace and Delete as sent by most terminals
+KEY_ESCAPE = 27
+BACKSPACE_KEYS = [curses.KEY_BACKSPACE, 8, 127]
 
-    # Dynamically calculate max_options_displayed based on the available space
-    # Reserve 4 lines for instructions and potential 'more items' indicators
-    max_options_displayed = height - 4
 
-    # Calculate the middle position for the highlighted item
-    middle_option_index = max_options_displayed // 2 - 1
+class FilterIndex:
+    '''
+    Finds the options that contain a filter text, case insensitive.
 
-    # Adjust start_index to try to keep the current selection in the middle
-    start_index = max(0, min(current_index - middle_option_index, len(options) - max_options_displayed + 1))
-    end_index = min(start_index + max_options_displayed - 2, len(options))
+    The options are lowercased once. The matches of every filter are cached, and a filter is only matched against
+    the matches of its longest cached prefix, so every typed character only scans the options that still match and
+    Backspace is a cache lookup. This keeps filtering instant with tens of thousands of options.
+    '''
+    def __init__(self, options):
+        self.lowered = [str(option).lower() for option in options]
+        self._matches = {'': list(range(len(options)))}
 
-    # Adjust the display to include indicators as part of the list items
-    display_indices = range(max(0, start_index), min(len(options), end_index + 1))
+    def matches(self, text):
+        '''Returns the indices of the options that contain text, in their original order.'''
+        text = text.lower()
+        if text not in self._matches:
+            prefix = next(text[:length] for length in range(len(text) - 1, -1, -1) if text[:length] in self._matches)
+            self._matches[text] = [index for index in self._matches[prefix] if text in self.lowered[index]]
+        return self._matches[text]
 
-    display_start_line = 2
-    if start_index > 0:
-        stdscr.addstr(display_start_line, 0, '↑ More items above', curses.A_DIM)
 
-    for i, display_index in enumerate(display_indices, start=display_start_line):
-        if display_index == start_index and start_index > 0:
-            # Skip the first loop iteration if the first item is an indicator to avoid extra white line
-            continue
-        elif display_index == end_index and end_index < len(options) - 1:
-            # Indicator for more items below
-            stdscr.addstr(i, 0, '↓ More items below', curses.A_DIM)
-            break
+class Menu:
+    '''
+    The state of a selection menu, drawn with curses.
+
+    Only the lines whose content changed since the previous draw are written to the screen, so moving the
+    selection or typing a filter redraws a few lines instead of the whole screen.
+    '''
+    def __init__(self, stdscr, options, counters, menu_text, bool_input):
+        self.stdscr = stdscr
+        self.options = options
+        self.counters = counters
+        self.menu_text = menu_text
+        self.bool_input = bool_input
+        self.index = FilterIndex(options)
+        self.filter = ''
+        self.editing_filter = False
+        self.matches = self.index.matches('')
+        self.current = 0
+        self.lines = {}
+
+    def page_size(self):
+        '''Returns the number of options shown at once, without the lines of the 'more items' indicators.'''
+        height, _ = self.stdscr.getmaxyx()
+        rows = max(1, height - HEADER_LINES - FOOTER_LINES)
+        return rows if len(self.matches) <= rows else max(1, rows - 2)
+
+    def move(self, offset):
+        self.current = max(0, min(len(self.matches) - 1, self.current + offset))
+
+    def set_filter(self, text):
+        # Keep the selected option selected if it still matches
+        selected = self.matches[self.current] if self.matches else None
+        self.filter = text
+        self.matches = self.index.matches(text)
+        self.current = self.matches.index(selected) if selected in self.matches else 0
+
+    def toggle(self, option_index):
+        self.counters[option_index] = 1 if self.counters[option_index] == 0 else 0
+
+    def toggle_all_matching(self):
+        '''Selects all options that match the filter, or deselects them if they are all selected already.'''
+        if all(self.counters[index] > 0 for index in self.matches):
+            for index in self.matches:
+                self.counters[index] = 0
         else:
-            option = options[display_index]
-            if bool_input:
-                counter_str = '(*)' if counters[display_index] > 0 else '( )'
-            else:
-                counter_str = str(counters[display_index])
-            if display_index == current_index:
-                stdscr.attron(curses.color_pair(2))
-                stdscr.addstr(i, 0, f'{counter_str} {option}')
-                stdscr.attroff(curses.color_pair(2))
+            for index in self.matches:
+                self.counters[index] = self.counters[index] or 1
+
+    def _screen_lines(self):
+        '''Returns the text and attributes of every screen line, keyed by line number.'''
+        height, width = self.stdscr.getmaxyx()
+        lines = {0: (self.menu_text, curses.A_NORMAL)}
+        if self.filter or self.editing_filter:
+            cursor = '_' if self.editing_filter else ''
+            lines[1] = (f'Filter: {self.filter}{cursor}  ({len(self.matches)} of {len(self.options)} match)', curses.A_BOLD)
+        else:
+            lines[1] = ('', curses.A_NORMAL)
+
+        rows = max(1, height - HEADER_LINES - FOOTER_LINES)
+        page_size = self.page_size()
+        line = HEADER_LINES
+        if len(self.matches) <= rows:
+            start = 0
+        else:
+            # Keep the selected option in the middle, between the 'more items' indicators
+            start = max(0, min(self.current - page_size // 2, len(self.matches) - page_size))
+            lines[line] = ('↑ More items above' if start > 0 else '', curses.A_DIM)
+            line += 1
+        for position in range(start, min(start + page_size, len(self.matches))):
+            option_index = self.matches[position]
+            if self.bool_input:
+                counter_str = '(*)' if self.counters[option_index] > 0 else '( )'
             else:
-                stdscr.addstr(i, 0, f'{counter_str} {option}')
+                counter_str = str(self.counters[option_index])
+            attributes = curses.color_pair(2) if position == self.current else curses.A_NORMAL
+            lines[line] = (f'{counter_str} {self.options[option_index]}', attributes)
+            line += 1
+        if len(self.matches) > rows:
+            lines[line] = ('↓ More items below' if start + page_size < len(self.matches) else '', curses.A_DIM)
+            line += 1
+        for empty_line in range(line, height - FOOTER_LINES):
+            lines[empty_line] = ('', curses.A_NORMAL)
 
-    stdscr.addstr(height - 2, 0, 'Use the cursor keys to navigate the menu and Space to select options')
-    stdscr.addstr(height - 1, 0, 'Press Enter to confirm your selection or Q to quit')
+        if self.editing_filter:
+            lines[height - 2] = ('Type to filter, Backspace to delete, Enter to keep the filter, Esc to clear it', curses.A_NORMAL)
+        else:
+            lines[height - 2] = ('Cursor keys/PgUp/PgDn/Home/End to navigate, Space to select, / to filter, A to select all matching', curses.A_NORMAL)
+        lines[height - 1] = ('Press Enter to confirm your selection or Q to quit', curses.A_NORMAL)
+        # Leave the last column empty, writing to the bottom right corner raises an error
+        return {number: (text[:max(0, width - 1)], attributes) for number, (text, attributes) in lines.items() if number < height}
+
+    def draw(self, full=False):
+        '''Draws the lines that changed since the previous draw, or the whole screen if full is True.'''
+        if full:
+            self.stdscr.erase()
+            self.lines = {}
+        for number, (text, attributes) in self._screen_lines().items():
+            if self.lines.get(number) == (text, attributes):
+                continue
+            self.stdscr.move(number, 0)
+            self.stdscr.clrtoeol()
+            self.stdscr.addstr(number, 0, text, attributes)
+            self.lines[number] = (text, attributes)
+        self.stdscr.refresh()
+
+    def handle_filter_key(self, key):
+        '''Handles a key while the filter is edited.'''
+        if key in BACKSPACE_KEYS:
+            self.set_filter(self.filter[:-1])
+        elif key == KEY_ESCAPE:
+            self.editing_filter = False
+            self.set_filter('')
+        elif key == curses.KEY_ENTER or key in [10, 13]:
+            self.editing_filter = False
+        elif 32 <= key < 127:
+            self.set_filter(self.filter + chr(key))
+        else:
+            self.handle_navigation_key(key)
 
-    stdscr.refresh()
+    def handle_navigation_key(self, key):
+        '''Handles the keys that move the selection. Returns False if the key is not one of them.'''
+        if key == curses.KEY_UP:
+            self.move(-1)
+        elif key == curses.KEY_DOWN:
+            self.move(1)
+        elif key == curses.KEY_PPAGE:
+            self.move(-self.page_size())
+        elif key == curses.KEY_NPAGE:
+            self.move(self.page_size())
+        elif key == curses.KEY_HOME:
+            self.current = 0
+        elif key == curses.KEY_END:
+            self.move(len(self.matches))
+        else:
+            return False
+        return True
 
 
 def main(stdscr, options, counters=None, menu_text='Select options using Space, move selection using the cursor keys:', bool_input=False):
     if counters is None:
         counters = [0]*len(options)
     curses.cbreak()
+    curses.curs_set(0)
+    curses.init_pair(1, curses.COLOR_WHITE, curses.COLOR_BLACK)
+    curses.init_pair(2, curses.COLOR_BLACK, curses.COLOR_WHITE)
+    # Escape is a key of its own here, don't wait for an escape sequence after it
+    curses.set_escdelay(25)
     stdscr.keypad(True)
-    current_index = 0
-    draw_menu(stdscr, current_index, options, counters, menu_text, bool_input)
+    menu = Menu(stdscr, options, counters, menu_text, bool_input)
+    menu.draw(full=True)
 
     while True:
         key = stdscr.getch()
+        current = menu.matches[menu.current] if menu.matches else None
 
-        if key == curses.KEY_UP:
-            current_index = max(0, current_index - 1)
-        elif key == curses.KEY_DOWN:
-            current_index = min(len(options) - 1, current_index + 1)
-        elif key == curses.KEY_RIGHT and not bool_input:
-            counters[current_index] += 1
-        elif key == curses.KEY_LEFT and not bool_input:
-            counters[current_index] = max(0, counters[current_index] - 1)
-        elif key == ord(' ') and bool_input:
-            counters[current_index] = 1 if counters[current_index] == 0 else 0
+        if key == curses.KEY_RESIZE:
+            menu.draw(full=True)
+            continue
+        if menu.editing_filter:
+            menu.handle_filter_key(key)
+        elif menu.handle_navigation_key(key):
+            pass
+        elif key == curses.KEY_RIGHT and not bool_input and current is not None:
+            counters[current] += 1
+        elif key == curses.KEY_LEFT and not bool_input and current is not None:
+            counters[current] = max(0, counters[current] - 1)
+        elif key == ord(' ') and bool_input and current is not None:
+            menu.toggle(current)
+        elif key == ord('/'):
+            menu.editing_filter = True
+        elif key == ord('A') or key == ord('a'):
+            menu.toggle_all_matching()
+        elif key == KEY_ESCAPE and menu.filter:
+            menu.set_filter('')
         elif key == ord('Q') or key == ord('q'):
             break
         elif (key == curses.KEY_ENTER or key in [10, 13]) and any(counters):
             break
 
-        draw_menu(stdscr, current_index, options, counters, menu_text, bool_input)
+        menu.draw()
 
     curses.nocbreak()
     stdscr.keypad(False)
@@ -98,6 +227,9 @@ def make_menu_selection(options:list[str], counters:list[int]=None, menu_text='S
     """
     Displays a menu with the given options and allows the user to make selections.
 
+    Long lists can be filtered by typing / and part of an option. A selects or deselects all options that match
+    the filter, PgUp/PgDn and Home/End jump through the list.
+
     Args:
         options (list[str]): A list of options to display in the menu.
         counters (list[int], optional): A list of pre-set counters for each option. Defaults to None.
@@ -117,9 +249,8 @@ def make_menu_selection(options:list[str], counters:list[int]=None, menu_text='S
     if return_as_str:
         return [option for i, option in enumerate(options) if counters[i] > 0]
     return counters
-    
+
 
 if __name__ == "__main__":
     options = ['Option A', 'Option B', 'Option C', 'Option D']
     counters = make_menu_selection(options, print_results=True, bool_input=True)
-
@@ -0,0 +1,411 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import argparse
+import contextlib
+import datetime
+import fcntl
+import json
+import os
+import socket
+import time
+import uuid
+
+import authenticate
+import azure_rest
+from lazyimport import lazy_import
+
+requests = lazy_import('requests')
+
+# Colors for the terminal
+GREEN = '\033[92m'
+YELLOW = '\033[93m'
+RED = '\033[91m'
+BOLD = '\033[1m'
+NC = '\033[0m'
+
+# The pool is shared by all audits on this machine. It contains client secrets, so it is only readable by the user.
+POOL_FILE = os.path.expanduser(os.environ.get('AUTOCLOUDAUDIT_SP_POOL', '~/.autocloudaudit/sp_pool.json'))
+
+APP_NAME = 'AutoCloudAudit_temp_App'
+CLIENT_SECRET_NAME = 'AutoCloudAudit_ScriptGenerated'
+REQUIRED_ROLES = ['Security Reader', 'Log Analytics Reader']
+
+# Secrets are valid for a month, principals are retired from the pool a few days before that
+SECRET_VALID_DAYS = 31
+MIN_REMAINING_DAYS = 2
+DEFAULT_LEASE_HOURS = 24
+
+
+def assign_reader_roles(subscription_id, spid, roles=REQUIRED_ROLES):
+    '''
+    Assigns the roles needed for auditing to a service principal on a subscription, skipping roles it already has.
+    The missing roles are assigned concurrently.
+
+    Args:
+        subscription_id (str): The subscription to assign the roles on.
+        spid (str): The object ID of the service principal.
+        roles (list[str], optional): The role names. Defaults to REQUIRED_ROLES.
+
+    Returns:
+        bool: True if any role was assigned, False if all roles were already assigned.
+    '''
+    role_definition_ids = dict(zip(roles, azure_rest.run_concurrently(lambda role: azure_rest.get_role_definition_id(subscription_id, role), roles)))
+    for role, definition_id in role_definition_ids.items():
+        if isinstance(definition_id, Exception):
+            raise definition_id
+
+    assigned_definition_ids = [assignment['properties']['roleDefinitionId'].lower() for assignment in azure_rest.list_role_assignments(subscription_id, spid)]
+    missing_roles = []
+    for role, definition_id in role_definition_ids.items():
+        if definition_id.lower() in assigned_definition_ids:
+            print(f"Role '{role}' is already assigned to SPID: {spid}. Skipping role assignment.")
+        else:
+            missing_roles.append(role)
+
+    results = azure_rest.run_concurrently(lambda role: azure_rest.create_role_assignment(subscription_id, spid, role_definition_ids[role]), missing_roles)
+    for role, result in zip(missing_roles, results):
+        if isinstance(result, Exception):
+            print(f"{RED}Failed to assign role '{role}' to SPID {spid}: {result}{NC}")
+    return bool(missing_roles)
+
+
+def create_temp_azure_app(subscription_id, propagation_wait=5, details=None):
+    '''
+    Creates a temporary Azure app registration and saves the IDs to variables.
+
+    The app, its secret, service principal and role assignments are created with direct Microsoft Graph and ARM
+    requests over a shared HTTP session instead of separate Azure CLI calls.
+
+    Args:
+        subscription_id (str): The subscription to assign the reader roles on.
+        propagation_wait (int, optional): Seconds to wait for the new secret and roles to propagate. Defaults to 5.
+        details (dict, optional): Filled in while the app is created, so the caller knows what was created if a
+            later step fails. Defaults to None.
+
+    Returns:
+        dict: A dictionary containing clientid, clientsecret, spid, clientsecretname, subscription_id and secret_expiry.
+    '''
+    azure_app_credentials = details if details is not None else {}
+    enddate = (datetime.date.today() + datetime.timedelta(days=SECRET_VALID_DAYS)).strftime('%Y-%m-%d')
+
+    # Create app registration
+    app = azure_rest.create_application(APP_NAME)
+    azure_app_credentials.update({'clientid': app['appId'], 'clientsecretname': CLIENT_SECRET_NAME,
+                                  'subscription_id': subscription_id, 'secret_expiry': enddate})
+    azure_app_credentials['clientsecret'] = azure_rest.add_application_password(app['id'], CLIENT_SECRET_NAME, enddate)
+
+    # Check if SPID already exists (if the app registration was created before but not cleaned up)
+    spid = azure_rest.get_service_principal_id(azure_app_credentials['clientid'])
+    if spid:
+        print(f'Service Principal already exists with ID: {spid}. Skipping creation.')
+    else:
+        spid = azure_rest.create_service_principal(azure_app_credentials['clientid'])
+    azure_app_credentials['spid'] = spid
+
+    assign_reader_roles(subscription_id, spid)
+
+    # Give the new secret and role assignments a moment to propagate
+    time.sleep(propagation_wait)
+
+    print({key: value for key, value in azure_app_credentials.items() if key != 'clientsecret'})
+    return azure_app_credentials
+
+
+def cleanup_temp_azure_app(clientid, subscription_ids=None):
+    '''
+    Deletes a temporary Azure app registration and removes its role assignments.
+
+    The role assignments are deleted concurrently over a shared HTTP session.
+
+    Args:
+        clientid (str): The client ID of the app to delete.
+        subscription_ids (list[str], optional): The subscriptions the roles were assigned on. Defaults to None, which uses
+            the default subscription of the Azure CLI.
+    '''
+    if subscription_ids is None:
+        subscription_ids = [(authenticate.get_azure_credentials() or {}).get('subscription_id')]
+    elif isinstance(subscription_ids, str):
+        subscription_ids = [subscription_ids]
+
+    # Convert the client ID to the service principal ID
+    spid = azure_rest.get_service_principal_id(clientid)
+
+    # Remove role assignments
+    if spid:
+        role_assignments = []
+        for subscription_id in filter(None, subscription_ids):
+            role_assignments += azure_rest.list_role_assignments(subscription_id, spid)
+        results = azure_rest.run_concurrently(azure_rest.delete_role_assignment, [assignment['id'] for assignment in role_assignments])
+        for assignment, result in zip(role_assignments, results):
+            if isinstance(result, Exception):
+                print(f"{RED}Failed to delete role assignment {assignment['id']}: {result}{NC}")
+
+    # Delete the app registration
+    azure_rest.delete_application(clientid)
+
+
+@contextlib.contextmanager
+def _locked_pool():
+    '''Opens the pool file with an exclusive lock, so concurrent audits don't check out or delete principals at the same time.'''
+    os.makedirs(os.path.dirname(POOL_FILE), mode=0o700, exist_ok=True)
+    with open(f'{POOL_FILE}.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            try:
+                with open(POOL_FILE, 'r') as f:
+                    pool = json.load(f)
+            except FileNotFoundError:
+                pool = {'principals': []}
+            yield pool
+
+            temp_file = f'{POOL_FILE}.tmp'
+            with open(os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+                json.dump(pool, f, indent=4)
+            os.replace(temp_file, POOL_FILE)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _remaining_days(principal, today=None):
+    today = today or datetime.date.today()
+    return (datetime.date.fromisoformat(principal['secret_expiry']) - today).days
+
+
+def _lease_active(lease, now=None):
+    '''A lease is active until it expires, or until its process is gone if it was taken on this host.'''
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    if datetime.datetime.fromisoformat(lease['expires']) <= now:
+        return False
+    if lease.get('host') == socket.gethostname():
+        try:
+            os.kill(lease['pid'], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+    return True
+
+
+def _new_lease(hours):
+    return {
+        'host': socket.gethostname(),
+        'pid': os.getpid(),
+        'expires': (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=hours)).isoformat()
+    }
+
+
+def _complete(principal):
+    '''Whether the principal has a secret and a service principal, principals whose creation failed halfway have not.'''
+    return bool(principal.get('clientsecret') and principal.get('spid'))
+
+
+def _public_details(principal):
+    return {key: value for key, value in principal.items() if key not in ['leases', 'retiring']}
+
+
+def checkout_principal(subscription_ids, tenant_id, lease_hours=DEFAULT_LEASE_HOURS, propagation_wait=5):
+    '''
+    Checks out an audit service principal of the tenant that has the reader roles on the subscriptions.
+
+    Principals that are already in the pool are reused, so their roles have propagated. A principal is only created
+    if the tenant has no principal whose secret is valid for at least MIN_REMAINING_DAYS more days. If the reused
+    principal has no roles on some of the subscriptions yet, they are assigned first, on all subscriptions concurrently.
+
+    The pool file is only locked to reserve a principal and to record changes. The app registrations are created,
+    assigned roles and cleaned up without holding the lock, so concurrent audits don't wait for each other's
+    Graph and ARM requests. A new app is recorded in the pool even if setting it up fails, so it is cleaned up later
+    instead of being left behind in the tenant.
+
+    Args:
+        subscription_ids (str | list[str]): The subscription(s) that will be audited, all in the same tenant.
+        tenant_id (str): The tenant of the subscriptions.
+        lease_hours (int, optional): Hours after which the lease expires if it is not returned. Defaults to 24.
+        propagation_wait (int, optional): Seconds to wait after assigning roles on new subscriptions. Defaults to 5.
+
+    Returns:
+        tuple: The principal details (clientid, clientsecret, spid, ...) and the lease ID to return it with.
+    '''
+    if isinstance(subscription_ids, str):
+        subscription_ids = [subscription_ids]
+    lease_id = str(uuid.uuid4())
+
+    with _locked_pool() as pool:
+        retired = _reserve_retired(pool)
+        candidates = [principal for principal in pool['principals']
+                      if principal['tenant_id'] == tenant_id and _complete(principal) and not principal.get('retiring')
+                      and _remaining_days(principal) >= MIN_REMAINING_DAYS]
+        # Prefer principals that already have roles on the most subscriptions, then the ones valid the longest
+        candidates.sort(key=lambda principal: (len(set(subscription_ids) & set(principal['subscriptions'])), principal['secret_expiry']), reverse=True)
+        principal = None
+        if candidates:
+            candidates[0]['leases'][lease_id] = _new_lease(lease_hours)
+            principal = json.loads(json.dumps(candidates[0]))
+    _delete_retired(retired)
+
+    if principal:
+        print(f"{GREEN}Reusing pooled app {principal['clientid']}{NC}")
+    else:
+        print('Creating a new audit app registration for the pool...')
+        principal = _create_principal(subscription_ids[0], tenant_id, lease_id, lease_hours)
+
+    try:
+        # A new principal always needs time to propagate, a reused one only if roles were assigned
+        propagate = not candidates
+        missing = [subscription_id for subscription_id in subscription_ids if subscription_id not in principal['subscriptions']]
+        if missing:
+            print(f"Assigning reader roles on {len(missing)} subscription(s) to pooled app {principal['clientid']}...")
+            results = azure_rest.run_concurrently(lambda subscription_id: assign_reader_roles(subscription_id, principal['spid']), missing)
+            assigned = []
+            for subscription_id, result in zip(missing, results):
+                if isinstance(result, Exception):
+                    print(f"{RED}Failed to assign reader roles on subscription {subscription_id}: {result}{NC}")
+                else:
+                    assigned.append(subscription_id)
+                    propagate = propagate or result
+            if assigned:
+                principal['subscriptions'] += assigned
+                with _locked_pool() as pool:
+                    for pooled in pool['principals']:
+                        if pooled['clientid'] == principal['clientid']:
+                            pooled['subscriptions'] += [subscription_id for subscription_id in assigned if subscription_id not in pooled['subscriptions']]
+        if propagate:
+            time.sleep(propagation_wait)
+    except BaseException:
+        return_principal(principal['clientid'], lease_id)
+        raise
+    return _public_details(principal), lease_id
+
+
+def _create_principal(subscription_id, tenant_id, lease_id, lease_hours):
+    '''
+    Creates an audit app registration with the reader roles on a subscription and adds it to the pool, leased.
+
+    The app is added to the pool as soon as it exists in the tenant, also when a later step fails or is interrupted.
+    It is then added without a lease, so the next cleanup deletes it if it is incomplete.
+    '''
+    details = {}
+    principal = {
+        'tenant_id': tenant_id,
+        'subscriptions': [],
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'leases': {}
+    }
+    try:
+        create_temp_azure_app(subscription_id, 0, details)
+        principal['subscriptions'] = [subscription_id]
+        principal['leases'][lease_id] = _new_lease(lease_hours)
+    finally:
+        if details.get('clientid'):
+            principal.update({key: details.get(key) for key in ['clientid', 'clientsecret', 'spid', 'clientsecretname', 'secret_expiry']})
+            with _locked_pool() as pool:
+                pool['principals'].append(principal)
+    return principal
+
+
+def return_principal(clientid, lease_id):
+    '''
+    Returns a checked out service principal to the pool.
+
+    Args:
+        clientid (str): The client ID of the principal.
+        lease_id (str): The lease ID returned by checkout_principal().
+    '''
+    with _locked_pool() as pool:
+        for principal in pool['principals']:
+            if principal['clientid'] == clientid:
+                principal['leases'].pop(lease_id, None)
+
+
+def _reserve_retired(pool, force=False):
+    '''
+    Marks the principals that are retired and no longer leased, or all unleased principals if force is set, as being
+    deleted by this process, so other audits neither check them out nor delete them too.
+
+    Returns:
+        list[dict]: The principals to delete with _delete_retired().
+    '''
+    now = datetime.datetime.now(datetime.timezone.utc)
+    retired = []
+    for principal in pool['principals']:
+        principal['leases'] = {lease_id: lease for lease_id, lease in principal['leases'].items() if _lease_active(lease, now)}
+        if principal.get('retiring') and _lease_active(principal['retiring'], now):
+            continue
+        remaining_days = _remaining_days(principal)
+        # An expired secret is useless for running leases too, so those principals are always deleted
+        if remaining_days < 0 or (not principal['leases'] and (force or remaining_days < MIN_REMAINING_DAYS or not _complete(principal))):
+            principal['retiring'] = _new_lease(1)
+            retired.append(dict(principal))
+    return retired
+
+
+def _delete_retired(retired):
+    '''Deletes the app registrations reserved by _reserve_retired() and removes them from the pool.'''
+    removed = []
+    try:
+        for principal in retired:
+            print(f"Cleaning up audit app registration {principal['clientid']}...")
+            try:
+                cleanup_temp_azure_app(principal['clientid'], principal['subscriptions'])
+            except azure_rest.AzureRestError as e:
+                if e.status_code != 404:
+                    print(f"{RED}Failed to clean up app registration {principal['clientid']}: {e}{NC}")
+                    continue
+            except requests.RequestException as e:
+                print(f"{RED}Failed to clean up app registration {principal['clientid']}: {e}{NC}")
+                continue
+            removed.append(principal['clientid'])
+    finally:
+        if retired:
+            retired_ids = [principal['clientid'] for principal in retired]
+            with _locked_pool() as pool:
+                pool['principals'] = [principal for principal in pool['principals'] if principal['clientid'] not in removed]
+                # The principals that could not be deleted are tried again by the next cleanup
+                for principal in pool['principals']:
+                    if principal['clientid'] in retired_ids:
+                        principal.pop('retiring', None)
+    return removed
+
+
+def cleanup_expired_principals(force=False):
+    '''
+    Deletes the pooled service principals whose secrets expire soon and that are not leased anymore.
+
+    Args:
+        force (bool, optional): Delete all principals that are not leased, regardless of their expiry. Defaults to False.
+
+    Returns:
+        list[str]: The client IDs of the deleted principals.
+    '''
+    with _locked_pool() as pool:
+        retired = _reserve_retired(pool, force)
+    return _delete_retired(retired)
+
+
+def list_principals():
+    '''
+    Returns the pooled service principals without their secrets.
+
+    Returns:
+        list[dict]: The principals, with the number of active leases instead of the leases.
+    '''
+    with _locked_pool() as pool:
+        return [{**{key: value for key, value in principal.items() if key not in ['clientsecret', 'leases', 'retiring']},
+                 'active_leases': sum(_lease_active(lease) for lease in principal['leases'].values())}
+                for principal in pool['principals']]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the pool of audit app registrations.')
+    parser.add_argument('action', choices=['list', 'cleanup', 'purge'], help='List the pool, clean up expiring principals, or delete all unleased principals')
+    args = parser.parse_args()
+
+    if args.action == 'list':
+        for principal in list_principals():
+            print(f"{principal['clientid']}  tenant {principal['tenant_id']}  expires {principal['secret_expiry']}  "
+                  f"leases {principal['active_leases']}  subscriptions {len(principal['subscriptions'])}")
+    else:
+        removed = cleanup_expired_principals(force=args.action == 'purge')
+        print(f'Removed {len(removed)} app registration(s)')
@@ -0,0 +1,242 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import argparse
+import contextlib
+import io
+import json
+import os
+
+import analyze
+import output_index
+from lazyimport import lazy_import
+
+pd = lazy_import('pandas')
+prettytable = lazy_import('prettytable')
+
+# The dimensions of the cube, every cell holds the number of checked items for one combination
+DIMENSIONS = ['category', 'severity', 'tool', 'profile', 'service', 'status']
+CUBE_VERSION = 2
+
+# The tool artifacts the cube is computed from. If any of them changes, the cube is rebuilt.
+SOURCE_ARTIFACTS = [('prowler', 'csv'), ('prowler', 'ocsf'), ('scoutsuite', 'results'), ('cloudsploit', 'csv'), ('monkey365', 'json')]
+
+# Cubes that were already loaded, keyed by the absolute path of the cube file
+_cube_cache = {}
+
+
+def cube_path(output_path, provider):
+    '''Returns the path of the cube file of a run folder.'''
+    return os.path.join(output_path, f'{provider}_summary_cube.json')
+
+
+def _source_signature(output_path):
+    '''Returns the relative path, modification time and size of every tool artifact the cube is computed from.'''
+    signature = {}
+    for tool, artifact in SOURCE_ARTIFACTS:
+        for file_path in output_index.find_artifacts(output_path, tool, artifact):
+            stat = os.stat(file_path)
+            signature[os.path.relpath(file_path, output_path)] = [stat.st_mtime_ns, stat.st_size]
+    return signature
+
+
+def _prowler_frames(output_path, checks_to_categories):
+    frames = []
+    for profile in output_index.list_profiles(output_path, 'prowler'):
+        df = analyze.load_prowler_findings(output_path, ['CHECK_ID', 'SEVERITY', 'SERVICE_NAME', 'STATUS'], profile)
+        if df is None:
+            continue
+        frames.append(pd.DataFrame({
+            'category': df['CHECK_ID'].map(lambda check: checks_to_categories.get(check, 'Uncategorized issues')),
+            'severity': df['SEVERITY'].astype(str).str.capitalize(),
+            'tool': 'Prowler',
+            'profile': profile,
+            'service': df['SERVICE_NAME'].astype(str),
+            'status': df['STATUS'].astype(str),
+            'count': 1,
+        }))
+    return frames
+
+
+def _cloudsploit_frames(output_path, provider, checks_to_categories):
+    frames = []
+    files_by_profile = output_index.find_artifacts_by_profile(output_path, 'cloudsploit', 'csv')
+    if not files_by_profile:
+        return frames
+    check_details = analyze.extract_cloudsploit_azure_check_details() if provider == 'azure' else analyze.extract_cloudsploit_aws_check_details()
+    severities = {check['title']: check['severity'] for check in check_details}
+    for profile, csv_files in files_by_profile.items():
+        df = pd.concat([pd.read_csv(f, sep=',', usecols=['category', 'title', 'statusWord']) for f in csv_files], ignore_index=True)
+        frames.append(pd.DataFrame({
+            'category': df['title'].map(lambda check: checks_to_categories.get(check, 'Uncategorized issues')),
+            'severity': df['title'].map(lambda check: severities.get(check, '')).str.capitalize(),
+            'tool': 'CloudSploit',
+            'profile': profile,
+            'service': df['category'],
+            'status': df['statusWord'],
+            'count': 1,
+        }))
+    return frames
+
+
+def _scoutsuite_frames(output_path, checks_to_categories):
+    rows = []
+    for profile, js_files in output_index.find_artifacts_by_profile(output_path, 'scoutsuite', 'results').items():
+        for js_file in js_files:
+            parsed_data = analyze.load_scoutsuite_results(js_file)
+            for service, info in parsed_data['services'].items():
+                for finding, finding_info in info.get('findings', {}).items():
+                    category = checks_to_categories.get(finding, 'Uncategorized issues')
+                    severity = finding_info.get('level', '').capitalize()
+                    flagged = finding_info.get('flagged_items', 0)
+                    checked = finding_info.get('checked_items', 0)
+                    rows.append((category, severity, 'ScoutSuite', profile, service, 'FAIL', flagged))
+                    rows.append((category, severity, 'ScoutSuite', profile, service, 'PASS', max(checked - flagged, 0)))
+    return [pd.DataFrame(rows, columns=DIMENSIONS + ['count'])] if rows else []
+
+
+def _monkey365_frames(output_path, checks_to_categories):
+    rows = [(analyze.monkey365_category(finding, checks_to_categories), finding['severity'], 'Monkey365',
+             finding['profile'], finding['service'], finding['status'], 1)
+            for finding in analyze.iter_monkey365_findings(output_path)]
+    return [pd.DataFrame(rows, columns=DIMENSIONS + ['count'])] if rows else []
+
+
+def build_cube(output_path, provider):
+    '''
+    Computes the aggregate cube of a run folder from the raw tool output.
+
+    The cube holds the number of checked items per category, severity, tool, profile, service and status, and the
+    per-service summaries of the summary tables, so they don't have to be computed from the raw rows again.
+
+    Args:
+        output_path (str): The path to the run folder.
+        provider (str): The cloud provider name.
+
+    Returns:
+        dict: The cube, with the keys 'version', 'provider', 'dimensions', 'cells', 'summaries' and 'sources'.
+    '''
+    _, checks_to_categories = analyze.parse_checks()
+    frames = (_prowler_frames(output_path, checks_to_categories) + _scoutsuite_frames(output_path, checks_to_categories)
+              + _cloudsploit_frames(output_path, provider, checks_to_categories) + _monkey365_frames(output_path, checks_to_categories))
+
+    cells = []
+    if frames:
+        df = pd.concat(frames, ignore_index=True)
+        df[DIMENSIONS] = df[DIMENSIONS].fillna('').astype(str)
+        grouped = df.groupby(DIMENSIONS, sort=True)['count'].sum().reset_index()
+        cells = [list(row[:-1]) + [int(row[-1])] for row in grouped[grouped['count'] > 0].itertuples(index=False)]
+
+    summaries = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        for tool, summarize in [('Prowler', analyze.summarize_prowler), ('ScoutSuite', analyze.summarize_scoutsuite), ('CloudSploit', analyze.summarize_cloudsploit)]:
+            summary = summarize(output_path, provider, print_summary=False, use_cube=False)
+            if summary:
+                summaries[tool] = summary
+
+    return {
+        'version': CUBE_VERSION,
+        'provider': provider,
+        'dimensions': DIMENSIONS,
+        'cells': cells,
+        'summaries': summaries,
+        'sources': _source_signature(output_path),
+    }
+
+
+def get_cube(output_path, provider, build=True):
+    '''
+    Returns the cube of a run folder, loading it from the cube file if it is still up to date with the tool output.
+
+    Args:
+        output_path (str): The path to the run folder.
+        provider (str): The cloud provider name.
+        build (bool, optional): Whether to build and save the cube if there is no up to date cube. Defaults to True.
+
+    Returns:
+        dict: The cube, or None if there is no up to date cube and build is False.
+    '''
+    path = os.path.abspath(cube_path(output_path, provider))
+    signature = _source_signature(output_path)
+    if not signature:
+        return None
+
+    cube = _cube_cache.get(path)
+    if cube is None and os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                cube = json.load(f)
+        except (OSError, ValueError):
+            cube = None
+    if cube is not None and cube.get('version') == CUBE_VERSION and cube.get('sources') == signature:
+        _cube_cache[path] = cube
+        return cube
+    if not build:
+        return None
+
+    cube = build_cube(output_path, provider)
+    with open(path, 'w') as f:
+        json.dump(cube, f, default=lambda value: value.item())
+    _cube_cache[path] = cube
+    return cube
+
+
+def query(cube, group_by=(), **filters):
+    '''
+    Counts the checked items in the cube, grouped by some dimensions and filtered on others.
+
+    The cost depends on the number of distinct combinations in the cube, not on the number of findings.
+
+    Args:
+        cube (dict): The cube, as returned by get_cube().
+        group_by (list[str], optional): The dimensions to group by. Defaults to () (a single total).
+        **filters: Dimension values to filter on, e.g. tool='Prowler', status='FAIL'.
+
+    Returns:
+        dict: A dictionary mapping tuples of the group_by values to counts. Without group_by, the key is ().
+    '''
+    positions = {dimension: number for number, dimension in enumerate(cube['dimensions'])}
+    filter_positions = [(positions[dimension], value) for dimension, value in filters.items()]
+    group_positions = [positions[dimension] for dimension in group_by]
+    counts = {}
+    for cell in cube['cells']:
+        if all(cell[position] == value for position, value in filter_positions):
+            key = tuple(cell[position] for position in group_positions)
+            counts[key] = counts.get(key, 0) + cell[-1]
+    return counts
+
+
+def get_summary(output_path, provider, tool):
+    '''Returns the per-service summary of a tool from an up to date cube, or None if there is none.'''
+    cube = get_cube(output_path, provider, build=False)
+    if cube is None:
+        return None
+    return cube['summaries'].get(tool)
+
+
+def print_cube_table(cube, group_by, **filters):
+    '''Prints the counts of a cube query as a table, sorted by count.'''
+    counts = query(cube, group_by, **filters)
+    table = prettytable.PrettyTable(list(group_by) + ['Count'])
+    table.align = 'l'
+    for key, count in sorted(counts.items(), key=lambda item: item[1], reverse=True):
+        table.add_row(list(key) + [count])
+    print(table)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build and query the aggregate cube of an AutoCloudAudit output folder.')
+    parser.add_argument('folder', help='The output folder, e.g. output/aws-2024-01-01_12-00-00')
+    parser.add_argument('--provider', default=None, help='The cloud provider (default: taken from the folder name)')
+    parser.add_argument('--group-by', nargs='+', default=['tool', 'status'], choices=DIMENSIONS, help='Dimensions to group by')
+    parser.add_argument('--filter', nargs='+', default=[], metavar='DIMENSION=VALUE', help='Only count cells with these values')
+    args = parser.parse_args()
+
+    provider = args.provider or os.path.basename(os.path.normpath(args.folder)).split('-')[0]
+    cube = get_cube(args.folder, provider)
+    if cube is None:
+        print('No tool output found in the folder')
+    else:
+        print_cube_table(cube, args.group_by, **dict(value.split('=', 1) for value in args.filter))
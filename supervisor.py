@@ -0,0 +1,231 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import datetime
+import json
+import os
+import random
+import re
+import signal
+import subprocess
+import threading
+import time
+
+import scheduler
+
+# Output of the tools that indicates a transient failure, which is likely to succeed when retried later
+TRANSIENT_ERROR_PATTERNS = {
+    'throttling': re.compile(r'Throttling|Rate exceeded|TooManyRequests|Too Many Requests|RequestLimitExceeded|SlowDown|'
+                             r'[Ss]tatus ?[Cc]ode:? ?429|HTTP/?\S* 429'),
+    'expired session': re.compile(r'ExpiredToken|RequestExpired|[Tt]oken has expired|[Tt]oken is expired|ExpiredAuthenticationToken|'
+                                  r'AADSTS70043|AADSTS700082|AADSTS50173'),
+}
+
+# The number of characters of earlier output kept to find error messages that were split over two reads
+TAIL_LENGTH = 200
+
+# The processes started by start_process() that are still running
+_processes = set()
+_processes_lock = threading.Lock()
+
+# Set when the user interrupted the run, see interrupt_all()
+interrupt_event = threading.Event()
+
+
+class Watchdog:
+    '''
+    Stops a job that runs longer than its timeout, or that has not written any output for stall_timeout seconds.
+
+    The output of the job is passed to output(), which also counts the transient errors in it and reports them
+    to on_error as soon as they appear, e.g. to lower the concurrency on throttling. Use the watchdog as a context
+    manager around the job.
+    '''
+    def __init__(self, stop, timeout=None, stall_timeout=None, interval=1.0, on_error=None):
+        self.stop = stop
+        self.on_error = on_error
+        self.timeout = timeout
+        self.stall_timeout = stall_timeout
+        self.interval = interval
+        self.reason = None
+        self.errors = {}
+        self.started = self.last_output = time.monotonic()
+        self._tail = ''
+        self._finished = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+
+    def __enter__(self):
+        if self.timeout or self.stall_timeout:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._finished.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def output(self, text):
+        '''Registers output of the job, which resets the stall timer.'''
+        self.last_output = time.monotonic()
+        window = self._tail + text
+        for kind, pattern in TRANSIENT_ERROR_PATTERNS.items():
+            # Only count matches that end in the new text, the tail was searched before
+            count = sum(1 for match in pattern.finditer(window) if match.end() > len(self._tail))
+            if count:
+                self.errors[kind] = self.errors.get(kind, 0) + count
+                if self.on_error:
+                    self.on_error(kind)
+        self._tail = window[-TAIL_LENGTH:]
+
+    def _watch(self):
+        while not self._finished.wait(self.interval):
+            now = time.monotonic()
+            if self.timeout and now - self.started > self.timeout:
+                self.reason = 'timeout'
+            elif self.stall_timeout and now - self.last_output > self.stall_timeout:
+                self.reason = 'stalled'
+            else:
+                continue
+            self.stop()
+            return
+
+
+def start_process(command, directory, env=None):
+    '''
+    Starts a shell command in its own process group, with stdout and stderr combined in process.stdout.
+
+    The process group allows stopping the command together with all processes it started. The command runs in
+    env if given, e.g. with the virtualenv of a tool on the PATH, and in the current environment otherwise.
+    '''
+    process = subprocess.Popen(command, shell=True, cwd=directory, executable='/bin/bash', stdout=subprocess.PIPE,
+                               stderr=subprocess.STDOUT, start_new_session=True, env=env)
+    with _processes_lock:
+        _processes.add(process)
+    return process
+
+
+def finish_process(process):
+    '''Waits for a process started by start_process() and returns its exit code.'''
+    returncode = process.wait()
+    with _processes_lock:
+        _processes.discard(process)
+    return returncode
+
+
+def signal_process(process, sig):
+    '''Sends a signal to the process group of a process, ignoring processes that already exited.'''
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def stop_process(process, grace_period=10):
+    '''Stops a process group with SIGTERM, and kills it if it is still running after the grace period.'''
+    signal_process(process, signal.SIGTERM)
+    try:
+        process.wait(timeout=grace_period)
+    except subprocess.TimeoutExpired:
+        signal_process(process, signal.SIGKILL)
+
+
+def interrupt_all():
+    '''Forwards an interrupt of the user to all running processes, and stops pending retries.'''
+    interrupt_event.set()
+    with _processes_lock:
+        processes = list(_processes)
+    for process in processes:
+        signal_process(process, signal.SIGINT)
+
+
+def backoff_delay(attempt, base=30, maximum=600):
+    '''Returns the delay in seconds before retry number attempt, growing exponentially with random jitter.'''
+    return min(maximum, base * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+
+def wait_for_retry(delay):
+    '''Waits before a retry. Returns True if the run was interrupted in the meantime.'''
+    return interrupt_event.wait(delay)
+
+
+def retry_reason(outcome, can_refresh_credentials=False):
+    '''
+    Determines whether a finished attempt of a job should be retried.
+
+    Jobs are retried if their process stalled, or if they failed with throttling errors in their output. A job
+    whose session expired while it ran is only retried if a retry gets fresh credentials, e.g. those of a pooled
+    app registration. An expired AWS CLI profile or 'az login' session has to be renewed by the user, retrying
+    would fail again.
+
+    Args:
+        outcome (dict): The outcome of the attempt, with the keys 'status' and 'errors'.
+        can_refresh_credentials (bool, optional): Whether a retry gets fresh credentials. Defaults to False.
+
+    Returns:
+        str: The reason to retry, or None if the job should not be retried.
+    '''
+    if outcome['status'] == 'stalled':
+        return 'stalled process'
+    errors = dict(outcome['errors'])
+    if errors.pop('expired session', None):
+        return 'expired session' if can_refresh_credentials else None
+    if outcome['status'] == 'failed' and errors:
+        return ', '.join(sorted(errors))
+    return None
+
+
+class JobStates:
+    '''
+    Records the state of every job of a run in {output_dir}/job_states.json, so an unattended run can be followed
+    while it runs and reviewed afterwards.
+
+    The states are 'running', 'retrying', 'succeeded', 'failed', 'timeout', 'stalled', 'skipped' and 'interrupted',
+    and 'lost' for jobs of a distributed run whose workers stopped responding. Workers of a distributed run keep
+    the states in memory (save=False) and report them to the coordinator, which writes the file.
+    '''
+    def __init__(self, save=True):
+        self.save = save
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def update(self, job, state, **details):
+        '''Sets the state of a job, with optional details such as the attempt number or the error.'''
+        name = scheduler.job_name(job)
+        with self._lock:
+            entry = self.jobs.setdefault(job['output_dir'], {}).setdefault(name, {
+                'provider': job['provider'], 'tool': job['tool'], 'profile': job['profile'],
+            })
+            entry.update(details)
+            entry['state'] = state
+            entry['updated'] = datetime.datetime.now().isoformat(timespec='seconds')
+            if self.save:
+                self._save(job['output_dir'])
+
+    def get(self, job):
+        '''Returns a copy of the state entry of a job, or None if the job has no state yet.'''
+        with self._lock:
+            entry = self.jobs.get(job['output_dir'], {}).get(scheduler.job_name(job))
+            return dict(entry) if entry else None
+
+    def _save(self, output_dir):
+        path = os.path.join(output_dir, 'job_states.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.jobs[output_dir], f, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def counts(self, output_dir=None):
+        '''Returns the number of jobs per state, of all jobs or of the jobs of one output folder.'''
+        with self._lock:
+            counts = {}
+            for jobs_dir, jobs in self.jobs.items():
+                if output_dir is not None and jobs_dir != output_dir:
+                    continue
+                for entry in jobs.values():
+                    counts[entry['state']] = counts.get(entry['state'], 0) + 1
+            return counts
+
+    def unsuccessful(self):
+        '''Returns the names and entries of the jobs that did not succeed.'''
+        with self._lock:
+            return [(name, entry) for jobs in self.jobs.values() for name, entry in jobs.items() if entry['state'] != 'succeeded']
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import analyze
+
+
+def random_frame(seed, rows, columns):
+    # Few distinct values, so there are many duplicate rows within and across frames
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({column: rng.integers(0, 4, rows).astype(str) for column in columns})
+
+
+def expected_rows(frames, columns):
+    combined = pd.concat([frame.reindex(columns=columns, fill_value='') for frame in frames], ignore_index=True)
+    return combined.drop_duplicates().reset_index(drop=True)
+
+
+@pytest.mark.parametrize('memory_budget', [64 << 20, 8 * 10])
+def test_deduplicator_matches_drop_duplicates(tmp_path, memory_budget):
+    frame = random_frame(0, 2000, ['a', 'b', 'c', 'd'])
+    deduplicator = analyze.RowDeduplicator(str(tmp_path), memory_budget)
+    kept = pd.concat([chunk[deduplicator.new_rows(chunk)] for chunk in (frame.iloc[start:start + 117] for start in range(0, len(frame), 117))])
+    pd.testing.assert_frame_equal(kept.reset_index(drop=True), frame.drop_duplicates().reset_index(drop=True))
+    # A budget of 10 hashes spills the seen hashes to disk
+    assert bool(deduplicator.spilled) == (memory_budget < 1000 * 8)
+
+
+@pytest.mark.parametrize('chunk_size,memory_budget', [(100000, 64 << 20), (37, 8 * 25)])
+def test_combine_matches_drop_duplicates(tmp_path, chunk_size, memory_budget):
+    frames = [random_frame(1, 500, ['a', 'b', 'c']), random_frame(2, 300, ['b', 'c', 'd']), random_frame(3, 400, ['a', 'b', 'c'])]
+    paths = []
+    for index, frame in enumerate(frames):
+        path = tmp_path / 'input' / f'{index}.csv'
+        path.parent.mkdir(exist_ok=True)
+        frame.to_csv(path, sep=';', index=False)
+        paths.append(str(path))
+    # Empty files are skipped
+    (tmp_path / 'input' / 'empty.csv').write_text('')
+    paths.append(str(tmp_path / 'input' / 'empty.csv'))
+
+    analyze.combine_and_save_csv_files({'tool/findings.csv': paths}, str(tmp_path / 'combined'), ';', chunk_size, memory_budget)
+
+    combined = pd.read_csv(tmp_path / 'combined' / 'tool' / 'findings.csv', delimiter=';', dtype=str, keep_default_na=False)
+    pd.testing.assert_frame_equal(combined, expected_rows(frames, ['a', 'b', 'c', 'd']))
+
+
+def test_combine_keeps_values_as_text(tmp_path):
+    path = tmp_path / 'input.csv'
+    path.write_text('id,value\n007,NA\n007,NA\n1.50,\n')
+    analyze.combine_and_save_csv_files({'out.csv': [str(path)]}, str(tmp_path / 'combined'), ',')
+    assert (tmp_path / 'combined' / 'out.csv').read_text() == 'id,value\n007,NA\n1.50,\n'
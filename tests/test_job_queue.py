@@ -0,0 +1,109 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from job_queue import JobQueueError, JobQueueServer, SocketJobQueue, SQLiteJobQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / 'queue.db'), lease_seconds=0.1, max_attempts=2)
+
+
+def expire(queue):
+    time.sleep(queue.lease_seconds + 0.05)
+    return queue.requeue_expired()
+
+
+def states(queue, run):
+    return [job['state'] for job in queue.status(run)]
+
+
+def test_claim_and_complete(queue):
+    ids = queue.enqueue('run', [{'tool': 'a'}, {'tool': 'b'}])
+    assert queue.claim('w1') == (ids[0], {'tool': 'a'})
+    assert queue.complete(ids[0], 'w1', {'returncode': 0})
+    assert states(queue, 'run') == ['done', 'queued']
+    assert queue.status('run')[0]['result'] == {'returncode': 0}
+
+
+def test_expired_lease_is_requeued_for_another_worker(queue):
+    [job_id] = queue.enqueue('run', [{'tool': 'a'}])
+    queue.claim('w1')
+    assert expire(queue) == 1
+    assert states(queue, 'run') == ['queued']
+
+    assert queue.claim('w2')[0] == job_id
+    # The first worker lost its lease and can't touch the job anymore
+    assert not queue.heartbeat(job_id, 'w1')
+    assert not queue.complete(job_id, 'w1', {})
+    assert queue.complete(job_id, 'w2', {})
+
+
+def test_heartbeat_extends_lease(queue):
+    [job_id] = queue.enqueue('run', [{'tool': 'a'}])
+    queue.claim('w1')
+    for _ in range(3):
+        time.sleep(queue.lease_seconds / 2)
+        assert queue.heartbeat(job_id, 'w1')
+    assert queue.requeue_expired() == 0
+    assert states(queue, 'run') == ['leased']
+
+
+def test_job_lost_after_max_attempts(queue):
+    queue.enqueue('run', [{'tool': 'a'}])
+    queue.claim('w1')
+    expire(queue)
+    queue.claim('w2')
+    assert expire(queue) == 1
+    assert states(queue, 'run') == ['lost']
+    assert queue.status('run')[0]['attempts'] == 2
+    assert queue.claim('w3') is None
+
+
+def test_release_and_cancel(queue):
+    ids = queue.enqueue('run', [{'tool': 'a'}, {'tool': 'b'}])
+    queue.claim('w1')
+    assert queue.release(ids[0], 'w1')
+    assert not queue.release(ids[0], 'w1')
+    assert queue.cancel('run') == 2
+    assert states(queue, 'run') == ['cancelled', 'cancelled']
+    assert queue.claim('w1') is None
+
+
+@pytest.fixture
+def server(queue):
+    server = JobQueueServer(('127.0.0.1', 0), queue, token='secret')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_socket_queue_with_token(server):
+    [job_id] = server.queue.enqueue('run', [{'tool': 'a'}])
+    worker_queue = SocketJobQueue(*server.server_address, token='secret', timeout=5)
+    assert worker_queue.claim('w1') == (job_id, {'tool': 'a'})
+    assert worker_queue.heartbeat(job_id, 'w1')
+    assert worker_queue.complete(job_id, 'w1', {'returncode': 0})
+    assert states(server.queue, 'run') == ['done']
+
+
+@pytest.mark.parametrize('token', ['', 'wrong', 'secret2'])
+def test_socket_queue_refuses_wrong_token(server, token):
+    server.queue.enqueue('run', [{'tool': 'a'}])
+    with pytest.raises(JobQueueError, match='invalid token'):
+        SocketJobQueue(*server.server_address, token=token, timeout=5).claim('w1')
+    assert states(server.queue, 'run') == ['queued']
+
+
+def test_socket_queue_refuses_other_methods(server):
+    server.queue.enqueue('run', [{'tool': 'a'}])
+    with socket.create_connection(server.server_address, timeout=5) as connection:
+        connection.sendall((json.dumps({'token': 'secret', 'method': 'cancel', 'args': ['run']}) + '\n').encode())
+        response = json.loads(connection.makefile('rb').readline())
+    assert 'error' in response
+    assert states(server.queue, 'run') == ['queued']
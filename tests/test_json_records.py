@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+import analyze
+
+RECORDS = [
+    {'id': 1, 'message': 'first, with [brackets] and {braces}', 'nested': {'values': [1, 2, 3]}},
+    {'id': 22, 'message': 'ünïcödé ☃', 'empty': {}},
+    {'id': 333, 'message': 'escaped \\"quote\\" and newline\\n', 'flag': True, 'none': None},
+    12345,
+    'a string record',
+]
+
+
+def write(tmp_path, text, encoding='utf-8'):
+    path = tmp_path / 'records.json'
+    path.write_text(text, encoding=encoding)
+    return str(path)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 16, 1 << 20])
+def test_array_split_across_chunks(tmp_path, chunk_size):
+    path = write(tmp_path, json.dumps(RECORDS, indent=4))
+    assert list(analyze.iter_json_records(path, chunk_size)) == RECORDS
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 16, 1 << 20])
+def test_ndjson_split_across_chunks(tmp_path, chunk_size):
+    path = write(tmp_path, '\n'.join(json.dumps(record) for record in RECORDS) + '\n')
+    assert list(analyze.iter_json_records(path, chunk_size)) == RECORDS
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 1 << 20])
+def test_single_object(tmp_path, chunk_size):
+    path = write(tmp_path, json.dumps(RECORDS[0]))
+    assert list(analyze.iter_json_records(path, chunk_size)) == [RECORDS[0]]
+
+
+@pytest.mark.parametrize('text', ['', '[]', ' [ ] ', '\n\n'])
+def test_empty_files(tmp_path, text):
+    assert list(analyze.iter_json_records(write(tmp_path, text), 1)) == []
+
+
+def test_byte_order_mark(tmp_path):
+    path = write(tmp_path, json.dumps(RECORDS), encoding='utf-8-sig')
+    assert list(analyze.iter_json_records(path, 4)) == RECORDS
+
+
+def test_truncated_file_raises(tmp_path):
+    path = write(tmp_path, json.dumps(RECORDS)[:-10])
+    with pytest.raises(json.JSONDecodeError):
+        list(analyze.iter_json_records(path, 8))
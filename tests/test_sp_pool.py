@@ -0,0 +1,93 @@
+import datetime
+import json
+
+import pytest
+
+import azure_rest
+import azure_rest_mock
+import sp_pool
+
+SUBSCRIPTION = '00000000-0000-0000-0000-000000000001'
+OTHER_SUBSCRIPTION = '00000000-0000-0000-0000-000000000002'
+TENANT = 'tenant'
+
+
+@pytest.fixture
+def mock_azure(tmp_path, monkeypatch):
+    server, url = azure_rest_mock.start_mock_server()
+    monkeypatch.setattr(azure_rest, 'GRAPH_URL', f'{url}/v1.0')
+    monkeypatch.setattr(azure_rest, 'ARM_URL', url)
+    monkeypatch.setenv('AUTOCLOUDAUDIT_AZURE_TOKEN', 'mock')
+    monkeypatch.setattr(sp_pool, 'POOL_FILE', str(tmp_path / 'pool' / 'sp_pool.json'))
+    yield server.state
+    server.shutdown()
+    server.server_close()
+
+
+def role_assignments(state, subscription_id, spid):
+    return [assignment for assignment in state['role_assignments'].values()
+            if assignment['id'].startswith(f'/subscriptions/{subscription_id}/') and assignment['properties']['principalId'] == spid]
+
+
+def test_checkout_creates_principal_with_roles(mock_azure):
+    principal, lease_id = sp_pool.checkout_principal(SUBSCRIPTION, TENANT, propagation_wait=0)
+    assert principal['clientsecret']
+    assert [app['appId'] for app in mock_azure['applications'].values()] == [principal['clientid']]
+    assert len(role_assignments(mock_azure, SUBSCRIPTION, principal['spid'])) == len(sp_pool.REQUIRED_ROLES)
+    assert [pooled['active_leases'] for pooled in sp_pool.list_principals()] == [1]
+
+
+def test_checkout_reuses_pooled_principal(mock_azure):
+    first, first_lease = sp_pool.checkout_principal(SUBSCRIPTION, TENANT, propagation_wait=0)
+    second, second_lease = sp_pool.checkout_principal([SUBSCRIPTION, OTHER_SUBSCRIPTION], TENANT, propagation_wait=0)
+    assert second['clientid'] == first['clientid']
+    assert second_lease != first_lease
+    assert len(mock_azure['applications']) == 1
+    # Only the new subscription gets role assignments
+    assert len(role_assignments(mock_azure, SUBSCRIPTION, first['spid'])) == len(sp_pool.REQUIRED_ROLES)
+    assert len(role_assignments(mock_azure, OTHER_SUBSCRIPTION, first['spid'])) == len(sp_pool.REQUIRED_ROLES)
+    [pooled] = sp_pool.list_principals()
+    assert sorted(pooled['subscriptions']) == sorted([SUBSCRIPTION, OTHER_SUBSCRIPTION])
+    assert pooled['active_leases'] == 2
+
+
+def test_other_tenant_gets_own_principal(mock_azure):
+    first, _ = sp_pool.checkout_principal(SUBSCRIPTION, TENANT, propagation_wait=0)
+    second, _ = sp_pool.checkout_principal(SUBSCRIPTION, 'other tenant', propagation_wait=0)
+    assert second['clientid'] != first['clientid']
+    assert len(mock_azure['applications']) == 2
+
+
+def test_return_principal_releases_lease(mock_azure):
+    principal, lease_id = sp_pool.checkout_principal(SUBSCRIPTION, TENANT, propagation_wait=0)
+    sp_pool.return_principal(principal['clientid'], lease_id)
+    assert [pooled['active_leases'] for pooled in sp_pool.list_principals()] == [0]
+    # A returned principal that is still valid is kept for the next audit
+    assert sp_pool.cleanup_expired_principals() == []
+    assert sp_pool.checkout_principal(SUBSCRIPTION, TENANT, propagation_wait=0)[0]['clientid'] == principal['clientid']
+
+
+def test_forced_cleanup_skips_leased_principals(mock_azure):
+    principal, lease_id = sp_pool.checkout_principal(SUBSCRIPTION, TENANT, propagation_wait=0)
+    assert sp_pool.cleanup_expired_principals(force=True) == []
+    assert len(mock_azure['applications']) == 1
+
+    sp_pool.return_principal(principal['clientid'], lease_id)
+    assert sp_pool.cleanup_expired_principals(force=True) == [principal['clientid']]
+    assert mock_azure['applications'] == {}
+    assert mock_azure['role_assignments'] == {}
+    assert sp_pool.list_principals() == []
+
+
+def test_cleanup_deletes_expired_secrets(mock_azure):
+    principal, _ = sp_pool.checkout_principal(SUBSCRIPTION, TENANT, propagation_wait=0)
+    with open(sp_pool.POOL_FILE) as f:
+        pool = json.load(f)
+    pool['principals'][0]['secret_expiry'] = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+    with open(sp_pool.POOL_FILE, 'w') as f:
+        json.dump(pool, f)
+
+    # An expired secret is useless for the running lease too
+    assert sp_pool.cleanup_expired_principals() == [principal['clientid']]
+    assert mock_azure['applications'] == {}
+    assert sp_pool.list_principals() == []
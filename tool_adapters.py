@@ -0,0 +1,273 @@
+# Copyright (c) 2024 Guido Borst
+#
+# This software is released under the MIT License.
+# https://opensource.org/licenses/MIT
+
+import contextlib
+import os
+import shlex
+
+import analyze
+import authenticate
+import output_index
+
+# The registered tools, keyed by name in the order they are offered to the user
+_adapters = {}
+
+
+class ToolAdapter:
+    '''
+    Describes an audit tool: how to run it, where it writes its output and how that output is analyzed.
+
+    A tool is added by subclassing ToolAdapter, setting the class attributes and implementing commands() (or
+    parameters() for PowerShell tools), and registering it with register(). The job runner, the scheduler and
+    the post-run analysis only use the adapters, so a new tool doesn't require changes to them.
+    '''
+    name = None
+    providers = ['aws', 'azure']
+    # The folder of the tool in tools/, the commands run in it
+    directory = None
+    # The virtualenv of a Python tool, relative to its folder. Its bin folder is put first on the PATH.
+    venv = None
+    # 'shell' runs the commands in bash, 'powershell' runs command in a warm PowerShell host with module imported
+    runner = 'shell'
+    # The folder in the profile folder the tool writes to, and the output_index artifacts it writes there
+    output_folder = None
+    artifacts = []
+    # The analyze function that prints a summary of the tool's output. The issues are categorized by
+    # the analyzer in analyze.TOOL_ANALYZERS.
+    summarize = None
+    # Whether the tool needs the credentials of the profile, and whether Azure jobs also need an audit app
+    # registration from the pool. The runner passes them to prepare() or parameters().
+    uses_credentials = False
+    uses_temp_app = False
+    # The maximum run time in minutes, and whether the tool may run for a long time without output
+    timeout = 240
+    stall_timeout_exempt = False
+    # The expected resource use of one job: CPU cores, memory in MB, and the API load relative to a Prowler scan.
+    # The tools mostly wait for the cloud APIs, so a job uses well below a core on average.
+    cpu = 0.5
+    memory_mb = 1024
+    api_cost = 1.0
+
+    def tool_dir(self):
+        '''Returns the absolute path of the tool's folder.'''
+        return os.path.abspath(os.path.join(os.getcwd(), 'tools', self.directory))
+
+    def environment(self):
+        '''
+        Returns the environment to run the tool in, or None for the environment of AutoCloudAudit.
+
+        Python tools run with the bin folder of their virtualenv first on the PATH, which is what activating
+        it does, without sourcing the activate script in every job.
+        '''
+        if not self.venv:
+            return None
+        venv_dir = os.path.join(self.tool_dir(), self.venv)
+        env = dict(os.environ)
+        env.pop('PYTHONHOME', None)
+        env['VIRTUAL_ENV'] = venv_dir
+        env['PATH'] = os.path.join(venv_dir, 'bin') + os.pathsep + env.get('PATH', '')
+        return env
+
+    def output_path(self, job):
+        '''Returns the folder the tool writes the output of a job to. Quote it with shlex.quote() in commands.'''
+        return f"{job['output_dir']}/{job['profile']}/{self.output_folder}"
+
+    def resources(self):
+        '''Returns the expected resource use of one job, used by the scheduler to pack jobs onto the machine.'''
+        return {'cpu': self.cpu, 'memory_mb': self.memory_mb, 'api_cost': self.api_cost}
+
+    def prepare(self, job, credentials=None):
+        '''
+        Prepares a job, e.g. by writing a configuration file, and cleans up when the job is done.
+
+        Returns:
+            A context manager that yields a dictionary of values for commands().
+        '''
+        return contextlib.nullcontext({})
+
+    def commands(self, job, context):
+        '''
+        Builds the shell commands of a job. Profile names and paths must be quoted with shlex.quote(), Azure
+        profiles are named like 'Subscription name (subscription-id)'.
+
+        Args:
+            job (dict): The job, with the keys provider, authmethod, profile and output_dir.
+            context (dict): The values prepared by prepare().
+
+        Returns:
+            list[str]: The commands, or None if the authentication method of the job is not supported.
+        '''
+        raise NotImplementedError
+
+    def parameters(self, job, credentials, temp_app_details, global_settings):
+        '''Builds the parameters of command for PowerShell tools, or returns None if the job is not supported.'''
+        raise NotImplementedError
+
+    def find_artifacts(self, job):
+        '''Returns the artifact files the tool wrote for a job.'''
+        # Built without the cache, jobs of other threads are writing to the same run folder
+        index = output_index.build_output_index(os.path.join(job['output_dir'], job['profile']))
+        return sorted(path for (_, tool, artifact), paths in index.items()
+                      if tool == self.output_folder and artifact in self.artifacts for path in paths)
+
+
+class ProwlerAdapter(ToolAdapter):
+    name = 'Prowler'
+    directory = 'prowler'
+    venv = 'venv_prowler'
+    output_folder = 'prowler'
+    artifacts = ['csv', 'ocsf']
+    summarize = staticmethod(analyze.summarize_prowler)
+    timeout = 360
+    cpu = 0.5
+    memory_mb = 1536
+
+    def commands(self, job, context):
+        provider, output_path = job['provider'], self.output_path(job)
+        if provider == 'aws':
+            auth = f"-p {shlex.quote(job['profile'])} " if job['authmethod'] == 'cli' else ''
+            cmd = f'prowler aws {auth}-o {shlex.quote(output_path)} --ignore-exit-code-3'
+        else:
+            # Without --subscription-ids, Prowler scans every subscription the Azure CLI can see
+            auth = f'--az-cli-auth --subscription-ids {shlex.quote(azure_subscription_id(job))} ' if job['authmethod'] == 'cli' else ''
+            cmd = f'prowler azure {auth}-o {shlex.quote(output_path)} --ignore-exit-code-3'
+        return [cmd, f"ln -sfn {shlex.quote(output_path + '/')} {shlex.quote(output_path + '/output')}"]
+
+
+class ScoutSuiteAdapter(ToolAdapter):
+    name = 'ScoutSuite'
+    directory = 'scoutsuite'
+    venv = 'venv_scoutsuite'
+    output_folder = 'scoutsuite'
+    artifacts = ['results']
+    summarize = staticmethod(analyze.summarize_scoutsuite)
+    cpu = 0.5
+    memory_mb = 2048
+
+    def commands(self, job, context):
+        if job['provider'] == 'aws':
+            auth = f"-p {shlex.quote(job['profile'])} " if job['authmethod'] == 'cli' else ''
+        else:
+            # Without --subscriptions, ScoutSuite scans the default subscription of the Azure CLI
+            auth = f'--cli --subscriptions {shlex.quote(azure_subscription_id(job))} ' if job['authmethod'] == 'cli' else ''
+        return [f"scout {job['provider']} {auth}--report-dir {shlex.quote(self.output_path(job))}"]
+
+
+class CloudFoxAdapter(ToolAdapter):
+    name = 'CloudFox'
+    directory = 'cloudfox'
+    output_folder = 'cloudfox'
+    artifacts = ['csv']
+    summarize = staticmethod(analyze.summarize_cloudfox)
+    cpu = 0.25
+    memory_mb = 512
+    api_cost = 0.5
+
+    # The CloudFox commands that are run for Azure
+    AZURE_COMMANDS = ['inventory', 'rbac', 'storage', 'vms', 'whoami']
+
+    def commands(self, job, context):
+        output_path = shlex.quote(self.output_path(job))
+        if job['provider'] == 'aws':
+            auth = f"-p {shlex.quote(job['profile'])} " if job['authmethod'] == 'cli' else ''
+            return [f'./cloudfox aws {auth}--outdir {output_path} all-checks']
+        if job['authmethod'] != 'cli':
+            return [f"./cloudfox azure --outdir {output_path} {' '.join(self.AZURE_COMMANDS)}"]
+        tenant_id = shlex.quote(authenticate.get_azure_credentials(job['profile']).get('directory_id'))
+        return [f'./cloudfox azure --outdir {output_path} {command} -t {tenant_id}' for command in self.AZURE_COMMANDS]
+
+
+class CloudSploitAdapter(ToolAdapter):
+    name = 'CloudSploit'
+    directory = 'cloudsploit'
+    output_folder = 'cloudsploit'
+    artifacts = ['csv']
+    summarize = staticmethod(analyze.summarize_cloudsploit)
+    uses_credentials = True
+    uses_temp_app = True
+    # CloudSploit only writes its output when all plugins have finished
+    stall_timeout_exempt = True
+    cpu = 0.25
+    memory_mb = 1024
+
+    def prepare(self, job, credentials=None):
+        if credentials is None:
+            return contextlib.nullcontext({})
+        # Every job gets its own credential files, which are removed when it's done
+        return _config_context(authenticate.private_cloudsploit_config(job['provider'], credentials, self.tool_dir()))
+
+    def commands(self, job, context):
+        if job['authmethod'] != 'cli' or 'config_file' not in context:
+            return None
+        output_path = self.output_path(job)
+        return [f"mkdir -p {shlex.quote(output_path + '/')}",
+                f"/usr/bin/env node index.js --config {shlex.quote(context['config_file'])} "
+                f"--csv {shlex.quote(output_path + '/cloudsploit-output.csv')} --json {shlex.quote(output_path + '/cloudsploit-output.json')} "
+                f"--console none --cloud {job['provider']}"]
+
+
+class Monkey365Adapter(ToolAdapter):
+    name = 'Monkey365'
+    providers = ['azure']
+    directory = 'monkey365'
+    runner = 'powershell'
+    output_folder = 'monkey365'
+    artifacts = ['json']
+    summarize = staticmethod(analyze.summarize_monkey365)
+    uses_credentials = True
+    uses_temp_app = True
+    timeout = 360
+    cpu = 0.5
+    memory_mb = 1536
+
+    # The module and command the PowerShell host runs, and the parameters that are passed as SecureString
+    module = './monkey365.psm1'
+    command = 'Invoke-Monkey365'
+    secure = ['ClientSecret']
+
+    def parameters(self, job, credentials, temp_app_details, global_settings):
+        if job['authmethod'] != 'cli' or credentials is None:
+            return None
+        return {
+            'ClientId': temp_app_details['clientid'],
+            'ClientSecret': temp_app_details['clientsecret'],
+            'Instance': 'Azure',
+            'Analysis': 'All',
+            'subscriptions': credentials.get('subscription_id'),
+            'TenantID': credentials.get('directory_id'),
+            'ExportTo': global_settings.get('monkey365_formats', analyze.MONKEY365_EXPORT_FORMATS),
+            'OutDir': f'{self.output_path(job)}/',
+        }
+
+
+def azure_subscription_id(job):
+    '''Returns the ID of the subscription of an Azure job, from the Azure CLI profile it runs for.'''
+    return (authenticate.get_azure_credentials(job['profile']) or {}).get('subscription_id', '')
+
+
+@contextlib.contextmanager
+def _config_context(config_files):
+    with config_files as config_file:
+        yield {'config_file': config_file}
+
+
+def register(adapter):
+    '''Adds a tool adapter to the registry, replacing a registered tool with the same name.'''
+    _adapters[adapter.name] = adapter
+    return adapter
+
+
+def get_adapter(name):
+    '''Returns the adapter of a tool, or None if no tool with that name is registered.'''
+    return _adapters.get(name)
+
+
+def tool_names(provider=None):
+    '''Returns the names of the registered tools, optionally only those that support a provider.'''
+    return [name for name, adapter in _adapters.items() if provider is None or provider in adapter.providers]
+
+
+for _adapter in [ProwlerAdapter(), ScoutSuiteAdapter(), CloudFoxAdapter(), CloudSploitAdapter(), Monkey365Adapter()]:
+    register(_adapter)